@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from itertools import groupby
+
+from telethon.errors import FloodWaitError
+
+from database_manager import DatabaseManager
+from metrics import ALERT_SEND_SECONDS, Gauge
+from rate_limit import TokenBucket
+
+ALERT_OUTBOX_PENDING = Gauge(
+    "kz_alert_outbox_pending", "Alerts due in the outbox at the last drain (capped by batch)"
+)
+
+
+class AlertSender:
+    """
+    Разбирает таблицу alert_outbox и отправляет алерты в ALERT_CHAT.
+
+    - скорость ограничена token bucket'ом (rate сообщений/сек, burst)
+    - несколько алертов по одному каналу в пределах окна склеиваются в дайджест
+    - FloodWait не теряет алерт: ждём и пробуем снова
+    """
+
+    def __init__(
+        self,
+        client,
+        db_manager: DatabaseManager,
+        alert_chat: str,
+        rate: float = 0.5,
+        burst: int = 3,
+        coalesce_window: float = 30.0,
+        digest_max_items: int = 15,
+        poll_interval: float = 2.0,
+        max_attempts: int = 10,
+        rpc=None,
+    ):
+        self.client = client
+        # Если шлём через аккаунт – идём через его RpcScheduler
+        self.rpc = rpc
+        self.db = db_manager
+        self.alert_chat = alert_chat
+
+        self.bucket = TokenBucket(rate, burst)
+        self.coalesce_window = coalesce_window
+        self.digest_max_items = digest_max_items
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+
+        self.sent_messages = 0
+        self.sent_alerts = 0
+
+        logging.info("✅ Alert Sender initialized")
+
+    # ======================================================
+    #   ОСНОВНОЙ ЦИКЛ
+    # ======================================================
+
+    async def run(self):
+        while True:
+            try:
+                sent = await self.drain_once()
+                if not sent:
+                    await asyncio.sleep(self.poll_interval)
+            except Exception as e:
+                logging.error(f"Alert sender error: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def drain_once(self) -> int:
+        """Один проход по outbox. Возвращает число отправленных сообщений."""
+        pending = self.db.get_pending_alerts()
+        ALERT_OUTBOX_PENDING.set(len(pending))
+        if not pending:
+            return 0
+
+        now = time.time()
+        sent = 0
+
+        # группируем по каналу, сохраняя порядок появления
+        pending.sort(key=lambda a: (a["channel_key"] or "", a["id"]))
+        groups = [
+            list(items)
+            for _, items in groupby(pending, key=lambda a: a["channel_key"] or "")
+        ]
+        groups.sort(key=lambda items: items[0]["id"])
+
+        for items in groups:
+            # Ждём окно склейки от первого алерта группы – вдруг придут ещё
+            if now - items[0]["created_ts"] < self.coalesce_window:
+                continue
+
+            items = items[: self.digest_max_items]
+            text = self._render(items)
+            ids = [a["id"] for a in items]
+
+            await self.bucket.acquire()
+            started = time.perf_counter()
+
+            try:
+                if self.rpc is not None:
+                    await self.rpc.call(
+                        self.client.send_message,
+                        self.alert_chat,
+                        text,
+                        parse_mode="markdown",
+                        priority="live",
+                    )
+                else:
+                    await self.client.send_message(
+                        self.alert_chat,
+                        text,
+                        parse_mode="markdown",
+                    )
+            except FloodWaitError as e:
+                ALERT_SEND_SECONDS.observe(time.perf_counter() - started, "flood_wait")
+                logging.warning(
+                    f"⏳ Alert FloodWait {e.seconds}s, {len(ids)} alerts postponed"
+                )
+                self.db.reschedule_alerts(ids, e.seconds, error=f"FloodWait {e.seconds}s")
+                await asyncio.sleep(e.seconds)
+                return sent
+            except Exception as e:
+                ALERT_SEND_SECONDS.observe(time.perf_counter() - started, "error")
+                attempts = max(a["attempts"] for a in items) + 1
+                delay = min(30 * 2 ** (attempts - 1), 3600)
+                logging.error(f"Error sending alert (retry in {delay}s): {e}")
+                self.db.reschedule_alerts(
+                    ids, delay, error=str(e), max_attempts=self.max_attempts
+                )
+                continue
+
+            ALERT_SEND_SECONDS.observe(time.perf_counter() - started, "sent")
+            self.db.mark_alerts_sent(ids)
+            self.sent_messages += 1
+            self.sent_alerts += len(ids)
+            sent += 1
+
+        return sent
+
+    # ======================================================
+    #   ФОРМАТ
+    # ======================================================
+
+    def _render(self, items: list[dict]) -> str:
+        if len(items) == 1:
+            return items[0]["body"]
+
+        title = items[0]["channel_title"] or items[0]["channel_key"] or "Unknown"
+        lines = [
+            f"🚨 *Дайджест: {len(items)} подозрительных сообщений*\n",
+            f"*Канал/чат:* {title}\n",
+        ]
+        for a in items:
+            lines.append(f"• {a['preview']}")
+
+        return "\n".join(lines)
@@ -1,41 +1,87 @@
 import asyncio
 import logging
+import re
+
 from telethon.errors import RPCError
 
+# Кнопки «следующая страница» в инлайн-меню ботов: подпись целиком из
+# одной-двух таких меток («Далее ▶», «»»», «➡️»), а не просто содержит их –
+# иначе под «ещё» попадают «Ещё каналы», «Подписаться ещё» и т.п.
+_NEXT_PAGE_RE = re.compile(
+    r"^\s*(?:(?:→|➡|▶|»|>|next|далее|вперёд|вперед|ещё|еще)\ufe0f?\s*){1,2}$",
+    re.IGNORECASE,
+)
+_NEXT_PAGE_MAX_LEN = 16
+
 
 class BotSearcher:
     """
     Поиск каналов через ботов.
     Ищет ссылки типа t.me/xxxxx и проверяет их через TelegramMonitor.
+
+    Диалог с ботом идёт через client.conversation: ждём настоящий ответ
+    (с таймаутом), а не фиксированную паузу. Боты опрашиваются параллельно
+    (не больше concurrency одновременно), инлайн-пагинация пролистывается
+    до max_pages страниц, предложенные каналы проверяются параллельно.
     """
 
-    def __init__(self, client, db_manager, keyword_manager, telegram_monitor):
+    def __init__(
+        self,
+        client,
+        db_manager,
+        keyword_manager,
+        telegram_monitor,
+        reply_timeout: float = 15,
+        concurrency: int = 3,
+        max_pages: int = 5,
+        check_concurrency: int = 5,
+    ):
         self.client = client
         self.db = db_manager
         self.keywords = keyword_manager
         self.tm = telegram_monitor
+        self.rpc = telegram_monitor.rpc
 
         self.search_bots = [
             "BotFather",
             "like",
             "vkmusic_bot",
         ]
+        # что отправляем каждому боту
+        self.queries = ["/start"]
+
+        self.reply_timeout = reply_timeout
+        self.concurrency = concurrency
+        self.max_pages = max_pages
+        self.check_concurrency = check_concurrency
+
+        # каналы, уже проверенные в текущем проходе (разные боты советуют одно и то же)
+        self._checked: set[str] = set()
 
         logging.info("✅ Bot Searcher initialized")
 
     async def search_all_bots(self):
         logging.info("🤖 Starting bot search...")
+        self._checked = set()
+        semaphore = asyncio.Semaphore(self.concurrency)
 
-        for bot in self.search_bots:
-            try:
-                await self.query_bot(bot)
-                await asyncio.sleep(3)
-            except Exception:
-                pass
+        async def run(bot_username):
+            async with semaphore:
+                try:
+                    await self.query_bot(bot_username)
+                except Exception as e:
+                    logging.warning(f"🤖 Bot {bot_username} error: {e}")
+
+        # Темп запросов по-прежнему задаёт RpcScheduler (класс "bots")
+        await asyncio.gather(*(run(bot) for bot in self.search_bots))
+
+    # ======================================================
+    #   ДИАЛОГ С БОТОМ
+    # ======================================================
 
     async def query_bot(self, bot_username):
         try:
-            bot = await self.client.get_entity(bot_username)
+            bot = await self.rpc.call(self.client.get_entity, bot_username, priority="bots")
         except RPCError:
             return
         except Exception:
@@ -43,57 +89,140 @@ class BotSearcher:
 
         logging.info(f"🤖 Querying bot: {bot_username}")
 
+        replies = []
         try:
-            await self.client.send_message(bot, "/start")
-            await asyncio.sleep(2)
-        except Exception:
-            return
-
+            async with self.client.conversation(
+                bot,
+                timeout=self.reply_timeout,
+                total_timeout=self.reply_timeout * (len(self.queries) + self.max_pages + 2),
+                exclusive=False,
+            ) as conv:
+                for query in self.queries:
+                    await self.rpc.call(conv.send_message, query, priority="bots")
+                    replies.extend(await self._collect_replies(conv))
+
+                replies.extend(await self._follow_pages(conv, bot, replies))
+        except Exception as e:
+            logging.warning(f"🤖 Bot {bot_username} conversation error: {e}")
+
+        await self.analyze_bot_responses(replies, bot_username)
+
+    async def _collect_replies(self, conv) -> list:
+        """Первый ответ ждём reply_timeout, следом идущие – пока бот пишет."""
+        replies = []
         try:
-            messages = await self.client.get_messages(bot, limit=5)
-        except Exception:
-            return
+            replies.append(await conv.get_response())
+            while True:
+                replies.append(await conv.get_response(timeout=2))
+        except asyncio.TimeoutError:
+            pass
+        return replies
+
+    @staticmethod
+    def _next_page_button(message):
+        for row in getattr(message, "buttons", None) or []:
+            for button in row:
+                text = button.text or ""
+                if (
+                    getattr(button, "data", None)
+                    and len(text) <= _NEXT_PAGE_MAX_LEN
+                    and _NEXT_PAGE_RE.match(text)
+                ):
+                    return button
+        return None
+
+    async def _follow_pages(self, conv, bot, replies: list) -> list:
+        """Листаем инлайн-пагинацию: бот обычно редактирует сообщение, иногда шлёт новое."""
+        current = next((m for m in reversed(replies) if self._next_page_button(m)), None)
+        pages = []
+
+        while current is not None and len(pages) < self.max_pages:
+            button = self._next_page_button(current)
+            if button is None:
+                break
+
+            await self.rpc.call(button.click, priority="bots")
 
-        await self.analyze_bot_responses(messages, bot_username)
+            try:
+                page = await conv.get_edit()
+            except asyncio.TimeoutError:
+                newer = await self.rpc.call(
+                    self.client.get_messages,
+                    bot,
+                    limit=5,
+                    min_id=current.id,
+                    priority="bots",
+                )
+                page = newer[0] if newer else None
+
+            if page is None:
+                break
+            pages.append(page)
+            current = page
+
+        return pages
+
+    # ======================================================
+    #   ПРЕДЛОЖЕННЫЕ КАНАЛЫ
+    # ======================================================
+
+    def _suggested_usernames(self, messages) -> list[str]:
+        usernames = []
+        for msg in messages:
+            texts = [getattr(msg, "text", None) or ""]
+            # ссылки в URL-кнопках
+            for row in getattr(msg, "buttons", None) or []:
+                texts.extend(getattr(button, "url", None) or "" for button in row)
+
+            for text in texts:
+                for link in self.keywords.extract_links(text):
+                    username = (
+                        link.replace("https://", "")
+                        .replace("http://", "")
+                        .replace("t.me/", "")
+                        .strip()
+                    )
+                    if username and username.lower() not in self._checked:
+                        self._checked.add(username.lower())
+                        usernames.append(username)
+        return usernames
 
     async def analyze_bot_responses(self, messages, bot_name):
-        for msg in messages:
-            text = getattr(msg, "text", None)
-            if not text:
-                continue
+        usernames = self._suggested_usernames(messages)
+        if not usernames:
+            return
 
-            links = self.keywords.extract_links(text)
-            if not links:
-                continue
+        for username in usernames:
+            logging.info(f"🤖 Bot {bot_name} suggested channel: @{username}")
 
-            for link in links:
-                username = link.replace("https://", "").replace("http://", "").replace("t.me/", "").strip()
-                logging.info(f"🤖 Bot {bot_name} suggested channel: @{username}")
+        semaphore = asyncio.Semaphore(self.check_concurrency)
 
-                # Проверяем, что это реально канал
-                try:
-                    entity = await self.client.get_entity(username)
-                except Exception:
-                    continue
+        async def check(username):
+            async with semaphore:
+                await self.check_suggested_channel(username, bot_name)
 
-                # Читаем последние сообщения канала
-                try:
-                    msgs = await self.client.get_messages(entity, limit=10)
-                except Exception:
-                    continue
-
-                # Проверяем через TelegramMonitor
-                for m in msgs:
-                    txt = getattr(m, "text", None)
-                    if not txt:
-                        continue
-                    await self.tm._process_text_for_entity(entity, txt, f"bot_{bot_name}")
-
-    async def periodic_bot_search(self):
-        while True:
-            try:
-                await self.search_all_bots()
-                await asyncio.sleep(3600)
-            except Exception as e:
-                logging.error(f"Periodic bot search error: {e}")
-                await asyncio.sleep(300)
+        await asyncio.gather(*(check(username) for username in usernames))
+
+    async def check_suggested_channel(self, username, bot_name):
+        # Проверяем, что это реально канал
+        try:
+            entity = await self.rpc.call(self.client.get_entity, username, priority="bots")
+        except Exception:
+            return
+
+        # Читаем последние сообщения канала
+        try:
+            msgs = await self.rpc.call(
+                self.client.get_messages, entity, limit=10, priority="bots"
+            )
+        except Exception:
+            return
+
+        # Проверяем через TelegramMonitor
+        for m in msgs:
+            txt = getattr(m, "text", None)
+            if not txt:
+                continue
+            await self.tm._process_text_for_entity(
+                entity, txt, f"bot_{bot_name}", message=m
+            )
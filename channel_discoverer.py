@@ -1,6 +1,8 @@
-import asyncio
+import hashlib
 import logging
 
+from telethon.errors import RPCError
+
 from database_manager import DatabaseManager
 from keyword_manager import KeywordManager
 
@@ -11,6 +13,7 @@ class ChannelDiscoverer:
         self.db = db_manager
         self.keywords = keyword_manager
         self.tm = telegram_monitor
+        self.rpc = telegram_monitor.rpc
 
         logging.info("✅ Channel Discoverer initialized")
 
@@ -18,21 +21,66 @@ class ChannelDiscoverer:
     #   ОСНОВНОЙ ПОИСК КАНАЛОВ
     # ======================================================
 
+    @staticmethod
+    def dialog_fingerprint(dialog) -> tuple[str, int]:
+        """
+        (хеш названия/username, id верхнего сообщения) – всё есть в iter_dialogs.
+        Описания (about) у Channel из диалогов нет – оно только в GetFullChannel,
+        поэтому в отпечаток не входит.
+        """
+        entity = dialog.entity
+        meta = "\n".join(
+            str(getattr(entity, field, "") or "") for field in ("title", "username")
+        )
+        meta_hash = hashlib.blake2b(meta.encode(), digest_size=8).hexdigest()
+        top_id = dialog.message.id if dialog.message else 0
+        return meta_hash, top_id
+
     async def discover_channels(self):
+        """
+        Проход по всем диалогам аккаунта (без лимита – страницами по 100).
+        Дорогой анализ (get_entity + analyze_text) – только для новых диалогов
+        и тех, у кого поменялся отпечаток; остальные пропускаем бесплатно.
+        """
         logging.info("📡 Starting channel discovery...")
 
         found = 0
+        skipped = 0
+        unchanged = 0
+        analyzed = 0
+
+        fingerprints = self.db.get_dialog_fingerprints()
+        changed: list[tuple] = []
 
         try:
-            async for dialog in self.client.iter_dialogs(limit=100):
+            async for dialog in self.rpc.iterate(self.client.iter_dialogs, limit=None):
                 try:
                     # Берём только чаты / каналы
                     if not (dialog.is_channel or dialog.is_group):
                         continue
 
+                    # Общий чат анализирует только его владелец
+                    self.tm.dialogs[dialog.id] = dialog.entity
+                    self.tm.shards.add_chat(self.tm.name, dialog.id)
+                    if not self.tm.shards.owns(self.tm.name, dialog.id):
+                        skipped += 1
+                        continue
+
+                    fingerprint = self.dialog_fingerprint(dialog)
+                    if fingerprints.get(dialog.id) == fingerprint:
+                        unchanged += 1
+                        continue
+
                     entity = dialog.entity
 
                     channel_info = await self.analyze_channel(entity)
+                    analyzed += 1
+
+                    # отпечаток – только после успешного анализа, иначе повторим в след. раз
+                    changed.append((dialog.id, *fingerprint))
+                    if len(changed) >= 100:
+                        self.db.save_dialog_fingerprints(changed)
+                        changed = []
 
                     # 🔥 ВАЖНО: если анализа нет → пропустить
                     if channel_info is None:
@@ -49,7 +97,12 @@ class ChannelDiscoverer:
         except Exception as e:
             logging.error(f"Discovery error: {e}")
 
-        logging.info(f"🔍 Channel discovery done. Suspicious found: {found}")
+        self.db.save_dialog_fingerprints(changed)
+
+        logging.info(
+            f"🔍 Channel discovery done. Analyzed: {analyzed}, unchanged: {unchanged}, "
+            f"owned by other accounts: {skipped}, suspicious found: {found}"
+        )
         return found
 
     # ======================================================
@@ -58,7 +111,7 @@ class ChannelDiscoverer:
 
     async def analyze_channel(self, entity):
         try:
-            full = await self.client.get_entity(entity)
+            full = await self.rpc.call(self.client.get_entity, entity)
 
             channel_type = (
                 "channel"
@@ -94,18 +147,8 @@ class ChannelDiscoverer:
                 "channel_type": channel_type,
             }
 
+        except RPCError:
+            # ошибка запроса – discover_channels не запомнит отпечаток и повторит
+            raise
         except Exception:
             return None
-
-    # ======================================================
-    #   ПЕРИОДИЧЕСКИЙ ПОИСК
-    # ======================================================
-
-    async def periodic_discovery(self):
-        while True:
-            try:
-                await self.discover_channels()
-                await asyncio.sleep(7200)  # каждые 2 часа
-            except Exception as e:
-                logging.error(f"Periodic discovery error: {e}")
-                await asyncio.sleep(300)
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import math
+import random
+import time
+
+from rate_limit import TokenBucket
+
+
+class AdaptivePoller:
+    """
+    Периодическая дочитка чатов аккаунта с адаптивной частотой.
+
+    Для каждого чата, которым владеет аккаунт (ShardMap), храним темп
+    сообщений (EWMA, сообщений/сек) и риск (доля подозрительных, быстро
+    растёт и медленно остывает). Из них считаются время следующей
+    проверки и размер выборки:
+    - активные и рискованные чаты проверяем часто, тихие – редко
+    - за одну проверку ждём около target_messages новых сообщений
+    - все опросы процесса делят общий бюджет RPC (budget)
+    Живые сообщения по-прежнему приходят через NewMessage, опрос
+    подбирает то, что Telegram не доставил (большие каналы, простой).
+    """
+
+    def __init__(
+        self,
+        telegram_monitor,
+        budget: TokenBucket,
+        min_interval: float = 300,
+        max_interval: float = 86400,
+        default_interval: float = 3600,
+        target_messages: int = 50,
+        max_fetch: int = 500,
+    ):
+        self.tm = telegram_monitor
+        self.client = telegram_monitor.client
+        self.db = telegram_monitor.db
+        self.budget = budget
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+        self.target_messages = target_messages
+        self.max_fetch = max_fetch
+
+        # chat_id -> {"rate", "risk", "next_check_ts", "last_checked_ts"}
+        self._states: dict[int, dict] = {}
+
+        self.checks = 0
+        self.fetched = 0
+        self.suspicious = 0
+
+    # ======================================================
+    #   РАСПИСАНИЕ
+    # ======================================================
+
+    def next_interval(self, rate: float, risk: float) -> float:
+        if rate > 0:
+            interval = self.target_messages / rate
+        else:
+            interval = self.max_interval
+        # риск 1.0 – в 5 раз чаще
+        interval /= 1 + 4 * risk
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def fetch_limit(self, rate: float, elapsed: float) -> int:
+        expected = rate * elapsed * 1.5 + 10
+        return min(self.max_fetch, max(10, math.ceil(expected)))
+
+    def _update(self, state: dict, fetched: int, hits: int, limit: int, now: float):
+        elapsed = max(1.0, now - state["last_checked_ts"])
+        rate = fetched / elapsed
+        # упёрлись в лимит – реальный темп выше, чем видно
+        if fetched >= limit:
+            rate *= 2
+        state["rate"] = 0.5 * state["rate"] + 0.5 * rate
+
+        if fetched:
+            ratio = hits / fetched
+            state["risk"] = max(ratio, 0.7 * state["risk"] + 0.3 * ratio)
+
+        interval = self.next_interval(state["rate"], state["risk"])
+        state["last_checked_ts"] = now
+        # небольшой разброс, чтобы чаты не слипались в одну секунду
+        state["next_check_ts"] = now + interval * random.uniform(0.9, 1.1)
+
+    def _owned_states(self, now: float) -> list[tuple[int, dict]]:
+        owned = [
+            chat_id
+            for chat_id in self.tm.dialogs
+            if self.tm.shards.owns(self.tm.name, chat_id)
+        ]
+
+        missing = [chat_id for chat_id in owned if chat_id not in self._states]
+        if missing:
+            stored = self.db.get_poll_states(missing)
+            for chat_id in missing:
+                row = stored.get(chat_id)
+                if row:
+                    self._states[chat_id] = {
+                        "rate": row["msg_rate"] or 0.0,
+                        "risk": row["risk"] or 0.0,
+                        "next_check_ts": row["next_check_ts"],
+                        "last_checked_ts": row["last_checked_ts"] or now,
+                    }
+                else:
+                    # новый чат только что прошёл initial_scan – разносим первые проверки
+                    self._states[chat_id] = {
+                        "rate": 0.0,
+                        "risk": 0.0,
+                        "next_check_ts": now + random.uniform(0, self.default_interval),
+                        "last_checked_ts": now,
+                    }
+
+        return [(chat_id, self._states[chat_id]) for chat_id in owned]
+
+    # ======================================================
+    #   ОПРОС
+    # ======================================================
+
+    async def run(self):
+        logging.info(f"📈 [{self.tm.name}] Adaptive poller started")
+        while True:
+            try:
+                delay = await self.poll_once()
+            except Exception as e:
+                logging.error(f"Adaptive poller error: {e}")
+                delay = 60
+            await asyncio.sleep(delay)
+
+    async def poll_once(self) -> float:
+        """Проверяет все просроченные чаты. Возвращает, сколько спать до следующих."""
+        now = time.time()
+        states = self._owned_states(now)
+
+        due = [(chat_id, st) for chat_id, st in states if st["next_check_ts"] <= now]
+        # при нехватке бюджета первыми идут самые рискованные
+        due.sort(key=lambda item: (-item[1]["risk"], item[1]["next_check_ts"]))
+
+        for chat_id, state in due:
+            try:
+                await self._check(chat_id, state)
+            except Exception as e:
+                logging.error(f"Poll error (chat {chat_id}): {e}")
+                state["next_check_ts"] = time.time() + self.min_interval
+
+        upcoming = [st["next_check_ts"] for _, st in states]
+        if not upcoming:
+            return 60.0
+        return min(60.0, max(1.0, min(upcoming) - time.time()))
+
+    async def _check(self, chat_id: int, state: dict):
+        entity = self.tm.dialogs[chat_id]
+        now = time.time()
+        last_id = self.tm.marks.get(chat_id)
+        if last_id is None:
+            # отметки нет (чат из discovery, пустой initial_scan) – как
+            # initial_scan для нового чата: последние history_limit сообщений
+            await self._first_check(chat_id, entity, state)
+            return
+
+        limit = self.fetch_limit(state["rate"], now - state["last_checked_ts"])
+
+        # один запрос get_messages отдаёт до 100 сообщений.
+        # Читаем от отметки вверх (reverse): если новых больше limit, берём
+        # самые старые, и отметка доходит ровно до прочитанного – остальное
+        # заберёт следующая проверка, а не пропадёт между ними
+        await self.budget.acquire(math.ceil(limit / 100))
+        messages = await self.tm.rpc.call(
+            self.client.get_messages,
+            entity,
+            limit=limit,
+            min_id=last_id,
+            reverse=True,
+            priority="discovery",
+        )
+
+        fetched = len(messages or [])
+        hits = 0
+        max_seen = last_id
+
+        try:
+            for message in messages or []:
+                if not message:
+                    continue
+                if await self._process(chat_id, entity, message):
+                    hits += 1
+                # всё до этого сообщения включительно обработано
+                max_seen = max(max_seen, message.id)
+        finally:
+            self.tm.marks.advance(chat_id, max_seen, last_id)
+
+        now = time.time()
+        self._update(state, fetched, hits, limit, now)
+        if fetched >= limit:
+            # упёрлись в limit – за отметкой есть ещё, дочитываем сразу
+            state["next_check_ts"] = now
+        self.db.update_poll_state(
+            chat_id, state["rate"], state["risk"], state["next_check_ts"], now
+        )
+
+        self.checks += 1
+        self.fetched += fetched
+        self.suspicious += hits
+
+    async def _first_check(self, chat_id: int, entity, state: dict):
+        """Первая проверка чата без отметки: свежие сообщения, отметка – на верхнее."""
+        limit = self.tm.history_limit
+        await self.budget.acquire(math.ceil(limit / 100))
+        messages = await self.tm.rpc.call(
+            self.client.get_messages, entity, limit=limit, priority="discovery"
+        )
+        messages = [m for m in messages or [] if m]
+
+        hits = 0
+        for message in messages:
+            if await self._process(chat_id, entity, message):
+                hits += 1
+        # всё прочитанное обработано; без сообщений отметка – 0 (чат пуст)
+        top_id = max((m.id for m in messages), default=0)
+        self.tm.marks.advance(chat_id, top_id, 0)
+
+        # темп по истории не считаем – только риск и обычный интервал
+        now = time.time()
+        if messages:
+            state["risk"] = max(state["risk"], hits / len(messages))
+        state["last_checked_ts"] = now
+        interval = self.next_interval(state["rate"], state["risk"])
+        state["next_check_ts"] = now + interval * random.uniform(0.9, 1.1)
+        self.db.update_poll_state(
+            chat_id, state["rate"], state["risk"], state["next_check_ts"], now
+        )
+
+        self.checks += 1
+        self.fetched += len(messages)
+        self.suspicious += hits
+
+    async def _process(self, chat_id: int, entity, message) -> bool:
+        """Одно сообщение опроса; True – подозрительное."""
+        if not message.message:
+            return False
+        if not self.tm.seen.check_and_add(chat_id, message.id):
+            return False
+
+        analysis = self.tm.analyze_text(message.message, "poll")
+        if not analysis.get("is_suspicious"):
+            return False
+
+        try:
+            sender_username, sender_name = await self.tm._get_sender_info(
+                message, "discovery"
+            )
+            return await self.tm._process_text_for_entity(
+                entity=entity,
+                text=message.message,
+                source="poll",
+                analysis=analysis,
+                message_id=message.id,
+                message=message,
+                sender_username=sender_username,
+                sender_name=sender_name,
+            )
+        except Exception:
+            # не обработали – пусть следующая проверка возьмёт его снова
+            self.tm.seen.discard(chat_id, message.id)
+            raise
+
+    def stats(self) -> dict:
+        now = time.time()
+        intervals = [
+            self.next_interval(st["rate"], st["risk"]) for st in self._states.values()
+        ]
+        return {
+            "chats": len(self._states),
+            "due": sum(1 for st in self._states.values() if st["next_check_ts"] <= now),
+            "hot": sum(1 for i in intervals if i <= self.min_interval),
+            "dormant": sum(1 for i in intervals if i >= self.max_interval),
+            "checks": self.checks,
+            "fetched": self.fetched,
+            "suspicious": self.suspicious,
+        }
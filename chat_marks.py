@@ -0,0 +1,180 @@
+import asyncio
+import logging
+
+
+class ChatMarks:
+    """
+    High-water mark чатов (dialog_state.last_message_id) с учётом
+    сообщений, которые ещё в работе.
+
+    Отметка чата – наибольший id, ниже которого всё уже обработано:
+    - begin() – живое сообщение принято (до очередей пайплайна)
+    - finish() – дошло до конца (или отфильтровано)
+    - lost() – выкинуто переполненной очередью / упало с ошибкой:
+      отметка не поднимется выше него, и после рестарта дочитка его подберёт
+    - advance() – история/опрос прочитали подряд всё в (since, upto]
+    Так необработанное сообщение N-1 не теряется, если раньше него
+    закончилось N.
+
+    Пока по чату не было advance() (initial_scan ещё не дочитал простой,
+    опрос ещё не приходил), живые finish() отметку не двигают – иначе
+    дочитка решит, что догонять нечего. То, что живой путь обработал
+    выше дочитанного, после рестарта просто прочитается ещё раз.
+
+    Отметки пишутся в БД пачкой раз в flush_interval (в потоке, вне
+    event loop'а), а не коммитом на каждое сообщение. При падении
+    пропадает только последняя пачка – это значит лишь повторное чтение.
+    Один экземпляр общий для всех аккаунтов процесса, как и SeenSet.
+    """
+
+    def __init__(self, db, flush_interval: float = 1.0):
+        self.db = db
+        self.flush_interval = flush_interval
+
+        # chat_id -> наибольший завершённый id
+        self._done: dict[int, int] = {}
+        # chat_id -> {message_id: сколько раз в работе} (один id может вести пара аккаунтов)
+        self._inflight: dict[int, dict[int, int]] = {}
+        # chat_id -> потерянные id, выше которых отметку не поднимаем
+        self._lost: dict[int, set[int]] = {}
+        # что уже записано в БД
+        self._stored: dict[int, int] = {}
+        # чаты, чья отметка уже прочитана из БД
+        self._loaded: set[int] = set()
+        # чаты, которые история/опрос уже дочитали (был advance)
+        self._backfilled: set[int] = set()
+        self._dirty: set[int] = set()
+        self._task: asyncio.Task | None = None
+
+        self.flushes = 0
+        self.lost_total = 0
+
+    # ======================================================
+    #   СОСТОЯНИЕ
+    # ======================================================
+
+    def _load(self, chat_id: int):
+        """Отметка из БД – при первом обращении к чату (get/begin/finish)."""
+        if chat_id in self._loaded:
+            return
+        self._loaded.add(chat_id)
+        stored = self.db.get_last_message_id(chat_id)
+        if stored is not None:
+            self._done[chat_id] = max(self._done.get(chat_id, 0), stored)
+            self._stored[chat_id] = stored
+
+    def get(self, chat_id: int) -> int | None:
+        """Текущая отметка чата; None – чат ещё не сканировали."""
+        self._load(chat_id)
+        if chat_id not in self._done:
+            return None
+        return self._mark(chat_id)
+
+    def _mark(self, chat_id: int) -> int:
+        mark = self._done.get(chat_id, 0)
+        inflight = self._inflight.get(chat_id)
+        if inflight:
+            mark = min(mark, min(inflight) - 1)
+        lost = self._lost.get(chat_id)
+        if lost:
+            mark = min(mark, min(lost) - 1)
+        return mark
+
+    def begin(self, chat_id, message_id):
+        if chat_id is None or message_id is None:
+            return
+        self._load(chat_id)
+        inflight = self._inflight.setdefault(chat_id, {})
+        inflight[message_id] = inflight.get(message_id, 0) + 1
+
+    def _release(self, chat_id, message_id):
+        inflight = self._inflight.get(chat_id)
+        if not inflight or message_id not in inflight:
+            return
+        inflight[message_id] -= 1
+        if inflight[message_id] <= 0:
+            del inflight[message_id]
+        if not inflight:
+            del self._inflight[chat_id]
+
+    def finish(self, chat_id, message_id):
+        if chat_id is None or message_id is None:
+            return
+        self._load(chat_id)
+        self._release(chat_id, message_id)
+        if chat_id not in self._backfilled:
+            # простой ещё не дочитан – отметку не трогаем до advance()
+            return
+        self._done[chat_id] = max(self._done.get(chat_id, 0), message_id)
+        self._dirty.add(chat_id)
+
+    def lost(self, chat_id, message_id):
+        if chat_id is None or message_id is None:
+            return
+        self._release(chat_id, message_id)
+        self._lost.setdefault(chat_id, set()).add(message_id)
+        self.lost_total += 1
+
+    def advance(self, chat_id: int, upto: int, since: int = 0):
+        """
+        История/опрос обработали всё в (since, upto] – в том числе потерянное
+        живым путём. С этого момента отметку чата двигают и живые finish().
+        """
+        self._load(chat_id)
+        self._backfilled.add(chat_id)
+        if upto <= since:
+            return
+        lost = self._lost.get(chat_id)
+        if lost:
+            lost.difference_update([i for i in lost if since < i <= upto])
+            if not lost:
+                del self._lost[chat_id]
+        self._done[chat_id] = max(self._done.get(chat_id, 0), upto)
+        self._dirty.add(chat_id)
+
+    # ======================================================
+    #   ЗАПИСЬ В БД
+    # ======================================================
+
+    def _collect(self) -> list[tuple[int, int]]:
+        rows = []
+        for chat_id in self._dirty:
+            mark = self._mark(chat_id)
+            if mark > self._stored.get(chat_id, 0):
+                rows.append((chat_id, mark))
+        self._dirty.clear()
+        return rows
+
+    async def flush(self):
+        rows = self._collect()
+        if not rows:
+            return
+        try:
+            await asyncio.to_thread(self.db.update_last_message_ids, rows)
+        except Exception as e:
+            logging.error(f"❌ Chat marks flush error ({len(rows)} chats): {e}")
+            self._dirty.update(chat_id for chat_id, _ in rows)
+            return
+        for chat_id, mark in rows:
+            self._stored[chat_id] = max(mark, self._stored.get(chat_id, 0))
+        self.flushes += 1
+
+    def start(self):
+        """Фоновая запись отметок; повторный вызов ничего не делает."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="chat-marks")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._done),
+            "backfilled": len(self._backfilled),
+            "in_flight": sum(sum(v.values()) for v in self._inflight.values()),
+            "lost_pending": sum(len(v) for v in self._lost.values()),
+            "lost_total": self.lost_total,
+            "flushes": self.flushes,
+        }
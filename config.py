@@ -23,9 +23,142 @@ def get_optional_int_env(name: str):
 ALERT_CHAT = os.getenv("ALERT_CHAT", "@kz_monitor_alerts")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "kz_drug_shops.db")
 
+# Отправка алертов из outbox.
+# ALERT_BOT_TOKEN – слать через отдельного бота (он должен быть админом ALERT_CHAT),
+# чтобы не тратить лимиты пользовательских аккаунтов на алерты.
+ALERT_BOT_TOKEN = os.getenv("ALERT_BOT_TOKEN")
+ALERT_RATE_PER_MINUTE = get_optional_int_env("ALERT_RATE_PER_MINUTE") or 20
+ALERT_BURST = get_optional_int_env("ALERT_BURST") or 3
+ALERT_COALESCE_WINDOW = get_optional_int_env("ALERT_COALESCE_WINDOW")
+if ALERT_COALESCE_WINDOW is None:
+    ALERT_COALESCE_WINDOW = 30
+
 CHECK_INTERVAL = get_optional_int_env("CHECK_INTERVAL") or 3600
 MAX_PARTICIPANTS = get_optional_int_env("MAX_PARTICIPANTS") or 100
 
+# Сколько сообщений максимум дочитывать после простоя для чата,
+# у которого уже есть сохранённый high-water mark (пусто = без ограничения)
+HISTORY_BACKFILL_LIMIT = get_optional_int_env("HISTORY_BACKFILL_LIMIT")
+
+# Периодические задачи (сек): запускаются один раз на весь парк аккаунтов.
+# BOT_SEARCH_INTERVAL – опрос ботов, DISCOVERY_INTERVAL – discovery по диалогам
+# каждого аккаунта, JOB_JITTER – случайный разброс стартов,
+# JOB_LEASE_SECONDS – аренда задачи (продлевается, пока задача работает)
+BOT_SEARCH_INTERVAL = get_optional_int_env("BOT_SEARCH_INTERVAL") or CHECK_INTERVAL
+DISCOVERY_INTERVAL = get_optional_int_env("DISCOVERY_INTERVAL") or 7200
+JOB_JITTER = get_optional_int_env("JOB_JITTER")
+if JOB_JITTER is None:
+    JOB_JITTER = 120
+JOB_LEASE_SECONDS = get_optional_int_env("JOB_LEASE_SECONDS") or 300
+
+# Адаптивный опрос чатов (сек): чем активнее и рискованнее чат, тем чаще.
+# POLL_TARGET_MESSAGES – сколько новых сообщений ждём за одну проверку,
+# POLL_BUDGET_PER_MINUTE – общий бюджет запросов get_messages на процесс
+POLL_MIN_INTERVAL = get_optional_int_env("POLL_MIN_INTERVAL") or 300
+POLL_MAX_INTERVAL = get_optional_int_env("POLL_MAX_INTERVAL") or 86400
+POLL_DEFAULT_INTERVAL = get_optional_int_env("POLL_DEFAULT_INTERVAL") or 3600
+POLL_TARGET_MESSAGES = get_optional_int_env("POLL_TARGET_MESSAGES") or 50
+POLL_MAX_FETCH = get_optional_int_env("POLL_MAX_FETCH") or 500
+POLL_BUDGET_PER_MINUTE = get_optional_int_env("POLL_BUDGET_PER_MINUTE") or 30
+
+# Опрос ботов: сколько ждать ответа (сек), сколько ботов одновременно,
+# сколько страниц инлайн-пагинации листать
+BOT_REPLY_TIMEOUT = get_optional_int_env("BOT_REPLY_TIMEOUT") or 15
+BOT_CONCURRENCY = get_optional_int_env("BOT_CONCURRENCY") or 3
+BOT_MAX_PAGES = get_optional_int_env("BOT_MAX_PAGES") or 5
+
+# Краулер ссылок из подозрительных сообщений: раз в CRAWL_INTERVAL сек
+# посещает до CRAWL_BUDGET целей (CRAWL_CONCURRENCY одновременно),
+# не глубже CRAWL_MAX_DEPTH шагов от исходного сообщения
+CRAWL_INTERVAL = get_optional_int_env("CRAWL_INTERVAL") or 900
+CRAWL_BUDGET = get_optional_int_env("CRAWL_BUDGET") or 50
+CRAWL_CONCURRENCY = get_optional_int_env("CRAWL_CONCURRENCY") or 3
+CRAWL_MAX_DEPTH = get_optional_int_env("CRAWL_MAX_DEPTH") or 2
+CRAWL_FETCH_LIMIT = get_optional_int_env("CRAWL_FETCH_LIMIT") or 30
+
+# Страховочный интервал проверки очереди ручных сканов (сек).
+# Обычно воркеры будит сам веб-интерфейс, опрос нужен на случай,
+# если задачу добавил другой процесс.
+SCAN_POLL_INTERVAL = get_optional_int_env("SCAN_POLL_INTERVAL") or 30
+
+# ============================================
+# Режим запуска
+# ============================================
+# RUN_MODE:
+#   single     – все аккаунты в одном процессе (по умолчанию)
+#   supervisor – по процессу на группу из ACCOUNTS_PER_PROCESS аккаунтов,
+#                упавшие процессы перезапускаются с backoff
+RUN_MODE = os.getenv("RUN_MODE", "single").lower()
+ACCOUNTS_PER_PROCESS = get_optional_int_env("ACCOUNTS_PER_PROCESS") or 1
+# Таймаут логина одного аккаунта при старте (сек)
+ACCOUNT_INIT_TIMEOUT = get_optional_int_env("ACCOUNT_INIT_TIMEOUT") or 60
+# Через сколько секунд без heartbeat дочерний процесс считается зависшим
+CHILD_HEARTBEAT_TIMEOUT = get_optional_int_env("CHILD_HEARTBEAT_TIMEOUT") or 180
+
+# ============================================
+# Веб-интерфейс
+# ============================================
+# WEB_MODE:
+#   thread  – uvicorn в потоке процесса монитора (по умолчанию)
+#   process – отдельный процесс uvicorn (WEB_WORKERS воркеров), общий только файл БД
+#   off     – без веб-интерфейса
+WEB_MODE = os.getenv("WEB_MODE", "thread").lower()
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = get_optional_int_env("WEB_PORT") or 8000
+WEB_WORKERS = get_optional_int_env("WEB_WORKERS") or 1
+
+# Чтение БД веб-обработчиками: read-only пул потоков вне event loop'а.
+# Быстрая полоса (статистика, списки) и медленная (сообщения, выгрузки) –
+# свои потоки и свой таймаут запроса (сек), медленные не задерживают быстрые.
+WEB_DB_READERS = get_optional_int_env("WEB_DB_READERS") or 4
+WEB_DB_SLOW_READERS = get_optional_int_env("WEB_DB_SLOW_READERS") or 2
+WEB_QUERY_TIMEOUT = get_optional_int_env("WEB_QUERY_TIMEOUT") or 5
+WEB_SLOW_QUERY_TIMEOUT = get_optional_int_env("WEB_SLOW_QUERY_TIMEOUT") or 30
+
+# Сколько ответов API держит кеш (response_cache). 0 – кеш выключен,
+# каждый запрос идёт в БД (так load_bench меряет сами запросы).
+WEB_CACHE_ENTRIES = get_optional_int_env("WEB_CACHE_ENTRIES")
+if WEB_CACHE_ENTRIES is None:
+    WEB_CACHE_ENTRIES = 256
+
+# Токен для /api/admin/* (профайлер, tracemalloc, задачи asyncio):
+# нужен заголовок X-Admin-Token. Без токена эндпоинты выключены (404).
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Как часто монитор проверяет scan_jobs, когда веб в отдельном процессе (сек)
+SCAN_WATCH_INTERVAL = get_optional_int_env("SCAN_WATCH_INTERVAL") or 1
+
+# Размер диапазона message_id, который один аккаунт берёт за раз при глубоком скане
+DEEP_SCAN_RANGE_SIZE = get_optional_int_env("DEEP_SCAN_RANGE_SIZE") or 2000
+# Сколько раз диапазон глубокого скана пробуют заново после ошибки, прежде чем считать его проваленным
+DEEP_SCAN_MAX_ATTEMPTS = get_optional_int_env("DEEP_SCAN_MAX_ATTEMPTS") or 5
+
+# ============================================
+# Пайплайн обработки живых сообщений
+# ============================================
+# Для каждой стадии: число воркеров, размер очереди и политика переполнения
+# (block / drop_new / drop_oldest / spill), например PIPELINE_PERSIST_WORKERS=4
+
+
+def _pipeline_stage(name: str, workers: int) -> dict:
+    prefix = f"PIPELINE_{name.upper()}"
+    return {
+        "workers": get_optional_int_env(f"{prefix}_WORKERS") or workers,
+        "maxsize": get_optional_int_env(f"{prefix}_QUEUE_SIZE")
+        or get_optional_int_env("PIPELINE_QUEUE_SIZE")
+        or 1000,
+        "policy": os.getenv(f"{prefix}_POLICY")
+        or os.getenv("PIPELINE_OVERFLOW_POLICY", "block"),
+    }
+
+
+PIPELINE_STAGES = {
+    "ingest": _pipeline_stage("ingest", 4),
+    "analysis": _pipeline_stage("analysis", 2),
+    "persist": _pipeline_stage("persist", 2),
+    "alert": _pipeline_stage("alert", 1),
+}
+
 # ЧТЕНИЕ ВСЕХ АККАУНТОВ ИЗ .env
 # ============================================
 
@@ -1,12 +1,24 @@
+import json
 import sqlite3
 import logging
 import os
+import time
 from datetime import datetime
 
+from metrics import DB_FLUSH_OPS, DB_FLUSH_SECONDS, DB_WRITE_SECONDS
+
 
 class DatabaseManager:
-    def __init__(self, db_name: str = "kz_drug_shops.db"):
+    def __init__(
+        self,
+        db_name: str = "kz_drug_shops.db",
+        busy_timeout: float = 30.0,
+        write_queue=None,
+    ):
         self.db_name = db_name
+        self.busy_timeout = busy_timeout
+        # Очередь операций для общего writer'а (None – пишем сами)
+        self.write_queue = write_queue
 
         # Если файла ещё нет – создаём
         if not os.path.exists(self.db_name):
@@ -14,125 +26,1728 @@ class DatabaseManager:
         else:
             logging.info("📁 Используется существующая база данных.")
 
-        self.setup_database()
+        self.setup_database()
+
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        """
+        Соединение с БД. Ждём блокировку до busy_timeout, а не падаем сразу:
+        в БД одновременно пишут монитор и (в режиме WEB_MODE=process) веб.
+        """
+        return sqlite3.connect(self.db_name, timeout=self.busy_timeout, **kwargs)
+
+    def setup_database(self):
+        """Инициализация базы данных с нужной структурой."""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        # WAL: читатели (дашборд) не блокируют писателя (монитор) и наоборот.
+        # Режим сохраняется в самом файле БД.
+        cursor.execute("PRAGMA journal_mode=WAL")
+
+        # Таблица каналов
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS suspicious_channels (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE,
+                title TEXT,
+                participants_count INTEGER DEFAULT 0,
+                kz_phone_ratio REAL DEFAULT 0,
+                risk_score REAL DEFAULT 0,
+                found_via TEXT,
+                description TEXT,
+                channel_type TEXT DEFAULT 'unknown',
+                last_checked TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                is_active BOOLEAN DEFAULT TRUE
+            )
+        """
+        )
+
+        # Таблица сообщений
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS channel_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel_username TEXT,
+                message_text TEXT,
+                contains_drugs BOOLEAN,
+                contains_geo BOOLEAN,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """
+        )
+        # (chat_id, message_id) – одно сообщение пишется один раз, даже если
+        # его прочитали аккаунты из разных процессов (у каждого свой SeenSet)
+        self._ensure_column(cursor, "channel_messages", "chat_id", "INTEGER")
+        self._ensure_column(cursor, "channel_messages", "message_id", "INTEGER")
+        cursor.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_channel_messages_key
+            ON channel_messages (chat_id, message_id) WHERE message_id IS NOT NULL
+        """
+        )
+
+        # Последний обработанный message_id по каждому чату (high-water mark).
+        # Нужен, чтобы после рестарта дочитывать только новые сообщения.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS dialog_state (
+                chat_id INTEGER PRIMARY KEY,
+                last_message_id INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP
+            )
+        """
+        )
+        # Адаптивный опрос (AdaptivePoller): темп сообщений, риск, следующая проверка
+        self._ensure_column(cursor, "dialog_state", "msg_rate", "REAL DEFAULT 0")
+        self._ensure_column(cursor, "dialog_state", "risk", "REAL DEFAULT 0")
+        self._ensure_column(cursor, "dialog_state", "next_check_ts", "REAL")
+        self._ensure_column(cursor, "dialog_state", "last_checked_ts", "REAL")
+
+        # Отпечатки диалогов для инкрементального discovery:
+        # диалог с тем же отпечатком повторно не анализируем
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS dialog_fingerprints (
+                chat_id INTEGER PRIMARY KEY,
+                meta_hash TEXT,
+                top_message_id INTEGER,
+                analyzed_at TIMESTAMP
+            )
+        """
+        )
+
+        # Фронтир краулера ссылок и множество посещённых (LinkCrawler)
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS crawl_frontier (
+                target TEXT PRIMARY KEY,
+                score REAL DEFAULT 0,
+                depth INTEGER DEFAULT 0,
+                via TEXT,
+                found_from TEXT,
+                hits INTEGER DEFAULT 1,
+                status TEXT DEFAULT 'pending',
+                suspicious INTEGER DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMP,
+                visited_at TIMESTAMP
+            )
+        """
+        )
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_crawl_frontier_status
+            ON crawl_frontier (status, score)
+        """
+        )
+
+        # Исходящие алерты: пишем сюда, отправляет AlertSender.
+        # Неотправленное переживает рестарт.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS alert_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel_key TEXT,
+                channel_title TEXT,
+                body TEXT NOT NULL,
+                preview TEXT,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                created_ts REAL NOT NULL,
+                next_attempt_ts REAL DEFAULT 0,
+                sent_at TIMESTAMP,
+                last_error TEXT
+            )
+        """
+        )
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_alert_outbox_pending
+            ON alert_outbox (status, next_attempt_ts)
+        """
+        )
+        # "chat_id:message_id" – по одному алерту на сообщение на весь парк
+        self._ensure_column(cursor, "alert_outbox", "message_key", "TEXT")
+        cursor.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_alert_outbox_message
+            ON alert_outbox (message_key) WHERE message_key IS NOT NULL
+        """
+        )
+
+        # Задачи ручного сканирования (кладёт веб, разбирают аккаунты)
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scan_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                identifier TEXT NOT NULL,
+                priority INTEGER DEFAULT 0,
+                message_limit INTEGER DEFAULT 500,
+                status TEXT DEFAULT 'queued',
+                account TEXT,
+                title TEXT,
+                scanned INTEGER DEFAULT 0,
+                suspicious INTEGER DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """
+        )
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_scan_jobs_status
+            ON scan_jobs (status, priority, id)
+        """
+        )
+        # mode: recent – последние N сообщений, deep – вся история по диапазонам id
+        self._ensure_column(cursor, "scan_jobs", "mode", "TEXT DEFAULT 'recent'")
+        self._ensure_column(cursor, "scan_jobs", "top_message_id", "INTEGER")
+
+        # Диапазоны message_id глубокого скана: каждый аккаунт берёт свой кусок.
+        # cursor – следующий max_id (идём от новых к старым), чтобы продолжить
+        # с места остановки после рестарта.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scan_ranges (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER NOT NULL,
+                lo INTEGER NOT NULL,
+                hi INTEGER NOT NULL,
+                cursor INTEGER NOT NULL,
+                status TEXT DEFAULT 'pending',
+                account TEXT,
+                scanned INTEGER DEFAULT 0,
+                suspicious INTEGER DEFAULT 0,
+                updated_at TIMESTAMP
+            )
+        """
+        )
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_scan_ranges_job
+            ON scan_ranges (job_id, status)
+        """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_scan_ranges_status ON scan_ranges (status)"
+        )
+        # неудачные попытки диапазона: после DEEP_SCAN_MAX_ATTEMPTS он failed
+        self._ensure_column(cursor, "scan_ranges", "attempts", "INTEGER DEFAULT 0")
+        self._ensure_column(cursor, "scan_ranges", "last_error", "TEXT")
+
+        # Какие аккаунты не видят канал глубокого скана: когда это все
+        # живые аккаунты (account_presence), задача проваливается
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scan_unreachable (
+                job_id INTEGER NOT NULL,
+                account TEXT NOT NULL,
+                reported_at TIMESTAMP,
+                PRIMARY KEY (job_id, account)
+            )
+        """
+        )
+
+        # Живые аккаунты всего парка (все процессы): отмечаются раз в полминуты
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS account_presence (
+                account TEXT PRIMARY KEY,
+                pid INTEGER,
+                seen_at REAL
+            )
+        """
+        )
+        # Чаты аккаунтов для ShardMap: владельца чата выбирают среди
+        # аккаунтов всех процессов, а не только своего
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS shard_members (
+                account TEXT NOT NULL,
+                chat_id INTEGER NOT NULL,
+                PRIMARY KEY (account, chat_id)
+            ) WITHOUT ROWID
+        """
+        )
+
+        # Состояние дочерних процессов в режиме supervisor
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS process_health (
+                group_id INTEGER PRIMARY KEY,
+                pid INTEGER,
+                accounts TEXT,
+                status TEXT,
+                restarts INTEGER DEFAULT 0,
+                started_at TIMESTAMP,
+                last_heartbeat TIMESTAMP,
+                payload TEXT
+            )
+        """
+        )
+
+        # Периодические задачи (discovery, боты): аренда на весь парк процессов
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS periodic_jobs (
+                name TEXT PRIMARY KEY,
+                owner TEXT,
+                lease_until REAL,
+                last_started_at TIMESTAMP,
+                last_finished_ts REAL,
+                last_finished_at TIMESTAMP,
+                last_duration REAL,
+                last_status TEXT,
+                last_error TEXT,
+                runs INTEGER DEFAULT 0
+            )
+        """
+        )
+
+        # Агрегаты для графиков активности: подозрительные сообщения по часам/дням
+        # в разрезе канала, триггера и источника (found_via). Пополняются при
+        # каждой записи сообщения, так что графику не нужен GROUP BY по channel_messages.
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activity_rollup'"
+        )
+        rollup_exists = cursor.fetchone() is not None
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS activity_rollup (
+                period TEXT NOT NULL,
+                dimension TEXT NOT NULL,
+                key TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (period, dimension, key, bucket)
+            )
+        """
+        )
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_activity_rollup_bucket
+            ON activity_rollup (period, dimension, bucket)
+        """
+        )
+        if not rollup_exists:
+            self._backfill_rollup(cursor)
+
+        # Поколение данных дашборда: растёт с каждой записью каналов/сообщений,
+        # по нему веб сбрасывает кеш ответов (и в других процессах тоже)
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS data_generation (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        """
+        )
+        cursor.execute("INSERT OR IGNORE INTO data_generation (id, value) VALUES (1, 0)")
+
+        conn.commit()
+        conn.close()
+        logging.info("✅ База данных готова к использованию")
+
+    @staticmethod
+    def _ensure_column(cursor, table: str, column: str, ddl: str):
+        """Добавляет колонку в уже существующую таблицу (простая миграция)."""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+    # =====================================================
+    #  СОХРАНЕНИЕ ДАННЫХ
+    # =====================================================
+
+    def save_channel(self, channel_data: dict):
+        """Сохранение подозрительного канала."""
+        if self._forward_write("save_channel", channel_data):
+            return
+
+        started = time.perf_counter()
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            self._write_save_channel(cursor, channel_data)
+            self._bump_generation(cursor)
+            conn.commit()
+            DB_WRITE_SECONDS.observe(time.perf_counter() - started, "save_channel")
+            logging.info(f"💾 Канал сохранён: {channel_data.get('title')}")
+        except Exception as e:
+            logging.error(f"❌ Ошибка сохранения канала: {e}")
+        finally:
+            conn.close()
+
+    def save_message(self, message_data: dict):
+        """Сохранение подозрительного сообщения."""
+        if self._forward_write("save_message", message_data):
+            return
+
+        started = time.perf_counter()
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            self._write_save_message(cursor, message_data)
+            self._bump_generation(cursor)
+            conn.commit()
+            DB_WRITE_SECONDS.observe(time.perf_counter() - started, "save_message")
+            logging.info(
+                f"💾 Сообщение сохранено (канал={message_data.get('channel_username')})"
+            )
+        except Exception as e:
+            logging.error(f"❌ Ошибка сохранения сообщения: {e}")
+        finally:
+            conn.close()
+
+    # =====================================================
+    #  ЗАПИСЬ ЧЕРЕЗ ОБЩИЙ WRITER (режим supervisor)
+    # =====================================================
+    # В режиме supervisor дочерние процессы не пишут горячие данные сами,
+    # а отправляют операции в очередь; процесс-супервизор применяет их
+    # пачками в одной транзакции (см. supervisor.DatabaseWriter).
+
+    WRITE_OPS = (
+        "save_channel",
+        "save_message",
+        "update_last_message_id",
+        "update_last_message_ids",
+        "update_poll_state",
+        "save_dialog_fingerprints",
+        "add_crawl_targets",
+        "enqueue_alert",
+    )
+
+    # Операции, меняющие то, что показывает дашборд (/api/stats, /api/channels, /api/messages)
+    GENERATION_OPS = ("save_channel", "save_message")
+
+    def _forward_write(self, op: str, *args) -> bool:
+        if self.write_queue is None:
+            return False
+        self.write_queue.put((op, args))
+        return True
+
+    def apply_writes(self, ops: list[tuple[str, tuple]]) -> int:
+        """Применяет пачку операций одной транзакцией. Возвращает число успешных."""
+        started = time.perf_counter()
+        conn = self._connect()
+        cursor = conn.cursor()
+        applied = 0
+        changed = False
+
+        try:
+            for op, args in ops:
+                if op not in self.WRITE_OPS:
+                    logging.error(f"❌ Неизвестная операция записи: {op}")
+                    continue
+                try:
+                    getattr(self, f"_write_{op}")(cursor, *args)
+                    applied += 1
+                    changed = changed or op in self.GENERATION_OPS
+                except Exception as e:
+                    logging.error(f"❌ Ошибка записи ({op}): {e}")
+            # одно повышение поколения на всю пачку
+            if changed:
+                self._bump_generation(cursor)
+            conn.commit()
+        finally:
+            conn.close()
+
+        DB_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        DB_FLUSH_OPS.inc(value=applied)
+        return applied
+
+    @staticmethod
+    def _bump_generation(cursor):
+        cursor.execute("UPDATE data_generation SET value = value + 1 WHERE id = 1")
+
+    def get_data_generation(self) -> int:
+        """Текущее поколение данных дашборда (см. response_cache.ResponseCache)."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM data_generation WHERE id = 1").fetchone()
+            return row[0] if row else 0
+        finally:
+            conn.close()
+
+    def _write_save_channel(self, cursor, channel_data: dict):
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO suspicious_channels
+            (username, title, participants_count, kz_phone_ratio, risk_score,
+             found_via, description, channel_type, last_checked)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            (
+                channel_data.get("username"),
+                channel_data.get("title", "Unknown"),
+                channel_data.get("participants_count", 0),
+                channel_data.get("kz_phone_ratio", 0.0),
+                channel_data.get("risk_score", 0.0),
+                channel_data.get("found_via", "unknown"),
+                channel_data.get("description", ""),
+                channel_data.get("channel_type", "unknown"),
+                datetime.now(),
+            ),
+        )
+
+    def _write_save_message(self, cursor, message_data: dict):
+        # Уже записанное (chat_id, message_id) пропускаем вместе с агрегатами
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO channel_messages
+            (channel_username, message_text, contains_drugs, contains_geo, timestamp,
+             chat_id, message_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+            (
+                message_data.get("channel_username"),
+                message_data.get("message_text", ""),
+                bool(message_data.get("contains_drugs", False)),
+                bool(message_data.get("contains_geo", False)),
+                message_data.get("timestamp", datetime.now()),
+                message_data.get("chat_id"),
+                message_data.get("message_id"),
+            ),
+        )
+        if cursor.rowcount == 0:
+            return
+        if message_data.get("contains_drugs"):
+            self._write_rollup(cursor, message_data)
+
+    def _write_update_last_message_id(self, cursor, chat_id: int, message_id: int):
+        cursor.execute(
+            """
+            INSERT INTO dialog_state (chat_id, last_message_id, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                last_message_id = MAX(last_message_id, excluded.last_message_id),
+                updated_at = excluded.updated_at
+        """,
+            (chat_id, message_id, datetime.now()),
+        )
+
+    def _write_update_last_message_ids(self, cursor, rows: list[tuple]):
+        """rows: (chat_id, message_id)."""
+        now = datetime.now()
+        cursor.executemany(
+            """
+            INSERT INTO dialog_state (chat_id, last_message_id, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                last_message_id = MAX(last_message_id, excluded.last_message_id),
+                updated_at = excluded.updated_at
+        """,
+            [(chat_id, message_id, now) for chat_id, message_id in rows],
+        )
+
+    def _write_update_poll_state(
+        self,
+        cursor,
+        chat_id: int,
+        msg_rate: float,
+        risk: float,
+        next_check_ts: float,
+        last_checked_ts: float,
+    ):
+        cursor.execute(
+            """
+            INSERT INTO dialog_state
+            (chat_id, msg_rate, risk, next_check_ts, last_checked_ts, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                msg_rate = excluded.msg_rate,
+                risk = excluded.risk,
+                next_check_ts = excluded.next_check_ts,
+                last_checked_ts = excluded.last_checked_ts
+        """,
+            (chat_id, msg_rate, risk, next_check_ts, last_checked_ts, datetime.now()),
+        )
+
+    def _write_save_dialog_fingerprints(self, cursor, rows: list[tuple]):
+        """rows: (chat_id, meta_hash, top_message_id)."""
+        now = datetime.now()
+        cursor.executemany(
+            """
+            INSERT OR REPLACE INTO dialog_fingerprints
+            (chat_id, meta_hash, top_message_id, analyzed_at)
+            VALUES (?, ?, ?, ?)
+        """,
+            [(chat_id, meta_hash, top_id, now) for chat_id, meta_hash, top_id in rows],
+        )
+
+    def _write_add_crawl_targets(self, cursor, rows: list[tuple]):
+        """rows: (target, score, depth, found_from, via). Повторная находка добавляет вес."""
+        now = datetime.now()
+        cursor.executemany(
+            """
+            INSERT INTO crawl_frontier (target, score, depth, found_from, via, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(target) DO UPDATE SET
+                score = score + excluded.score,
+                depth = MIN(depth, excluded.depth),
+                hits = hits + 1
+        """,
+            [
+                (target, score, depth, found_from, via, now)
+                for target, score, depth, found_from, via in rows
+            ],
+        )
+
+    def _write_enqueue_alert(
+        self,
+        cursor,
+        channel_key: str,
+        channel_title: str,
+        body: str,
+        preview: str,
+        message_key: str | None = None,
+    ):
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO alert_outbox
+            (channel_key, channel_title, body, preview, created_ts, message_key)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            (channel_key, channel_title, body, preview, time.time(), message_key),
+        )
+
+    # =====================================================
+    #  HIGH-WATER MARKS ПО ЧАТАМ
+    # =====================================================
+
+    def get_last_message_id(self, chat_id: int) -> int | None:
+        """Последний обработанный message_id чата (None — чат ещё не сканировали)."""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            "SELECT last_message_id FROM dialog_state WHERE chat_id = ?",
+            (chat_id,),
+        )
+        row = cursor.fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def update_last_message_id(self, chat_id: int, message_id: int):
+        """
+        Сдвигаем high-water mark чата вперёд.
+        Отметка никогда не уменьшается, даже если сообщения пришли не по порядку.
+        """
+        if self._forward_write("update_last_message_id", chat_id, message_id):
+            return
+
+        started = time.perf_counter()
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            self._write_update_last_message_id(cursor, chat_id, message_id)
+            conn.commit()
+            DB_WRITE_SECONDS.observe(time.perf_counter() - started, "update_last_message_id")
+        except Exception as e:
+            logging.error(f"❌ Ошибка сохранения отметки чата {chat_id}: {e}")
+        finally:
+            conn.close()
+
+    def update_last_message_ids(self, rows: list[tuple]):
+        """Пачка отметок (chat_id, message_id) одной транзакцией (см. chat_marks.ChatMarks)."""
+        if not rows:
+            return
+        if self._forward_write("update_last_message_ids", rows):
+            return
+
+        started = time.perf_counter()
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            self._write_update_last_message_ids(cursor, rows)
+            conn.commit()
+            DB_WRITE_SECONDS.observe(time.perf_counter() - started, "update_last_message_ids")
+        except Exception as e:
+            logging.error(f"❌ Ошибка сохранения отметок чатов: {e}")
+        finally:
+            conn.close()
+
+    def get_poll_states(self, chat_ids) -> dict[int, dict]:
+        """Сохранённое расписание опроса по чатам (только для тех, что уже опрашивали)."""
+        chat_ids = list(chat_ids)
+        if not chat_ids:
+            return {}
+
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        states = {}
+        # SQLite ограничивает число параметров – идём пачками
+        for start in range(0, len(chat_ids), 500):
+            chunk = chat_ids[start : start + 500]
+            cursor.execute(
+                f"""
+                SELECT chat_id, msg_rate, risk, next_check_ts, last_checked_ts
+                FROM dialog_state
+                WHERE next_check_ts IS NOT NULL
+                  AND chat_id IN ({",".join("?" * len(chunk))})
+            """,
+                chunk,
+            )
+            for row in cursor.fetchall():
+                states[row["chat_id"]] = dict(row)
+        conn.close()
+        return states
+
+    def update_poll_state(
+        self,
+        chat_id: int,
+        msg_rate: float,
+        risk: float,
+        next_check_ts: float,
+        last_checked_ts: float,
+    ):
+        args = (chat_id, msg_rate, risk, next_check_ts, last_checked_ts)
+        if self._forward_write("update_poll_state", *args):
+            return
+
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            self._write_update_poll_state(cursor, *args)
+            conn.commit()
+        except Exception as e:
+            logging.error(f"❌ Ошибка сохранения расписания опроса: {e}")
+        finally:
+            conn.close()
+
+    # =====================================================
+    #  ОТПЕЧАТКИ ДИАЛОГОВ (DISCOVERY)
+    # =====================================================
+
+    def get_dialog_fingerprints(self) -> dict[int, tuple[str, int]]:
+        """chat_id -> (meta_hash, top_message_id) на момент последнего анализа."""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT chat_id, meta_hash, top_message_id FROM dialog_fingerprints")
+        fingerprints = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        conn.close()
+        return fingerprints
+
+    def save_dialog_fingerprints(self, rows: list[tuple]):
+        if not rows:
+            return
+        if self._forward_write("save_dialog_fingerprints", rows):
+            return
+
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            self._write_save_dialog_fingerprints(cursor, rows)
+            conn.commit()
+        except Exception as e:
+            logging.error(f"❌ Ошибка сохранения отпечатков диалогов: {e}")
+        finally:
+            conn.close()
+
+    # =====================================================
+    #  КРАУЛЕР ССЫЛОК
+    # =====================================================
+
+    def add_crawl_targets(self, rows: list[tuple]):
+        if not rows:
+            return
+        if self._forward_write("add_crawl_targets", rows):
+            return
+
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            self._write_add_crawl_targets(cursor, rows)
+            conn.commit()
+        except Exception as e:
+            logging.error(f"❌ Ошибка сохранения целей краулера: {e}")
+        finally:
+            conn.close()
+
+    def claim_crawl_target(self, max_depth: int) -> dict | None:
+        """Атомарно забираем цель с наибольшим весом (не глубже max_depth)."""
+        conn = self._connect(isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                """
+                SELECT * FROM crawl_frontier
+                WHERE status = 'pending' AND depth <= ?
+                ORDER BY score DESC
+                LIMIT 1
+            """,
+                (max_depth,),
+            )
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("COMMIT")
+                return None
+
+            cursor.execute(
+                "UPDATE crawl_frontier SET status = 'visiting' WHERE target = ?",
+                (row["target"],),
+            )
+            cursor.execute("COMMIT")
+            return dict(row)
+        except Exception as e:
+            cursor.execute("ROLLBACK")
+            logging.error(f"❌ Ошибка получения цели краулера: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def finish_crawl_target(
+        self, target: str, status: str, suspicious: int = 0, error: str | None = None
+    ):
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                """
+                UPDATE crawl_frontier
+                SET status = ?, suspicious = ?, error = ?, visited_at = ?
+                WHERE target = ?
+            """,
+                (status, suspicious, error, datetime.now(), target),
+            )
+            conn.commit()
+        except Exception as e:
+            logging.error(f"❌ Ошибка обновления цели краулера: {e}")
+        finally:
+            conn.close()
+
+    def requeue_crawl_targets(self) -> int:
+        """Цели, посещение которых оборвалось (рестарт посреди прохода) – обратно в очередь."""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            "UPDATE crawl_frontier SET status = 'pending' WHERE status = 'visiting'"
+        )
+        count = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return count
+
+    def get_crawl_stats(self, top: int = 20) -> dict:
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT status, COUNT(*) AS n FROM crawl_frontier GROUP BY status")
+        by_status = {row["status"]: row["n"] for row in cursor.fetchall()}
+
+        cursor.execute(
+            """
+            SELECT target, score, depth, via, hits, found_from FROM crawl_frontier
+            WHERE status = 'pending'
+            ORDER BY score DESC LIMIT ?
+        """,
+            (top,),
+        )
+        frontier = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return {"by_status": by_status, "frontier": frontier}
+
+    # =====================================================
+    #  ОЧЕРЕДЬ АЛЕРТОВ (OUTBOX)
+    # =====================================================
+
+    def enqueue_alert(
+        self,
+        channel_key: str,
+        channel_title: str,
+        body: str,
+        preview: str = "",
+        message_key: str | None = None,
+    ):
+        """
+        Кладём алерт в outbox – отправкой займётся AlertSender.
+        Повторный алерт с тем же message_key (другой аккаунт/процесс) не пишется.
+        """
+        if self._forward_write(
+            "enqueue_alert", channel_key, channel_title, body, preview, message_key
+        ):
+            return
+
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            self._write_enqueue_alert(
+                cursor, channel_key, channel_title, body, preview, message_key
+            )
+            conn.commit()
+        except Exception as e:
+            # вызывающий не должен считать сообщение обработанным
+            logging.error(f"❌ Ошибка записи алерта в outbox: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def get_pending_alerts(self, limit: int = 200):
+        """Алерты, которые пора отправлять (по возрастанию id)."""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            SELECT * FROM alert_outbox
+            WHERE status = 'pending' AND next_attempt_ts <= ?
+            ORDER BY id
+            LIMIT ?
+        """,
+            (time.time(), limit),
+        )
+
+        alerts = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return alerts
+
+    def mark_alerts_sent(self, alert_ids: list[int]):
+        if not alert_ids:
+            return
+
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            cursor.executemany(
+                """
+                UPDATE alert_outbox
+                SET status = 'sent', sent_at = ?, attempts = attempts + 1
+                WHERE id = ?
+            """,
+                [(datetime.now(), alert_id) for alert_id in alert_ids],
+            )
+            conn.commit()
+        except Exception as e:
+            logging.error(f"❌ Ошибка обновления outbox: {e}")
+        finally:
+            conn.close()
+
+    def reschedule_alerts(
+        self,
+        alert_ids: list[int],
+        delay: float,
+        error: str = "",
+        max_attempts: int | None = None,
+    ):
+        """
+        Откладываем повторную отправку на delay секунд.
+        После max_attempts неудач алерт помечается как failed.
+        """
+        if not alert_ids:
+            return
+
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            cursor.executemany(
+                """
+                UPDATE alert_outbox
+                SET attempts = attempts + 1,
+                    next_attempt_ts = ?,
+                    last_error = ?,
+                    status = CASE
+                        WHEN ? IS NOT NULL AND attempts + 1 >= ? THEN 'failed'
+                        ELSE status
+                    END
+                WHERE id = ?
+            """,
+                [
+                    (time.time() + delay, error, max_attempts, max_attempts, alert_id)
+                    for alert_id in alert_ids
+                ],
+            )
+            conn.commit()
+        except Exception as e:
+            logging.error(f"❌ Ошибка обновления outbox: {e}")
+        finally:
+            conn.close()
+
+    # =====================================================
+    #  ЗАДАЧИ РУЧНОГО СКАНИРОВАНИЯ
+    # =====================================================
+
+    def create_scan_job(
+        self,
+        identifier: str,
+        priority: int = 0,
+        message_limit: int = 500,
+        mode: str = "recent",
+    ) -> tuple[int, bool]:
+        """
+        Ставит канал в очередь сканирования.
+        Если такой же канал (в том же режиме) уже ждёт или сканируется –
+        новую задачу не создаём,
+        а возвращаем существующую (приоритет поднимаем до большего).
+        Возвращает (job_id, created).
+        """
+        conn = self._connect(isolation_level=None)
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                """
+                SELECT id FROM scan_jobs
+                WHERE identifier = ? AND mode = ?
+                  AND status IN ('queued', 'running')
+                ORDER BY id LIMIT 1
+            """,
+                (identifier, mode),
+            )
+            row = cursor.fetchone()
+
+            if row:
+                job_id = row[0]
+                cursor.execute(
+                    "UPDATE scan_jobs SET priority = MAX(priority, ?) WHERE id = ?",
+                    (priority, job_id),
+                )
+                created = False
+            else:
+                cursor.execute(
+                    """
+                    INSERT INTO scan_jobs (identifier, priority, message_limit, mode)
+                    VALUES (?, ?, ?, ?)
+                """,
+                    (identifier, priority, message_limit, mode),
+                )
+                job_id = cursor.lastrowid
+                created = True
+
+            cursor.execute("COMMIT")
+            return job_id, created
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def claim_scan_job(self, account: str) -> dict | None:
+        """Атомарно забираем самую приоритетную задачу из очереди."""
+        conn = self._connect(isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                """
+                SELECT * FROM scan_jobs
+                WHERE status = 'queued'
+                ORDER BY priority DESC, id
+                LIMIT 1
+            """
+            )
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("COMMIT")
+                return None
+
+            cursor.execute(
+                """
+                UPDATE scan_jobs
+                SET status = 'running', account = ?, started_at = ?
+                WHERE id = ?
+            """,
+                (account, datetime.now(), row["id"]),
+            )
+            cursor.execute("COMMIT")
+
+            job = dict(row)
+            job["status"] = "running"
+            job["account"] = account
+            return job
+        except Exception as e:
+            cursor.execute("ROLLBACK")
+            logging.error(f"❌ Ошибка получения задачи сканирования: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def update_scan_job_progress(self, job_id: int, scanned: int, suspicious: int):
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                "UPDATE scan_jobs SET scanned = ?, suspicious = ? WHERE id = ?",
+                (scanned, suspicious, job_id),
+            )
+            conn.commit()
+        except Exception as e:
+            logging.error(f"❌ Ошибка обновления задачи {job_id}: {e}")
+        finally:
+            conn.close()
+
+    def finish_scan_job(self, job_id: int, result: dict):
+        """Записываем итог manual_scan_chat (ok/error, title, scanned, suspicious)."""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                """
+                UPDATE scan_jobs
+                SET status = CASE WHEN status = 'cancelled' THEN status ELSE ? END,
+                    title = ?, scanned = ?, suspicious = ?,
+                    error = ?, finished_at = ?
+                WHERE id = ?
+            """,
+                (
+                    "done" if result.get("ok") else "failed",
+                    result.get("title"),
+                    result.get("scanned", 0),
+                    result.get("suspicious", 0),
+                    result.get("error"),
+                    datetime.now(),
+                    job_id,
+                ),
+            )
+            conn.commit()
+        except Exception as e:
+            logging.error(f"❌ Ошибка завершения задачи {job_id}: {e}")
+        finally:
+            conn.close()
+
+    def set_scan_job_title(self, job_id: int, title: str):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE scan_jobs SET title = ? WHERE id = ?", (title, job_id))
+        conn.commit()
+        conn.close()
+
+    def requeue_running_scan_jobs(self) -> int:
+        """
+        После рестарта возвращаем «зависшие» running-задачи в очередь.
+        Глубокие сканы с уже нарезанными диапазонами остаются running –
+        их недоделанные диапазоны продолжатся с сохранённого cursor.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            UPDATE scan_jobs SET status = 'queued', account = NULL
+            WHERE status = 'running'
+              AND NOT EXISTS (SELECT 1 FROM scan_ranges r WHERE r.job_id = scan_jobs.id)
+        """
+        )
+        count = cursor.rowcount
+        cursor.execute(
+            "UPDATE scan_ranges SET status = 'pending', account = NULL WHERE status = 'running'"
+        )
+        conn.commit()
+        conn.close()
+        return count
+
+    def cancel_scan_job(self, job_id: int) -> bool:
+        """Отмена задачи: ждущие диапазоны снимаются сразу, идущие – на ближайшем чекпоинте."""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            UPDATE scan_jobs SET status = 'cancelled', finished_at = ?
+            WHERE id = ? AND status IN ('queued', 'running')
+        """,
+            (datetime.now(), job_id),
+        )
+        cancelled = cursor.rowcount > 0
+        cursor.execute(
+            "UPDATE scan_ranges SET status = 'cancelled' WHERE job_id = ? AND status = 'pending'",
+            (job_id,),
+        )
+        conn.commit()
+        conn.close()
+        return cancelled
+
+    # ---------- диапазоны глубокого скана ----------
+
+    def plan_scan_ranges(self, job_id: int, top_message_id: int, range_size: int) -> int:
+        """Режем [1, top_message_id] на диапазоны по range_size id."""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        ranges = []
+        hi = top_message_id
+        while hi >= 1:
+            lo = max(1, hi - range_size + 1)
+            ranges.append((job_id, lo, hi, hi + 1, datetime.now()))
+            hi = lo - 1
+
+        try:
+            cursor.executemany(
+                """
+                INSERT INTO scan_ranges (job_id, lo, hi, cursor, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+                ranges,
+            )
+            cursor.execute(
+                "UPDATE scan_jobs SET top_message_id = ? WHERE id = ?",
+                (top_message_id, job_id),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return len(ranges)
+
+    def claim_scan_range(
+        self, account: str, exclude_job_ids: set[int] | None = None
+    ) -> dict | None:
+        """Забираем свободный диапазон активного глубокого скана."""
+        exclude = sorted(exclude_job_ids or ())
+        placeholders = ",".join("?" * len(exclude))
+        exclude_sql = f"AND r.job_id NOT IN ({placeholders})" if exclude else ""
+
+        conn = self._connect(isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                f"""
+                SELECT r.*, j.identifier, j.priority
+                FROM scan_ranges r
+                JOIN scan_jobs j ON j.id = r.job_id
+                WHERE r.status = 'pending' AND j.status = 'running' {exclude_sql}
+                ORDER BY j.priority DESC, r.job_id, r.hi DESC
+                LIMIT 1
+            """,
+                exclude,
+            )
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("COMMIT")
+                return None
+
+            cursor.execute(
+                """
+                UPDATE scan_ranges SET status = 'running', account = ?, updated_at = ?
+                WHERE id = ?
+            """,
+                (account, datetime.now(), row["id"]),
+            )
+            cursor.execute("COMMIT")
+            return dict(row)
+        except Exception as e:
+            cursor.execute("ROLLBACK")
+            logging.error(f"❌ Ошибка получения диапазона скана: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def checkpoint_scan_range(
+        self, range_id: int, cursor_id: int, scanned: int, suspicious: int
+    ) -> bool:
+        """Сохраняем прогресс диапазона. False – задачу отменили, пора остановиться."""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                """
+                UPDATE scan_ranges
+                SET cursor = ?, scanned = ?, suspicious = ?, updated_at = ?
+                WHERE id = ?
+            """,
+                (cursor_id, scanned, suspicious, datetime.now(), range_id),
+            )
+            cursor.execute(
+                """
+                SELECT j.status FROM scan_jobs j
+                JOIN scan_ranges r ON r.job_id = j.id
+                WHERE r.id = ?
+            """,
+                (range_id,),
+            )
+            row = cursor.fetchone()
+            conn.commit()
+            return bool(row) and row[0] == "running"
+        finally:
+            conn.close()
+
+    def fail_scan_range(self, range_id: int, error: str, max_attempts: int) -> bool:
+        """
+        Ошибка при скане диапазона: +1 попытка. Пока попытки не кончились –
+        диапазон снова в пуле, иначе он failed. True – диапазон провален.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                """
+                UPDATE scan_ranges
+                SET attempts = attempts + 1, last_error = ?, updated_at = ?,
+                    status = CASE WHEN attempts + 1 >= ? THEN status ELSE 'pending' END,
+                    account = CASE WHEN attempts + 1 >= ? THEN account ELSE NULL END
+                WHERE id = ? AND status = 'running'
+                RETURNING attempts
+            """,
+                (error[:500], datetime.now(), max_attempts, max_attempts, range_id),
+            )
+            row = cursor.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+
+        if row is None or row[0] < max_attempts:
+            return False
+        self.finish_scan_range(range_id, "failed")
+        return True
 
-    def setup_database(self):
-        """Инициализация базы данных с нужной структурой."""
-        conn = sqlite3.connect(self.db_name)
+    def release_scan_range(self, range_id: int):
+        """Возвращаем диапазон в пул (аккаунт не видит канал / ошибка)."""
+        conn = self._connect()
         cursor = conn.cursor()
 
-        # Таблица каналов
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS suspicious_channels (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE,
-                title TEXT,
-                participants_count INTEGER DEFAULT 0,
-                kz_phone_ratio REAL DEFAULT 0,
-                risk_score REAL DEFAULT 0,
-                found_via TEXT,
-                description TEXT,
-                channel_type TEXT DEFAULT 'unknown',
-                last_checked TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT TRUE
+            UPDATE scan_ranges SET status = 'pending', account = NULL, updated_at = ?
+            WHERE id = ? AND status = 'running'
+        """,
+            (datetime.now(), range_id),
+        )
+        conn.commit()
+        conn.close()
+
+    def finish_scan_range(self, range_id: int, status: str = "done"):
+        """
+        Закрываем диапазон. Если это был последний – сводим результаты
+        всех диапазонов в саму задачу.
+        """
+        conn = self._connect(isolation_level=None)
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                "UPDATE scan_ranges SET status = ?, updated_at = ? WHERE id = ?",
+                (status, datetime.now(), range_id),
+            )
+            cursor.execute("SELECT job_id FROM scan_ranges WHERE id = ?", (range_id,))
+            job_id = cursor.fetchone()[0]
+
+            cursor.execute(
+                """
+                SELECT
+                    SUM(CASE WHEN status IN ('pending', 'running') THEN 1 ELSE 0 END),
+                    SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END),
+                    COALESCE(SUM(scanned), 0),
+                    COALESCE(SUM(suspicious), 0)
+                FROM scan_ranges WHERE job_id = ?
+            """,
+                (job_id,),
             )
+            open_ranges, failed, scanned, suspicious = cursor.fetchone()
+
+            if not open_ranges:
+                # проваленные диапазоны – вся задача failed (с частичными итогами)
+                cursor.execute(
+                    """
+                    UPDATE scan_jobs
+                    SET status = CASE WHEN status = 'running'
+                                      THEN (CASE WHEN ? THEN 'failed' ELSE 'done' END)
+                                      ELSE status END,
+                        error = CASE WHEN ? THEN ? ELSE error END,
+                        scanned = ?, suspicious = ?,
+                        finished_at = COALESCE(finished_at, ?)
+                    WHERE id = ?
+                """,
+                    (
+                        bool(failed),
+                        bool(failed),
+                        f"Диапазонов с ошибкой: {failed}",
+                        scanned,
+                        suspicious,
+                        datetime.now(),
+                        job_id,
+                    ),
+                )
+            cursor.execute("COMMIT")
+        except Exception as e:
+            cursor.execute("ROLLBACK")
+            logging.error(f"❌ Ошибка завершения диапазона {range_id}: {e}")
+        finally:
+            conn.close()
+
+    def report_scan_unreachable(self, job_id: int, account: str, max_age: float) -> bool:
         """
+        Аккаунт не видит канал глубокого скана. Если канал не видит ни один
+        живой аккаунт парка (account_presence моложе max_age сек), задача
+        failed, а её свободные диапазоны снимаются. True – задача провалена.
+        """
+        conn = self._connect(isolation_level=None)
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                "INSERT OR IGNORE INTO scan_unreachable (job_id, account, reported_at) VALUES (?, ?, ?)",
+                (job_id, account, datetime.now()),
+            )
+            cursor.execute(
+                """
+                SELECT COUNT(*) FROM account_presence p
+                WHERE p.seen_at >= ? AND p.account NOT IN (
+                    SELECT account FROM scan_unreachable WHERE job_id = ?
+                )
+            """,
+                (time.time() - max_age, job_id),
+            )
+            if cursor.fetchone()[0]:
+                cursor.execute("COMMIT")
+                return False
+
+            cursor.execute(
+                """
+                UPDATE scan_jobs
+                SET status = 'failed', error = ?, finished_at = ?
+                WHERE id = ? AND status = 'running'
+            """,
+                ("Канал недоступен ни одному аккаунту", datetime.now(), job_id),
+            )
+            failed = cursor.rowcount > 0
+            cursor.execute(
+                "UPDATE scan_ranges SET status = 'failed' WHERE job_id = ? AND status = 'pending'",
+                (job_id,),
+            )
+            cursor.execute("COMMIT")
+            return failed
+        except Exception as e:
+            cursor.execute("ROLLBACK")
+            logging.error(f"❌ Ошибка отметки недоступного скана {job_id}: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def touch_account_presence(self, accounts: list[str]):
+        """Отмечаем живые (подключённые) аккаунты этого процесса."""
+        if not accounts:
+            return
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO account_presence (account, pid, seen_at) VALUES (?, ?, ?)",
+                [(account, os.getpid(), now) for account in accounts],
+            )
+            conn.commit()
+        except Exception as e:
+            logging.error(f"❌ Ошибка отметки живых аккаунтов: {e}")
+        finally:
+            conn.close()
+
+    def save_shard_members(self, members: dict[str, set[int]]):
+        """Полный список чатов аккаунтов (account -> chat_id) для ShardMap."""
+        if not members:
+            return
+        conn = self._connect()
+        try:
+            for account, chat_ids in members.items():
+                conn.execute("DELETE FROM shard_members WHERE account = ?", (account,))
+                conn.executemany(
+                    "INSERT INTO shard_members (account, chat_id) VALUES (?, ?)",
+                    [(account, chat_id) for chat_id in chat_ids],
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_shard_members(self, max_age: float, exclude=()) -> dict[str, set[int]]:
+        """Чаты живых (account_presence моложе max_age сек) аккаунтов, кроме exclude."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                """
+                SELECT m.account, m.chat_id
+                FROM shard_members m JOIN account_presence p ON p.account = m.account
+                WHERE p.seen_at >= ?
+            """,
+                (time.time() - max_age,),
+            ).fetchall()
+        finally:
+            conn.close()
+
+        exclude = set(exclude)
+        members: dict[str, set[int]] = {}
+        for account, chat_id in rows:
+            if account not in exclude:
+                members.setdefault(account, set()).add(chat_id)
+        return members
+
+    def get_scan_job(self, job_id: int) -> dict | None:
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT * FROM scan_jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            conn.close()
+            return None
+
+        job = dict(row)
+
+        # Для глубокого скана прогресс – сумма по диапазонам
+        cursor.execute(
+            """
+            SELECT COUNT(*) AS total,
+                   SUM(CASE WHEN status = 'done' THEN 1 ELSE 0 END) AS done,
+                   COALESCE(SUM(scanned), 0) AS scanned,
+                   COALESCE(SUM(suspicious), 0) AS suspicious
+            FROM scan_ranges WHERE job_id = ?
+        """,
+            (job_id,),
         )
+        ranges = cursor.fetchone()
+        conn.close()
+
+        if ranges["total"]:
+            job["ranges_total"] = ranges["total"]
+            job["ranges_done"] = ranges["done"] or 0
+            job["scanned"] = ranges["scanned"]
+            job["suspicious"] = ranges["suspicious"]
+
+        return job
+
+    def scan_work_watermark(self) -> tuple | None:
+        """
+        Отпечаток очереди сканов: (число, max id) задач в очереди и
+        (число, последний updated_at) свободных диапазонов. Меняется, когда
+        появилась новая работа; None – работы нет.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
 
-        # Таблица сообщений
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS channel_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_username TEXT,
-                message_text TEXT,
-                contains_drugs BOOLEAN,
-                contains_geo BOOLEAN,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+            SELECT
+                (SELECT COUNT(*) FROM scan_jobs WHERE status = 'queued'),
+                (SELECT MAX(id) FROM scan_jobs WHERE status = 'queued'),
+                (SELECT COUNT(*) FROM scan_ranges WHERE status = 'pending'),
+                (SELECT MAX(updated_at) FROM scan_ranges WHERE status = 'pending')
         """
         )
+        row = cursor.fetchone()
+        conn.close()
+        if not row[0] and not row[2]:
+            return None
+        return tuple(row)
 
-        conn.commit()
+    def get_scan_jobs(self, limit: int = 50):
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT * FROM scan_jobs ORDER BY id DESC LIMIT ?", (limit,))
+        jobs = [dict(row) for row in cursor.fetchall()]
         conn.close()
-        logging.info("✅ База данных готова к использованию")
+        return jobs
 
     # =====================================================
-    #  СОХРАНЕНИЕ ДАННЫХ
+    #  ПЕРИОДИЧЕСКИЕ ЗАДАЧИ (АРЕНДА)
     # =====================================================
 
-    def save_channel(self, channel_data: dict):
-        """Сохранение подозрительного канала."""
-        conn = sqlite3.connect(self.db_name)
+    def acquire_job_lease(
+        self, name: str, owner: str, interval: float, lease_seconds: float
+    ) -> tuple[bool, float]:
+        """
+        Пытаемся взять задачу name в аренду на lease_seconds.
+        Получится, если никто другой её сейчас не держит и с прошлого
+        завершения прошло interval секунд.
+        Возвращает (взяли ли, когда имеет смысл спросить снова – unix ts).
+        """
+        conn = self._connect(isolation_level=None)
         cursor = conn.cursor()
+        now = time.time()
 
         try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                "INSERT OR IGNORE INTO periodic_jobs (name) VALUES (?)", (name,)
+            )
             cursor.execute(
                 """
-                INSERT OR REPLACE INTO suspicious_channels
-                (username, title, participants_count, kz_phone_ratio, risk_score,
-                 found_via, description, channel_type, last_checked)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                SELECT owner, lease_until, last_finished_ts
+                FROM periodic_jobs WHERE name = ?
             """,
-                (
-                    channel_data.get("username"),
-                    channel_data.get("title", "Unknown"),
-                    channel_data.get("participants_count", 0),
-                    channel_data.get("kz_phone_ratio", 0.0),
-                    channel_data.get("risk_score", 0.0),
-                    channel_data.get("found_via", "unknown"),
-                    channel_data.get("description", ""),
-                    channel_data.get("channel_type", "unknown"),
-                    datetime.now(),
-                ),
+                (name,),
+            )
+            holder, lease_until, last_finished_ts = cursor.fetchone()
+
+            if lease_until and lease_until > now and holder != owner:
+                cursor.execute("COMMIT")
+                return False, lease_until
+
+            due = (last_finished_ts or 0) + interval
+            if due > now:
+                cursor.execute("COMMIT")
+                return False, due
+
+            cursor.execute(
+                """
+                UPDATE periodic_jobs
+                SET owner = ?, lease_until = ?, last_started_at = ?, last_status = 'running'
+                WHERE name = ?
+            """,
+                (owner, now + lease_seconds, datetime.now(), name),
             )
+            cursor.execute("COMMIT")
+            return True, now
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def renew_job_lease(self, name: str, owner: str, lease_seconds: float) -> bool:
+        """Продлеваем аренду, пока задача работает. False – аренду уже забрали."""
+        conn = self._connect()
+        cursor = conn.cursor()
 
+        try:
+            cursor.execute(
+                """
+                UPDATE periodic_jobs SET lease_until = ?
+                WHERE name = ? AND owner = ?
+            """,
+                (time.time() + lease_seconds, name, owner),
+            )
             conn.commit()
-            logging.info(f"💾 Канал сохранён: {channel_data.get('title')}")
-        except Exception as e:
-            logging.error(f"❌ Ошибка сохранения канала: {e}")
+            return cursor.rowcount > 0
         finally:
             conn.close()
 
-    def save_message(self, message_data: dict):
-        """Сохранение подозрительного сообщения."""
-        conn = sqlite3.connect(self.db_name)
+    def finish_job_lease(
+        self, name: str, owner: str, duration: float, error: str | None = None
+    ):
+        conn = self._connect()
         cursor = conn.cursor()
 
         try:
             cursor.execute(
                 """
-                INSERT INTO channel_messages
-                (channel_username, message_text, contains_drugs, contains_geo, timestamp)
-                VALUES (?, ?, ?, ?, ?)
+                UPDATE periodic_jobs
+                SET lease_until = NULL,
+                    last_finished_ts = ?,
+                    last_finished_at = ?,
+                    last_duration = ?,
+                    last_status = ?,
+                    last_error = ?,
+                    runs = runs + 1
+                WHERE name = ? AND owner = ?
             """,
                 (
-                    message_data.get("channel_username"),
-                    message_data.get("message_text", ""),
-                    bool(message_data.get("contains_drugs", False)),
-                    bool(message_data.get("contains_geo", False)),
-                    message_data.get("timestamp", datetime.now()),
+                    time.time(),
+                    datetime.now(),
+                    duration,
+                    "failed" if error else "ok",
+                    error,
+                    name,
+                    owner,
                 ),
             )
-
             conn.commit()
-            logging.info(
-                f"💾 Сообщение сохранено (канал={message_data.get('channel_username')})"
+        except Exception as e:
+            logging.error(f"❌ Ошибка сохранения результата задачи {name}: {e}")
+        finally:
+            conn.close()
+
+    def get_periodic_jobs(self):
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT * FROM periodic_jobs ORDER BY name")
+        jobs = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return jobs
+
+    # =====================================================
+    #  ЗДОРОВЬЕ ДОЧЕРНИХ ПРОЦЕССОВ
+    # =====================================================
+
+    def save_process_health(self, rows: list[dict]):
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            cursor.executemany(
+                """
+                INSERT OR REPLACE INTO process_health
+                (group_id, pid, accounts, status, restarts, started_at,
+                 last_heartbeat, payload)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                [
+                    (
+                        row["group_id"],
+                        row.get("pid"),
+                        json.dumps(row.get("accounts", []), ensure_ascii=False),
+                        row.get("status"),
+                        row.get("restarts", 0),
+                        row.get("started_at"),
+                        row.get("last_heartbeat"),
+                        json.dumps(row.get("payload") or {}, ensure_ascii=False),
+                    )
+                    for row in rows
+                ],
             )
+            conn.commit()
         except Exception as e:
-            logging.error(f"❌ Ошибка сохранения сообщения: {e}")
+            logging.error(f"❌ Ошибка сохранения состояния процессов: {e}")
         finally:
             conn.close()
 
+    def get_process_health(self):
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT * FROM process_health ORDER BY group_id")
+        rows = []
+        for row in cursor.fetchall():
+            row_dict = dict(row)
+            row_dict["accounts"] = json.loads(row_dict["accounts"] or "[]")
+            row_dict["payload"] = json.loads(row_dict["payload"] or "{}")
+            rows.append(row_dict)
+        conn.close()
+        return rows
+
     # =====================================================
     #  ЧТЕНИЕ ДАННЫХ ДЛЯ ДАШБОРДА/КАНАЛОВ
     # =====================================================
 
     def get_suspicious_channels(self, limit: int = 50):
         """Получение списка подозрительных каналов."""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
@@ -152,7 +1767,7 @@ class DatabaseManager:
 
     def get_all_channels(self):
         """Получение всех каналов."""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
@@ -169,7 +1784,7 @@ class DatabaseManager:
 
     def get_channels_by_type(self, channel_type: str | None = None):
         """Получение каналов по типу."""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
@@ -197,7 +1812,7 @@ class DatabaseManager:
 
     def get_channel_stats(self):
         """Статистика по типам каналов."""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
@@ -257,7 +1872,7 @@ class DatabaseManager:
         Возвращает список подозрительных сообщений
         (минимум: contains_drugs = 1), с привязкой к каналам.
         """
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
@@ -289,22 +1904,267 @@ class DatabaseManager:
         rows = cursor.fetchall()
         conn.close()
 
-        messages = []
-        for row in rows:
-            row_dict = dict(row)
+        return [self._message_row(row) for row in rows]
+
+    @staticmethod
+    def _message_row(row) -> dict:
+        row_dict = dict(row)
+
+        # собираем триггеры для красивого отображения
+        triggers = []
+        if row_dict.get("contains_drugs"):
+            triggers.append("drugs")
+        if row_dict.get("contains_geo"):
+            triggers.append("kz_geo")
+
+        row_dict["triggers"] = ", ".join(triggers)
+        # если risk_score нет (канал ещё не в suspicious_channels) – ставим 0
+        if row_dict.get("risk_score") is None:
+            row_dict["risk_score"] = 0.0
+
+        return row_dict
+
+    # =====================================================
+    #  АГРЕГАТЫ ДЛЯ ГРАФИКОВ (/api/timeseries)
+    # =====================================================
+    # Бакеты – в том же времени, что и channel_messages.timestamp.
+    # dimension: total (key = ""), channel, trigger, found_via.
+
+    # период -> (длина префикса timestamp, суффикс бакета)
+    ROLLUP_PERIODS = {
+        "hour": (13, ":00"),  # 2024-05-01 13:00
+        "day": (10, ""),  # 2024-05-01
+    }
+    ROLLUP_DIMENSIONS = ("total", "channel", "trigger", "found_via")
+
+    def _write_rollup(self, cursor, message_data: dict):
+        ts = message_data.get("timestamp") or datetime.now()
+        if isinstance(ts, str):
+            ts = datetime.fromisoformat(ts)
+
+        # ключевые слова из анализа; если их не передали – флаги сообщения
+        triggers = set(message_data.get("triggers") or [])
+        if not triggers:
+            triggers.add("drugs")
+            if message_data.get("contains_geo"):
+                triggers.add("kz_geo")
+
+        keys = [("total", ""), ("found_via", message_data.get("found_via") or "unknown")]
+        keys.append(("channel", message_data.get("channel_username") or "unknown"))
+        keys.extend(("trigger", trigger) for trigger in sorted(triggers))
+
+        rows = []
+        for period, (width, suffix) in self.ROLLUP_PERIODS.items():
+            bucket = str(ts)[:width] + suffix
+            rows.extend((period, dimension, key, bucket) for dimension, key in keys)
 
-            # собираем триггеры для красивого отображения
-            triggers = []
-            if row_dict.get("contains_drugs"):
-                triggers.append("drugs")
-            if row_dict.get("contains_geo"):
-                triggers.append("kz_geo")
+        cursor.executemany(
+            """
+            INSERT INTO activity_rollup (period, dimension, key, bucket, count)
+            VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT(period, dimension, key, bucket) DO UPDATE SET
+                count = count + 1
+        """,
+            rows,
+        )
+
+    def _backfill_rollup(self, cursor):
+        """Разовое заполнение по уже накопленным сообщениям (при появлении таблицы)."""
+        cursor.execute("SELECT COUNT(*) FROM channel_messages WHERE contains_drugs = 1")
+        if not cursor.fetchone()[0]:
+            return
+        logging.info("📊 Заполнение агрегатов активности по истории сообщений...")
+
+        # ключевых слов в истории нет – триггеры по флагам; found_via – по каналу
+        sources = [
+            ("total", "''", ""),
+            ("channel", "COALESCE(m.channel_username, 'unknown')", ""),
+            ("found_via", "COALESCE(c.found_via, 'unknown')", ""),
+            ("trigger", "'drugs'", ""),
+            ("trigger", "'kz_geo'", " AND m.contains_geo = 1"),
+        ]
+        for period, (width, suffix) in self.ROLLUP_PERIODS.items():
+            bucket_sql = f"substr(m.timestamp, 1, {width}) || '{suffix}'"
+            for dimension, key_sql, extra_filter in sources:
+                cursor.execute(
+                    f"""
+                    INSERT INTO activity_rollup (period, dimension, key, bucket, count)
+                    SELECT ?, ?, {key_sql}, {bucket_sql}, COUNT(*)
+                    FROM channel_messages m
+                    LEFT JOIN suspicious_channels c ON c.username = m.channel_username
+                    WHERE m.contains_drugs = 1{extra_filter}
+                    GROUP BY 3, 4
+                    ON CONFLICT(period, dimension, key, bucket) DO UPDATE SET
+                        count = count + excluded.count
+                """,
+                    (period, dimension),
+                )
+
+    def get_timeseries(
+        self,
+        period: str = "day",
+        dimension: str = "total",
+        since: str | None = None,
+        until: str | None = None,
+        keys: list[str] | None = None,
+        top: int = 10,
+    ) -> dict:
+        """
+        Ряды {key: [[bucket, count], ...]} за интервал [since, until).
+        Без keys – top ключей с наибольшей суммой за интервал.
+        """
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+
+            where = "period = ? AND dimension = ?"
+            params: list = [period, dimension]
+            if since:
+                where += " AND bucket >= ?"
+                params.append(since)
+            if until:
+                where += " AND bucket < ?"
+                params.append(until)
+
+            if not keys:
+                cursor.execute(
+                    f"""
+                    SELECT key FROM activity_rollup
+                    WHERE {where}
+                    GROUP BY key
+                    ORDER BY SUM(count) DESC
+                    LIMIT ?
+                """,
+                    (*params, top),
+                )
+                keys = [row[0] for row in cursor.fetchall()]
+
+            series: dict[str, list] = {key: [] for key in keys}
+            if keys:
+                cursor.execute(
+                    f"""
+                    SELECT key, bucket, count FROM activity_rollup
+                    WHERE {where} AND key IN ({', '.join('?' for _ in keys)})
+                    ORDER BY bucket
+                """,
+                    (*params, *keys),
+                )
+                for key, bucket, count in cursor.fetchall():
+                    series[key].append([bucket, count])
+
+            return {"period": period, "dimension": dimension, "series": series}
+        finally:
+            conn.close()
+
+    # =====================================================
+    #  ВЫГРУЗКА (/api/export)
+    # =====================================================
+    # Выгрузка идёт пачками по id (keyset): каждая пачка – отдельный короткий
+    # запрос, долгая читающая транзакция не держит WAL от чекпоинта.
+
+    # вид -> (таблица, колонка канала, колонка времени)
+    EXPORT_TABLES = {
+        "channels": ("suspicious_channels", "username", "last_checked"),
+        "messages": ("channel_messages", "channel_username", "timestamp"),
+    }
+
+    def get_export_batch(
+        self,
+        kind: str,
+        after_id: int,
+        limit: int = 1000,
+        since: str | None = None,
+        until: str | None = None,
+        channels: list[str] | None = None,
+    ) -> tuple[list[str], list[tuple]]:
+        """Следующая пачка строк после after_id: (имена колонок, строки). id – первая колонка."""
+        table, channel_column, time_column = self.EXPORT_TABLES[kind]
+
+        sql = f"SELECT * FROM {table} WHERE id > ?"
+        params: list = [after_id]
+
+        if since:
+            sql += f" AND {time_column} >= ?"
+            params.append(since)
+        if until:
+            sql += f" AND {time_column} < ?"
+            params.append(until)
+        if channels:
+            sql += f" AND {channel_column} IN ({', '.join('?' for _ in channels)})"
+            params.extend(channels)
+
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit)
 
-            row_dict["triggers"] = ", ".join(triggers)
-            # если risk_score нет (канал ещё не в suspicious_channels) – ставим 0
-            if row_dict.get("risk_score") is None:
-                row_dict["risk_score"] = 0.0
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, tuple(params))
+            columns = [col[0] for col in cursor.description]
+            return columns, cursor.fetchall()
+        finally:
+            conn.close()
+
+    # =====================================================
+    #  ИЗМЕНЕНИЯ ДЛЯ ЖИВОГО ДАШБОРДА (/api/events)
+    # =====================================================
+    # Работают на переданном соединении: LiveEvents держит одно открытое,
+    # чтобы PRAGMA data_version показывал чужие коммиты.
+
+    @staticmethod
+    def get_last_ids(conn: sqlite3.Connection) -> tuple[int, int]:
+        """(max id сообщения, max id канала). INSERT OR REPLACE канала даёт новый id."""
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT
+                (SELECT COALESCE(MAX(id), 0) FROM channel_messages),
+                (SELECT COALESCE(MAX(id), 0) FROM suspicious_channels)
+        """
+        )
+        return tuple(cursor.fetchone())
 
-            messages.append(row_dict)
+    @classmethod
+    def get_messages_after(
+        cls, conn: sqlite3.Connection, last_id: int, limit: int = 200
+    ) -> list[dict]:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT
+                m.id,
+                m.channel_username,
+                m.message_text,
+                m.contains_drugs,
+                m.contains_geo,
+                m.timestamp,
+                c.title AS channel_title,
+                c.risk_score
+            FROM channel_messages m
+            LEFT JOIN suspicious_channels c
+                ON m.channel_username = c.username
+            WHERE m.id > ? AND m.contains_drugs = 1
+            ORDER BY m.id
+            LIMIT ?
+        """,
+            (last_id, limit),
+        )
+        return [cls._message_row(row) for row in cursor.fetchall()]
 
-        return messages
+    @staticmethod
+    def get_channels_after(
+        conn: sqlite3.Connection, last_id: int, limit: int = 200
+    ) -> list[dict]:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT * FROM suspicious_channels
+            WHERE id > ? AND is_active = TRUE
+            ORDER BY id
+            LIMIT ?
+        """,
+            (last_id, limit),
+        )
+        return [dict(row) for row in cursor.fetchall()]
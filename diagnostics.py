@@ -0,0 +1,185 @@
+import asyncio
+import linecache
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Event loop'ы процесса по имени (монитор, веб) – для подсчёта задач
+LOOPS: dict[str, asyncio.AbstractEventLoop] = {}
+
+_profile_lock = threading.Lock()
+
+
+def register_loop(name: str, loop: asyncio.AbstractEventLoop | None = None):
+    LOOPS[name] = loop or asyncio.get_running_loop()
+
+
+# ======================================================
+#   СЭМПЛИРУЮЩИЙ ПРОФАЙЛЕР
+# ======================================================
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> str:
+    """
+    Раз в interval снимает стеки всех потоков (sys._current_frames) в течение
+    seconds секунд. Процесс не останавливается и ничего не инструментируется:
+    цена – один проход по кадрам за сэмпл в потоке профайлера.
+
+    Результат – collapsed stacks: «поток;внешняя функция;...;внутренняя N»
+    по строке на стек, формат flamegraph.pl / speedscope.
+    Запускать в отдельном потоке (asyncio.to_thread). RuntimeError – если
+    профилирование уже идёт.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("profiling already in progress")
+
+    try:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + seconds
+
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    finally:
+        _profile_lock.release()
+
+
+# ======================================================
+#   ПАМЯТЬ (tracemalloc)
+# ======================================================
+
+
+class MemorySnapshots:
+    """Снимки tracemalloc по номерам и разница между ними (хранятся последние keep)."""
+
+    def __init__(self, keep: int = 5):
+        self.keep = keep
+        self._snapshots: dict[int, tuple[float, tracemalloc.Snapshot]] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def start(self, frames: int = 10) -> dict:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        return self.status()
+
+    def stop(self) -> dict:
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+        return self.status()
+
+    def status(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "traced_mb": round(current / 2**20, 2),
+            "peak_mb": round(peak / 2**20, 2),
+            "snapshots": sorted(self._snapshots),
+        }
+
+    def take(self) -> dict:
+        """Снимок без служебных кадров tracemalloc. Долгий на большом heap – вызывать в потоке."""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not started")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, linecache.__file__),
+            ]
+        )
+        with self._lock:
+            snap_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snap_id] = (time.time(), snapshot)
+            while len(self._snapshots) > self.keep:
+                del self._snapshots[min(self._snapshots)]
+
+        total = sum(stat.size for stat in snapshot.statistics("filename"))
+        return {"id": snap_id, "size_mb": round(total / 2**20, 2)}
+
+    def diff(self, base: int, current: int, top: int = 30, key_type: str = "lineno") -> dict:
+        """Что выросло между снимками base и current. KeyError – нет такого снимка."""
+        with self._lock:
+            base_ts, base_snap = self._snapshots[base]
+            cur_ts, cur_snap = self._snapshots[current]
+
+        stats = cur_snap.compare_to(base_snap, key_type)
+        return {
+            "base": base,
+            "current": current,
+            "seconds": round(cur_ts - base_ts, 1),
+            "total_diff_kb": round(sum(s.size_diff for s in stats) / 1024, 1),
+            "top": [
+                {
+                    "where": str(stat.traceback),
+                    "size_kb": round(stat.size / 1024, 1),
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "count": stat.count,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in stats[:top]
+            ],
+        }
+
+
+memory_snapshots = MemorySnapshots()
+
+
+# ======================================================
+#   ЗАДАЧИ ASYNCIO
+# ======================================================
+
+
+def _task_label(task: asyncio.Task) -> str:
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", None) or type(coro).__name__
+
+
+def task_counts(extra_loops: dict | None = None) -> dict:
+    """
+    Число незавершённых задач по корутинам для каждого loop'а.
+    Чужой loop читаем из этого потока: all_tasks() может упасть, если
+    набор задач меняется прямо сейчас – тогда пробуем ещё раз.
+    """
+    loops = dict(LOOPS)
+    loops.update(extra_loops or {})
+
+    result = {}
+    for name, loop in loops.items():
+        if loop.is_closed():
+            continue
+        for _ in range(5):
+            try:
+                tasks = asyncio.all_tasks(loop)
+                break
+            except RuntimeError:
+                continue
+        else:
+            result[name] = {"error": "task set kept changing"}
+            continue
+
+        counts = Counter(_task_label(task) for task in tasks)
+        result[name] = {"total": len(tasks), "by_coroutine": dict(counts.most_common())}
+    return result
@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from read_pool import ReadPool
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+}
+
+
+def parse_export_time(value: str | None) -> str | None:
+    """
+    Граница интервала из запроса (ISO: 2024-05-01 или 2024-05-01T12:00)
+    в формат, в котором sqlite3 хранит datetime – строки сравниваются как есть.
+    ValueError – если дата не разбирается.
+    """
+    if not value:
+        return None
+    return str(datetime.fromisoformat(value))
+
+
+def _encode_batch(fmt: str, columns: list[str], rows: list[tuple], header: bool) -> bytes:
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if header:
+            writer.writerow(columns)
+        writer.writerows(rows)
+        return buf.getvalue().encode()
+
+    return "".join(
+        json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + "\n"
+        for row in rows
+    ).encode()
+
+
+async def stream_export(
+    reads: ReadPool,
+    kind: str,
+    fmt: str = "ndjson",
+    compress: bool = False,
+    since: str | None = None,
+    until: str | None = None,
+    channels: list[str] | None = None,
+    batch: int = 1000,
+):
+    """
+    Асинхронный генератор тела выгрузки для StreamingResponse.
+
+    В памяти одновременно только одна пачка строк (и её сжатый кусок),
+    поэтому расход памяти не зависит от размера выгрузки. Пачки читаются
+    через ReadPool (медленная полоса) – event loop не блокируется, а
+    дашборд не ждёт за выгрузкой.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # 31 – формат gzip
+    after_id = 0
+    header = True
+
+    while True:
+        columns, rows = await reads.call(
+            reads.db.get_export_batch,
+            kind,
+            after_id,
+            batch,
+            since,
+            until,
+            channels,
+            lane="slow",
+        )
+        if not rows:
+            break
+        after_id = rows[-1][0]
+
+        chunk = _encode_batch(fmt, columns, rows, header)
+        header = False
+
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+
+        if len(rows) < batch:
+            break
+
+    if compressor is not None:
+        yield compressor.flush()
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from metrics import Gauge
+
+
+# Что делать, когда очередь стадии переполнена:
+#   block       – ждать места (backpressure на предыдущую стадию / апдейты Telethon)
+#   drop_new    – выкинуть новый элемент
+#   drop_oldest – выкинуть самый старый элемент из очереди
+#   spill       – отложить в overflow-буфер, он дочитывается по мере освобождения
+OVERFLOW_POLICIES = ("block", "drop_new", "drop_oldest", "spill")
+
+# Все живые пайплайны процесса (по имени аккаунта) – для /api/pipeline
+PIPELINES: dict[str, "IngestPipeline"] = {}
+
+PIPELINE_QUEUE_DEPTH = Gauge(
+    "kz_pipeline_queue_depth",
+    "Items waiting in a pipeline stage (queue + spill)",
+    ("account", "stage"),
+    collect_fn=lambda: [
+        ((name, stage.name), stage.queue.qsize() + len(stage.spill))
+        for name, pipeline in list(PIPELINES.items())
+        for stage in pipeline.stages
+    ],
+)
+
+
+class PipelineStage:
+    """
+    Одна стадия пайплайна: ограниченная asyncio-очередь + N воркеров.
+    Результат обработчика (если не None) уходит в следующую стадию.
+    on_drop(item) вызывается для элемента, который не дошёл до конца стадии:
+    выкинут при переполнении или обработчик упал с ошибкой.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[object], Awaitable[object]],
+        workers: int = 1,
+        maxsize: int = 1000,
+        policy: str = "block",
+        spill_limit: Optional[int] = None,
+        on_drop: Optional[Callable[[object], None]] = None,
+    ):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {policy}")
+
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.policy = policy
+        self.on_drop = on_drop
+
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.spill: deque = deque()
+        self.spill_limit = spill_limit if spill_limit is not None else maxsize * 10
+
+        self.next_stage: Optional["PipelineStage"] = None
+        self._tasks: list[asyncio.Task] = []
+
+        # счётчики
+        self.accepted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.errors = 0
+
+        # латентность: время в очереди и время обработки
+        self._wait_total = 0.0
+        self._work_total = 0.0
+        self._work_max = 0.0
+
+    # ---------- приём элементов ----------
+
+    async def put(self, item):
+        entry = (time.perf_counter(), item)
+        self.accepted += 1
+
+        if self.policy == "block":
+            await self.queue.put(entry)
+            return
+
+        if not self.spill:
+            try:
+                self.queue.put_nowait(entry)
+                return
+            except asyncio.QueueFull:
+                pass
+
+        if self.policy == "drop_new":
+            self._drop(item)
+        elif self.policy == "drop_oldest":
+            try:
+                _, oldest = self.queue.get_nowait()
+                self.queue.task_done()
+                self._drop(oldest)
+            except asyncio.QueueEmpty:
+                pass
+            self.queue.put_nowait(entry)
+        else:  # spill
+            if len(self.spill) >= self.spill_limit:
+                self._drop(item)
+                return
+            self.spill.append(entry)
+            self.spilled += 1
+
+    def _drop(self, item):
+        self.dropped += 1
+        self._notify_drop(item)
+
+    def _notify_drop(self, item):
+        if self.on_drop is None:
+            return
+        try:
+            self.on_drop(item)
+        except Exception as e:
+            logging.error(f"Pipeline stage {self.name!r} on_drop error: {e}")
+
+    def _refill_from_spill(self):
+        while self.spill and not self.queue.full():
+            self.queue.put_nowait(self.spill.popleft())
+
+    # ---------- воркеры ----------
+
+    def start(self):
+        for i in range(self.workers):
+            self._tasks.append(
+                asyncio.create_task(self._worker(), name=f"pipeline-{self.name}-{i}")
+            )
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _worker(self):
+        while True:
+            enqueued_at, item = await self.queue.get()
+            started = time.perf_counter()
+            self._wait_total += started - enqueued_at
+
+            result = None
+            try:
+                result = await self.handler(item)
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Pipeline stage {self.name!r} error: {e}")
+                self._notify_drop(item)
+            finally:
+                elapsed = time.perf_counter() - started
+                self._work_total += elapsed
+                self._work_max = max(self._work_max, elapsed)
+                self.processed += 1
+                self.queue.task_done()
+                self._refill_from_spill()
+
+            if result is not None and self.next_stage is not None:
+                await self.next_stage.put(result)
+
+    # ---------- статистика ----------
+
+    def stats(self) -> dict:
+        done = self.processed or 1
+        return {
+            "workers": self.workers,
+            "policy": self.policy,
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "spill_depth": len(self.spill),
+            "accepted": self.accepted,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "errors": self.errors,
+            "avg_wait_ms": round(self._wait_total / done * 1000, 3),
+            "avg_latency_ms": round(self._work_total / done * 1000, 3),
+            "max_latency_ms": round(self._work_max * 1000, 3),
+        }
+
+
+class IngestPipeline:
+    """
+    Цепочка стадий ingest -> analysis -> persist -> alert.
+    Живой обработчик только кладёт событие в первую стадию и сразу возвращается,
+    так что медленный алерт или профилирование канала не тормозят апдейты.
+    """
+
+    def __init__(self, name: str, stages: list[PipelineStage]):
+        self.name = name
+        self.stages = stages
+
+        for current, nxt in zip(stages, stages[1:]):
+            current.next_stage = nxt
+
+    async def submit(self, item):
+        await self.stages[0].put(item)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        PIPELINES[self.name] = self
+        logging.info(
+            f"✅ Ingest pipeline [{self.name}] started: "
+            + ", ".join(f"{s.name}x{s.workers}" for s in self.stages)
+        )
+
+    async def stop(self):
+        for stage in self.stages:
+            await stage.stop()
+        PIPELINES.pop(self.name, None)
+
+    def stats(self) -> dict:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+
+def all_pipeline_stats() -> dict:
+    return {name: p.stats() for name, p in list(PIPELINES.items())}
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+
+from database_manager import DatabaseManager
+
+
+class JobScheduler:
+    """
+    Периодические задачи (поиск через ботов, discovery) – один запуск на весь
+    парк процессов, а не по разу на каждый аккаунт.
+
+    Кто выполняет задачу, решает аренда в таблице periodic_jobs: её берёт
+    тот, кто первым пришёл после истечения интервала, и продлевает, пока
+    работает. Если процесс умер, аренда истекает и задачу забирает другой.
+    Старты разнесены случайным jitter'ом, чтобы не стартовать в одну секунду.
+    """
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        owner: str | None = None,
+        jitter: float = 120,
+        lease_seconds: float = 300,
+    ):
+        self.db = db
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.jitter = jitter
+        self.lease_seconds = lease_seconds
+
+        self.jobs: dict[str, dict] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def add(self, name: str, func, interval: float, jitter: float | None = None):
+        """func – корутинная функция без аргументов."""
+        self.jobs[name] = {
+            "name": name,
+            "func": func,
+            "interval": interval,
+            "jitter": self.jitter if jitter is None else jitter,
+        }
+
+    def start(self):
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._loop(job)))
+        logging.info(f"⏰ Job scheduler started: {', '.join(self.jobs)}")
+
+    # ======================================================
+    #   ЦИКЛ ЗАДАЧИ
+    # ======================================================
+
+    async def _loop(self, job: dict):
+        await asyncio.sleep(random.uniform(0, job["jitter"]))
+
+        while True:
+            try:
+                acquired, next_ts = await asyncio.to_thread(
+                    self.db.acquire_job_lease,
+                    job["name"],
+                    self.owner,
+                    job["interval"],
+                    self.lease_seconds,
+                )
+            except Exception as e:
+                logging.error(f"Job lease error ({job['name']}): {e}")
+                acquired, next_ts = False, time.time() + 60
+
+            if acquired:
+                await self._run(job)
+                next_ts = time.time() + job["interval"]
+
+            delay = max(1.0, next_ts - time.time()) + random.uniform(0, job["jitter"])
+            await asyncio.sleep(delay)
+
+    async def _run(self, job: dict):
+        logging.info(f"⏰ Job {job['name']} started ({self.owner})")
+        started = time.monotonic()
+        work = asyncio.create_task(job["func"](), name=f"job:{job['name']}")
+        renew = asyncio.create_task(self._renew(job, work))
+        error = None
+
+        try:
+            await work
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                # отменили сам планировщик – останавливаем и задачу
+                work.cancel()
+                raise
+            if renew.done() and not renew.cancelled():
+                # аренду перехватил другой процесс – _renew остановил задачу
+                error = "lease lost"
+            else:
+                # CancelledError изнутри задачи (таймаут, обрыв Telethon) –
+                # обычная ошибка запуска, цикл задачи продолжается
+                error = "cancelled"
+                logging.error(f"Job {job['name']} error: cancelled")
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logging.error(f"Job {job['name']} error: {e}")
+        finally:
+            renew.cancel()
+
+        duration = time.monotonic() - started
+        try:
+            await asyncio.to_thread(
+                self.db.finish_job_lease, job["name"], self.owner, duration, error
+            )
+        except Exception as e:
+            logging.error(f"Job lease finish error ({job['name']}): {e}")
+        logging.info(f"⏰ Job {job['name']} finished in {duration:.1f}s")
+
+    async def _renew(self, job: dict, work: asyncio.Task):
+        """Продлеваем аренду; потеряли её – отменяем задачу, чтобы не было второго запуска."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await asyncio.to_thread(
+                    self.db.renew_job_lease, job["name"], self.owner, self.lease_seconds
+                )
+                if not renewed:
+                    logging.warning(f"⏰ Job {job['name']}: lease lost, cancelling")
+                    work.cancel()
+                    return
+            except Exception as e:
+                logging.error(f"Job lease renew error ({job['name']}): {e}")
@@ -1,5 +1,7 @@
 import re
 
+from metrics import ANALYZE_SECONDS
+
 
 class KeywordManager:
     def __init__(self):
@@ -267,6 +269,10 @@ class KeywordManager:
     # ==========================
 
     def analyze_text(self, text: str):
+        with ANALYZE_SECONDS.time():
+            return self._analyze_text(text)
+
+    def _analyze_text(self, text: str):
         """
         Главная функция анализа.
         ЛЮБОЕ найденное "сильное" наркотическое слово => is_suspicious = True.
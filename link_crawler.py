@@ -0,0 +1,201 @@
+import asyncio
+import itertools
+import logging
+import re
+
+from telethon.tl.types import User
+from telethon.utils import get_peer_id
+
+from database_manager import DatabaseManager
+from keyword_manager import KeywordManager
+from scan_tasks import normalize_identifier
+
+# Вес источника: ссылка в подозрительном сообщении надёжнее упоминания
+SOURCE_SCORES = {
+    "link": 1.0,
+    "forward": 0.8,
+    "mention": 0.5,
+}
+# На каждом шаге вглубь вес падает вдвое
+DEPTH_DECAY = 0.5
+
+_MENTION_RE = re.compile(r"(?<![\w.@/])@([A-Za-z]\w{4,31})")
+# t.me/joinchat/..., t.me/+..., t.me/s/... – не username
+_NOT_USERNAMES = {"joinchat", "addstickers", "share", "proxy", "socks", "s", "c"}
+
+
+def _valid_username(username: str) -> bool:
+    if not username or username.lower() in _NOT_USERNAMES:
+        return False
+    # ботов не обходим: get_messages по боту – это наша же переписка с ним
+    if username.lower().endswith("bot"):
+        return False
+    return re.fullmatch(r"[A-Za-z]\w{4,31}", username) is not None
+
+
+def harvest_targets(
+    keywords: KeywordManager,
+    text: str,
+    message=None,
+    depth: int = 0,
+    found_from: str | None = None,
+) -> list[tuple]:
+    """
+    Кандидаты во фронтир из подозрительного сообщения:
+    ссылки t.me/..., заголовок «переслано из» и @упоминания.
+    Возвращает [(target, score, depth, found_from, via)].
+    """
+    weight = DEPTH_DECAY**depth
+    targets: dict[str, tuple] = {}
+
+    def add(target: str, via: str):
+        score = SOURCE_SCORES[via] * weight
+        if target not in targets or targets[target][1] < score:
+            targets[target] = (target, score, depth, found_from, via)
+
+    for link in keywords.extract_links(text):
+        username = normalize_identifier(link)
+        if _valid_username(username):
+            add(username.lower(), "link")
+
+    for username in _MENTION_RE.findall(text or ""):
+        if _valid_username(username):
+            add(username.lower(), "mention")
+
+    fwd = getattr(message, "fwd_from", None) if message is not None else None
+    if fwd is not None and getattr(fwd, "from_id", None) is not None:
+        chat = getattr(getattr(message, "forward", None), "chat", None)
+        username = getattr(chat, "username", None)
+        if username and _valid_username(username):
+            add(username.lower(), "forward")
+        elif not isinstance(chat, User):
+            # без username – по id (get_entity сработает, если entity в кеше сессии)
+            try:
+                add(f"id:{get_peer_id(fwd.from_id)}", "forward")
+            except Exception:
+                pass
+
+    return list(targets.values())
+
+
+class LinkCrawler:
+    """
+    Обход графа ссылок от подозрительных сообщений.
+
+    Фронтир и множество посещённых живут в таблице crawl_frontier:
+    TelegramMonitor складывает туда ссылки, пересылки и упоминания из каждого
+    подозрительного сообщения, вес одной цели растёт с каждым новым упоминанием.
+    Проход (периодическая задача JobScheduler) забирает цели по убыванию веса,
+    читает последние сообщения и из подозрительных добавляет цели следующего
+    уровня. Ограничения: max_depth, budget посещений за проход и concurrency
+    одновременных посещений.
+    """
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        keywords: KeywordManager,
+        monitors,
+        max_depth: int = 2,
+        budget: int = 50,
+        concurrency: int = 3,
+        fetch_limit: int = 30,
+    ):
+        self.db = db
+        self.keywords = keywords
+        # функция без аргументов -> список TelegramMonitor подключённых аккаунтов
+        self.monitors = monitors
+        self.max_depth = max_depth
+        self.budget = budget
+        self.concurrency = concurrency
+        self.fetch_limit = fetch_limit
+
+        self._rr = itertools.count()
+
+    async def crawl(self) -> dict:
+        """Один проход: не больше budget посещений."""
+        requeued = self.db.requeue_crawl_targets()
+        if requeued:
+            logging.info(f"🕸️ Requeued {requeued} interrupted crawl targets")
+
+        result = {"visited": 0, "suspicious": 0, "failed": 0}
+        active = 0
+
+        async def worker():
+            nonlocal active
+            while result["visited"] < self.budget:
+                monitors = self.monitors()
+                if not monitors:
+                    return
+
+                target = self.db.claim_crawl_target(self.max_depth)
+                if target is None:
+                    # фронтир пуст, но соседние воркеры ещё могут добавить цели
+                    if active:
+                        await asyncio.sleep(0.5)
+                        continue
+                    return
+                result["visited"] += 1
+
+                tm = monitors[next(self._rr) % len(monitors)]
+                active += 1
+                try:
+                    status, suspicious = await self._visit(tm, target)
+                    self.db.finish_crawl_target(target["target"], status, suspicious)
+                    result["suspicious"] += suspicious
+                except Exception as e:
+                    result["failed"] += 1
+                    self.db.finish_crawl_target(target["target"], "failed", 0, str(e))
+                finally:
+                    active -= 1
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+        logging.info(
+            f"🕸️ Crawl pass done: visited {result['visited']}, "
+            f"suspicious messages {result['suspicious']}, failed {result['failed']}"
+        )
+        return result
+
+    async def _visit(self, tm, target: dict) -> tuple[str, int]:
+        ident = target["target"]
+        lookup = int(ident[3:]) if ident.startswith("id:") else ident
+
+        entity = await tm.rpc.call(tm.client.get_entity, lookup, priority="discovery")
+        if isinstance(entity, User):
+            return "skipped", 0
+
+        # аккаунт в чате уже состоит – его читают live/poller
+        if get_peer_id(entity) in tm.dialogs or tm._is_alert_entity(entity):
+            return "known", 0
+
+        messages = await tm.rpc.call(
+            tm.client.get_messages, entity, limit=self.fetch_limit, priority="discovery"
+        )
+
+        next_depth = target["depth"] + 1
+        suspicious = 0
+        for message in messages or []:
+            if not message or not message.message:
+                continue
+
+            analysis = tm.analyze_text(message.message, "crawler")
+            if not analysis.get("is_suspicious"):
+                continue
+
+            suspicious += 1
+            await tm._process_text_for_entity(
+                entity=entity,
+                text=message.message,
+                source="crawler",
+                analysis=analysis,
+                message_id=message.id,
+                message=message,
+                crawl_depth=next_depth if next_depth <= self.max_depth else None,
+            )
+
+        logging.info(
+            f"🕸️ Crawled {ident} (depth {target['depth']}, score {target['score']:.2f}): "
+            f"{suspicious} suspicious"
+        )
+        return "visited", suspicious
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+
+from database_manager import DatabaseManager
+
+
+class LiveEvents:
+    """
+    События для дашборда (SSE /api/events): новые подозрительные сообщения,
+    новые/обновлённые каналы и изменившаяся статистика.
+
+    Один таск на веб-процесс смотрит в БД и раздаёт изменения всем
+    подписчикам, поэтому нагрузка на БД зависит от числа событий, а не от
+    числа открытых вкладок. Пока никто не писал, проверка стоит один
+    PRAGMA data_version; без подписчиков таск не работает вовсе.
+    Через БД – потому что писать может и этот процесс, и другой
+    (WEB_MODE=process, RUN_MODE=supervisor).
+    """
+
+    def __init__(self, db: DatabaseManager, interval: float = 1.0, queue_size: int = 500):
+        self.db = db
+        self.interval = interval
+        self.queue_size = queue_size
+        self.batch = 200
+
+        self._subscribers: set[asyncio.Queue] = set()
+        self._task: asyncio.Task | None = None
+
+        self._conn = None
+        self._data_version = None
+        self._last_message_id = 0
+        self._last_channel_id = 0
+        self._last_stats = None
+
+    # ======================================================
+    #   ПОДПИСЧИКИ
+    # ======================================================
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event: dict):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # вкладка не успевает – выкидываем накопленное, пусть перечитает всё
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync", "data": {}})
+
+    # ======================================================
+    #   ХВОСТ БД
+    # ======================================================
+
+    async def run(self):
+        try:
+            while self._subscribers:
+                try:
+                    events = await asyncio.to_thread(self._poll)
+                except Exception as e:
+                    logging.error(f"Live events poll error: {e}")
+                    self._close()
+                    events = []
+
+                for event in events:
+                    self.publish(event)
+                await asyncio.sleep(self.interval)
+        finally:
+            # без await: новый subscribe() не должен застать таск «почти завершённым»
+            self._close()
+
+    def _poll(self) -> list[dict]:
+        if self._conn is None:
+            # одно долгоживущее соединение: data_version меняется только от чужих коммитов
+            self._conn = self.db._connect(check_same_thread=False)
+            self._data_version = None
+            self._last_message_id, self._last_channel_id = self.db.get_last_ids(self._conn)
+
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return []
+        self._data_version = version
+
+        events = []
+
+        messages = self.db.get_messages_after(self._conn, self._last_message_id, self.batch)
+        if messages:
+            self._last_message_id = messages[-1]["id"]
+            events.extend({"type": "message", "data": m} for m in messages)
+
+        channels = self.db.get_channels_after(self._conn, self._last_channel_id, self.batch)
+        if channels:
+            self._last_channel_id = channels[-1]["id"]
+            events.extend({"type": "channel", "data": c} for c in channels)
+
+        # не всё влезло в пачку – в следующий раз читаем дальше, даже без новых коммитов
+        if len(messages) == self.batch or len(channels) == self.batch:
+            self._data_version = None
+
+        if channels or self._last_stats is None:
+            stats = self.db.get_channel_stats()
+            if stats != self._last_stats:
+                self._last_stats = stats
+                events.append({"type": "stats", "data": stats})
+
+        return events
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
@@ -0,0 +1,657 @@
+"""
+Нагрузочный бенчмарк DatabaseManager и веб-API на большом наборе данных.
+
+    # засеять БД (по умолчанию 10k каналов / 200k сообщений;
+    # масштаб прода: --channels 100000 --messages 10000000)
+    python load_bench.py seed bench.db --channels 100000 --messages 10000000
+
+    # запись: save_message/save_channel из N потоков + пачки apply_writes
+    python load_bench.py writes bench.db --writers 1,4,16 --write-seconds 10
+
+    # чтение: uvicorn отдельным процессом, N конкурентных aiohttp-клиентов
+    python load_bench.py api bench.db --clients 1,16,64 --api-seconds 10
+
+    # всё сразу на новой БД во временной папке
+    python load_bench.py all --report report.json
+
+Бенчмарк записи дописывает строки в указанную БД – для повторяемых
+замеров сейте отдельный файл. Отчёт – JSON (--report), плюс тот же JSON в stdout.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from replay_bench import _FILLER, _percentile, _prepare_env
+
+# Источники находок и их доли – как в реальной БД (live и история – основное)
+FOUND_VIA = {
+    "live": 0.45,
+    "history": 0.25,
+    "poll": 0.1,
+    "crawler": 0.1,
+    "auto_discovery": 0.05,
+    "manual_scan": 0.04,
+    "bot_search": 0.01,
+}
+# Активность по часам суток: ночью тише, вечером пик
+HOUR_WEIGHTS = [2, 1, 1, 1, 1, 2, 3, 5, 6, 7, 7, 8, 8, 8, 8, 9, 9, 10, 11, 12, 12, 10, 7, 4]
+
+# Эндпоинты под нагрузкой: имя -> (путь, метод DatabaseManager за ним)
+API_ENDPOINTS = {
+    "stats": ("/api/stats", "get_channel_stats"),
+    "channels_by_type": ("/api/channels?type={type}", "get_channels_by_type"),
+    "messages": ("/api/messages", "get_suspicious_messages"),
+    "messages_by_channel": ("/api/messages?channel={channel}", "get_suspicious_messages"),
+}
+
+
+def _latency(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(_percentile(ordered, 0.5) * 1000, 3),
+        "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _zipf_cum_weights(n: int, s: float = 1.1) -> list[float]:
+    """Накопленные веса Ципфа: несколько очень активных каналов, длинный хвост тихих."""
+    cum, total = [], 0.0
+    for i in range(n):
+        total += 1 / (i + 1) ** s
+        cum.append(total)
+    return cum
+
+
+def _db_size(path: str) -> int:
+    return sum(
+        os.path.getsize(path + suffix)
+        for suffix in ("", "-wal")
+        if os.path.exists(path + suffix)
+    )
+
+
+def _channel_usernames(path: str) -> list[str]:
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT username FROM suspicious_channels WHERE username IS NOT NULL ORDER BY id"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [row[0] for row in rows] or ["bench_000000"]
+
+
+# ======================================================
+#   НАПОЛНЕНИЕ БД
+# ======================================================
+
+
+def _message_texts(rnd: random.Random, count: int = 2000) -> list[str]:
+    """Пул текстов находок: нарко-слова, казахстанское гео, контакты."""
+    from keyword_manager import KeywordManager
+
+    km = KeywordManager()
+    strong = [w for w in km.drug_keywords if w not in km.ambiguous_drug_keywords] or ["закладки"]
+    cities = list(km.kz_cities) or ["Алматы", "Астана", "Шымкент", "Караганда", "Актобе"]
+
+    texts = []
+    for _ in range(count):
+        text = f"{rnd.choice(strong)} {rnd.choice(cities)}, пишите @shop_op_{rnd.randint(0, 999):03d}"
+        if rnd.random() < 0.5:
+            text += f" t.me/shop_{rnd.randint(0, 9999):04d}"
+        if rnd.random() < 0.3:
+            text = f"{rnd.choice(_FILLER)} {text}"
+        texts.append(text)
+    return texts
+
+
+def seed(
+    path: str,
+    channels: int = 10_000,
+    messages: int = 200_000,
+    days: int = 90,
+    drug_share: float = 0.9,
+    seed_value: int = 1,
+    batch: int = 50_000,
+) -> dict:
+    """
+    Новая БД со схемой DatabaseManager и синтетикой, похожей на прод:
+    сообщения по каналам – по Ципфу, время – за days дней с суточным
+    профилем, риск каналов смещён к низкому (бета-распределение).
+    Строки пишутся пачками executemany напрямую – save_* на миллионах
+    строк сеяли бы часами. Агрегаты активности заполняются в конце,
+    как при миграции (_backfill_rollup).
+    """
+    from database_manager import DatabaseManager
+
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists – seed a new file")
+
+    started = time.perf_counter()
+    rnd = random.Random(seed_value)
+    db = DatabaseManager(path)
+
+    conn = sqlite3.connect(path)
+    # наполнение одноразовое: надёжность записи не нужна, скорость – да
+    conn.execute("PRAGMA synchronous=OFF")
+    now = time.time()
+    first_day = now - days * 86400
+
+    def random_time() -> str:
+        hour = rnd.choices(range(24), HOUR_WEIGHTS)[0]
+        ts = first_day + rnd.randrange(days) * 86400 + hour * 3600 + rnd.random() * 3600
+        return str(datetime.fromtimestamp(min(ts, now)))
+
+    sources, source_weights = list(FOUND_VIA), list(FOUND_VIA.values())
+    rows = []
+    for i in range(channels):
+        rows.append(
+            (
+                f"bench_{i:06d}",
+                f"Bench channel {i}",
+                min(int(rnd.lognormvariate(6, 2)), 2_000_000),
+                round(rnd.betavariate(2, 3), 3),
+                round(rnd.betavariate(2, 5), 3),
+                rnd.choices(sources, source_weights)[0],
+                "",
+                "channel" if rnd.random() < 0.4 else "chat",
+                random_time(),
+                rnd.random() < 0.9,
+            )
+        )
+    conn.executemany(
+        """
+        INSERT INTO suspicious_channels
+        (username, title, participants_count, kz_phone_ratio, risk_score,
+         found_via, description, channel_type, last_checked, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+        rows,
+    )
+    conn.commit()
+    channels_seconds = time.perf_counter() - started
+
+    texts = _message_texts(rnd)
+    cum_weights = _zipf_cum_weights(channels)
+    population = range(channels)
+    written = 0
+    while written < messages:
+        size = min(batch, messages - written)
+        picks = rnd.choices(population, cum_weights=cum_weights, k=size)
+        conn.executemany(
+            """
+            INSERT INTO channel_messages
+            (channel_username, message_text, contains_drugs, contains_geo, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        """,
+            [
+                (
+                    f"bench_{index:06d}",
+                    rnd.choice(texts),
+                    rnd.random() < drug_share,
+                    rnd.random() < 0.4,
+                    random_time(),
+                )
+                for index in picks
+            ],
+        )
+        conn.commit()
+        written += size
+        print(f"🌱 Seeded {written}/{messages} messages", file=sys.stderr)
+    messages_seconds = time.perf_counter() - started - channels_seconds
+
+    rollup_started = time.perf_counter()
+    db._backfill_rollup(conn.cursor())
+    conn.commit()
+    conn.close()
+
+    total = time.perf_counter() - started
+    return {
+        "path": path,
+        "channels": channels,
+        "messages": messages,
+        "days": days,
+        "drug_share": drug_share,
+        "seed": seed_value,
+        "channels_seconds": round(channels_seconds, 2),
+        "messages_seconds": round(messages_seconds, 2),
+        "messages_per_sec": round(messages / messages_seconds) if messages_seconds else None,
+        "rollup_seconds": round(time.perf_counter() - rollup_started, 2),
+        "seconds": round(total, 2),
+        "bytes": _db_size(path),
+    }
+
+
+# ======================================================
+#   ЗАПИСЬ ПОД КОНКУРЕНЦИЕЙ
+# ======================================================
+
+
+def _write_ops(rnd: random.Random, usernames: list[str], cum_weights, texts, channel_share: float):
+    """Бесконечный поток операций как у монитора: в основном сообщения, иногда каналы."""
+    sources, source_weights = list(FOUND_VIA), list(FOUND_VIA.values())
+    while True:
+        username = rnd.choices(usernames, cum_weights=cum_weights)[0]
+        source = rnd.choices(sources, source_weights)[0]
+        if rnd.random() < channel_share:
+            yield "save_channel", {
+                "username": username,
+                "title": f"Bench channel {username}",
+                "participants_count": rnd.randint(10, 50000),
+                "kz_phone_ratio": round(rnd.random(), 3),
+                "risk_score": round(rnd.betavariate(2, 5), 3),
+                "found_via": source,
+                "channel_type": "channel" if rnd.random() < 0.4 else "chat",
+            }
+        else:
+            yield "save_message", {
+                "channel_username": username,
+                "message_text": rnd.choice(texts),
+                "contains_drugs": True,
+                "contains_geo": rnd.random() < 0.4,
+                "timestamp": datetime.utcnow(),
+                "triggers": ["drugs"],
+                "found_via": source,
+            }
+
+
+def _row_counts(path: str) -> tuple[int, int]:
+    conn = sqlite3.connect(path)
+    try:
+        return (
+            conn.execute("SELECT COUNT(*) FROM channel_messages").fetchone()[0],
+            conn.execute("SELECT MAX(id) FROM suspicious_channels").fetchone()[0] or 0,
+        )
+    finally:
+        conn.close()
+
+
+def bench_writes(
+    path: str,
+    writers: list[int],
+    seconds: float = 10,
+    channel_share: float = 0.1,
+    batch_size: int = 500,
+    seed_value: int = 1,
+) -> list[dict]:
+    """
+    direct – N потоков зовут save_message/save_channel напрямую (режим single:
+    соединение и коммит на вызов, писатели ждут блокировку SQLite);
+    batched – один поток применяет пачки apply_writes, как DatabaseWriter
+    супервизора. lost – вызовы, после которых строки не появилось (save_*
+    глотают «database is locked» и только пишут в лог).
+    """
+    from database_manager import DatabaseManager
+
+    db = DatabaseManager(path)
+    usernames = _channel_usernames(path)
+    cum_weights = _zipf_cum_weights(len(usernames))
+    texts = _message_texts(random.Random(seed_value))
+    results = []
+
+    for count in writers:
+        latencies: list[list[float]] = [[] for _ in range(count)]
+        attempts = {"save_message": 0, "save_channel": 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def worker(index: int):
+            ops = _write_ops(
+                random.Random(seed_value * 1000 + index), usernames, cum_weights, texts, channel_share
+            )
+            local = {"save_message": 0, "save_channel": 0}
+            for op, data in ops:
+                if time.monotonic() >= deadline:
+                    break
+                started = time.perf_counter()
+                getattr(db, op)(data)
+                latencies[index].append(time.perf_counter() - started)
+                local[op] += 1
+            with lock:
+                for op, n in local.items():
+                    attempts[op] += n
+
+        messages_before, channel_id_before = _row_counts(path)
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        messages_after, channel_id_after = _row_counts(path)
+
+        # INSERT OR REPLACE выдаёт каналу новый id – прирост max(id) = успешные save_channel
+        saved = (messages_after - messages_before) + (channel_id_after - channel_id_before)
+        total = sum(attempts.values())
+        results.append(
+            {
+                "scenario": "direct",
+                "writers": count,
+                "seconds": round(elapsed, 2),
+                "ops": total,
+                "ops_by_type": attempts,
+                "ops_per_sec": round(total / elapsed, 1),
+                "lost": max(0, total - saved),
+                "latency": _latency([x for samples in latencies for x in samples]),
+            }
+        )
+        print(f"✍️ direct x{count}: {results[-1]['ops_per_sec']} ops/s", file=sys.stderr)
+
+    # общий writer: одна транзакция на пачку
+    ops = _write_ops(random.Random(seed_value), usernames, cum_weights, texts, channel_share)
+    batch_latencies = []
+    applied = 0
+    deadline = time.monotonic() + seconds
+    started = time.perf_counter()
+    while time.monotonic() < deadline:
+        batch = [(op, (data,)) for op, data in (next(ops) for _ in range(batch_size))]
+        batch_started = time.perf_counter()
+        applied += db.apply_writes(batch)
+        batch_latencies.append(time.perf_counter() - batch_started)
+    elapsed = time.perf_counter() - started
+    results.append(
+        {
+            "scenario": "batched",
+            "writers": 1,
+            "batch_size": batch_size,
+            "seconds": round(elapsed, 2),
+            "ops": applied,
+            "ops_per_sec": round(applied / elapsed, 1),
+            "batch_latency": _latency(batch_latencies),
+        }
+    )
+    print(f"✍️ batched x{batch_size}: {results[-1]['ops_per_sec']} ops/s", file=sys.stderr)
+    return results
+
+
+# ======================================================
+#   ВЕБ-API ПОД НАГРУЗКОЙ
+# ======================================================
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_web_server(path: str, port: int, cache: bool, web_workers: int = 1) -> subprocess.Popen:
+    """
+    uvicorn отдельным процессом, как при WEB_MODE=process: клиенты бенчмарка
+    не делят GIL и event loop с сервером. БД – через DATABASE_NAME;
+    cache=False выключает кеш ответов (WEB_CACHE_ENTRIES=0).
+    """
+    env = dict(os.environ, DATABASE_NAME=os.path.abspath(path))
+    if not cache:
+        env["WEB_CACHE_ENTRIES"] = "0"
+    cmd = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "web_interface:app",
+        "--host",
+        "127.0.0.1",
+        "--port",
+        str(port),
+        "--workers",
+        str(web_workers),
+        "--no-access-log",
+        "--log-level",
+        "warning",
+    ]
+    # templates/ и static/ ищутся относительно текущей папки
+    return subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+async def _wait_ready(session, base_url: str, proc: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"web server exited with code {proc.returncode}")
+        try:
+            async with session.get(f"{base_url}/api/db") as resp:
+                if resp.status == 200:
+                    return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("web server did not start in time")
+
+
+async def _load_endpoint(
+    session, base_url: str, template: str, clients: int, seconds: float, usernames: list[str], cum_weights
+) -> dict:
+    """clients корутин шлют запросы подряд (закрытая модель) в течение seconds."""
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    errors: dict[str, int] = {}
+    received = 0
+    deadline = time.monotonic() + seconds
+
+    async def client(index: int):
+        nonlocal received
+        rnd = random.Random(index)
+        while time.monotonic() < deadline:
+            url = base_url + template.format(
+                type=rnd.choice(("channel", "chat")),
+                channel=rnd.choices(usernames, cum_weights=cum_weights)[0],
+            )
+            started = time.perf_counter()
+            try:
+                async with session.get(url) as resp:
+                    body = await resp.read()
+                    latencies.append(time.perf_counter() - started)
+                    statuses[str(resp.status)] = statuses.get(str(resp.status), 0) + 1
+                    received += len(body)
+            except Exception as e:
+                # обрыв соединения, таймаут клиента – по типу исключения
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {
+        "clients": clients,
+        "seconds": round(elapsed, 2),
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "statuses": statuses,
+        "errors": errors,
+        "avg_response_kb": round(received / len(latencies) / 1024, 1) if latencies else 0,
+        "latency": _latency(latencies),
+    }
+
+
+async def bench_api(
+    path: str,
+    clients: list[int],
+    seconds: float = 10,
+    endpoints: list[str] | None = None,
+    cache_modes: tuple[bool, ...] = (False, True),
+    web_workers: int = 1,
+) -> dict:
+    """
+    Для каждого режима кеша поднимает сервер на засеянной БД и гоняет каждый
+    эндпоинт при каждом уровне конкурентности. uncached – латентность самих
+    запросов к БД; cached – то, что видит дашборд, пока монитор не пишет.
+    server – состояние пула чтения и кеша сервера после прогона.
+    """
+    import aiohttp
+
+    usernames = _channel_usernames(path)
+    cum_weights = _zipf_cum_weights(len(usernames))
+    results = []
+    server: dict[str, dict] = {}
+
+    for cache in cache_modes:
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        proc = start_web_server(path, port, cache, web_workers)
+        # лимит соединений = число клиентов, иначе aiohttp поставит их в свою очередь
+        connector = aiohttp.TCPConnector(limit=max(clients))
+        timeout = aiohttp.ClientTimeout(total=120)
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                await _wait_ready(session, base_url, proc)
+                for name in endpoints or list(API_ENDPOINTS):
+                    template, method = API_ENDPOINTS[name]
+                    for count in clients:
+                        result = await _load_endpoint(
+                            session, base_url, template, count, seconds, usernames, cum_weights
+                        )
+                        result.update(
+                            {"endpoint": name, "db_method": method, "cache": cache}
+                        )
+                        results.append(result)
+                        print(
+                            f"🌐 {name} x{count} cache={cache}: {result['rps']} rps, "
+                            f"p99 {result['latency'].get('p99_ms')} ms",
+                            file=sys.stderr,
+                        )
+
+                state = server["cache_on" if cache else "cache_off"] = {}
+                for key, url in (("read_pool", "/api/db"), ("response_cache", "/api/cache")):
+                    async with session.get(base_url + url) as resp:
+                        state[key] = await resp.json()
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return {"runs": results, "server": server}
+
+
+# ======================================================
+#   ОТЧЁТ И CLI
+# ======================================================
+
+
+def _environment() -> dict:
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _dataset(path: str) -> dict:
+    conn = sqlite3.connect(path)
+    try:
+        channels = conn.execute("SELECT COUNT(*) FROM suspicious_channels").fetchone()[0]
+        messages = conn.execute("SELECT COUNT(*) FROM channel_messages").fetchone()[0]
+    finally:
+        conn.close()
+    return {"path": path, "channels": channels, "messages": messages, "bytes": _db_size(path)}
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(x) for x in value.split(",") if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк БД и веб-API")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def seed_args(p):
+        p.add_argument("--channels", type=int, default=10_000)
+        p.add_argument("--messages", type=int, default=200_000)
+        p.add_argument("--days", type=int, default=90)
+        p.add_argument("--drug-share", type=float, default=0.9, help="доля contains_drugs")
+        p.add_argument("--seed", type=int, default=1)
+
+    def write_args(p):
+        p.add_argument("--writers", type=_int_list, default=[1, 4, 16])
+        p.add_argument("--write-seconds", type=float, default=10)
+        p.add_argument("--channel-share", type=float, default=0.1, help="доля save_channel")
+        p.add_argument("--batch-size", type=int, default=500, help="пачка apply_writes")
+
+    def api_args(p):
+        p.add_argument("--clients", type=_int_list, default=[1, 16, 64])
+        p.add_argument("--api-seconds", type=float, default=10)
+        p.add_argument("--endpoint", action="append", choices=list(API_ENDPOINTS))
+        p.add_argument("--cache", choices=("off", "on", "both"), default="both")
+        p.add_argument("--web-workers", type=int, default=1)
+
+    p = sub.add_parser("seed", help="засеять новую БД")
+    p.add_argument("db")
+    seed_args(p)
+
+    p = sub.add_parser("writes", help="пропускная способность записи")
+    p.add_argument("db")
+    write_args(p)
+
+    p = sub.add_parser("api", help="латентность /api/* под конкурентной нагрузкой")
+    p.add_argument("db")
+    api_args(p)
+
+    p = sub.add_parser("all", help="seed (если нужно) + api + writes")
+    p.add_argument("db", nargs="?", help="по умолчанию – новый файл во временной папке")
+    seed_args(p)
+    write_args(p)
+    api_args(p)
+
+    for p in sub.choices.values():
+        p.add_argument("--report", help="куда записать JSON-отчёт")
+        p.add_argument("--verbose", action="store_true", help="не глушить INFO-логи")
+
+    args = parser.parse_args()
+    _prepare_env()
+    import config  # noqa: F401 – настраивает логирование
+
+    if not args.verbose:
+        # лог каждого save_* сам по себе заметно тормозит запись
+        logging.getLogger().setLevel(logging.WARNING)
+
+    report = {"environment": _environment()}
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="kz-load-"), "bench.db")
+
+    if args.command == "seed" or (args.command == "all" and not os.path.exists(path)):
+        report["seed"] = seed(path, args.channels, args.messages, args.days, args.drug_share, args.seed)
+
+    if args.command in ("api", "all"):
+        # чтение – до записи: бенчмарк записи меняет набор данных
+        report["dataset"] = _dataset(path)
+        cache_modes = {"off": (False,), "on": (True,), "both": (False, True)}[args.cache]
+        report["api"] = asyncio.run(
+            bench_api(
+                path, args.clients, args.api_seconds, args.endpoint, cache_modes, args.web_workers
+            )
+        )
+
+    if args.command in ("writes", "all"):
+        report.setdefault("dataset", _dataset(path))
+        report["writes"] = bench_writes(
+            path, args.writers, args.write_seconds, args.channel_share, args.batch_size
+        )
+
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text, file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
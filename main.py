@@ -1,20 +1,76 @@
+import time
+
+_IMPORTS_STARTED = time.perf_counter()
+
 import asyncio
 import logging
+import sys
 import threading
-import queue as thread_queue
 
 from telethon import TelegramClient
 
-from config import ACCOUNTS
+from config import (
+    ACCOUNTS,
+    ACCOUNT_INIT_TIMEOUT,
+    ALERT_BOT_TOKEN,
+    ALERT_BURST,
+    ALERT_CHAT,
+    ALERT_COALESCE_WINDOW,
+    ALERT_RATE_PER_MINUTE,
+    BOT_CONCURRENCY,
+    BOT_MAX_PAGES,
+    BOT_REPLY_TIMEOUT,
+    BOT_SEARCH_INTERVAL,
+    CRAWL_BUDGET,
+    CRAWL_CONCURRENCY,
+    CRAWL_FETCH_LIMIT,
+    CRAWL_INTERVAL,
+    CRAWL_MAX_DEPTH,
+    DATABASE_NAME,
+    DISCOVERY_INTERVAL,
+    HISTORY_BACKFILL_LIMIT,
+    JOB_JITTER,
+    JOB_LEASE_SECONDS,
+    POLL_BUDGET_PER_MINUTE,
+    POLL_DEFAULT_INTERVAL,
+    POLL_MAX_FETCH,
+    POLL_MAX_INTERVAL,
+    POLL_MIN_INTERVAL,
+    POLL_TARGET_MESSAGES,
+    RUN_MODE,
+    DEEP_SCAN_MAX_ATTEMPTS,
+    DEEP_SCAN_RANGE_SIZE,
+    SCAN_POLL_INTERVAL,
+    SCAN_WATCH_INTERVAL,
+    WEB_HOST,
+    WEB_MODE,
+    WEB_PORT,
+    WEB_WORKERS,
+)
 from database_manager import DatabaseManager
 from keyword_manager import KeywordManager
 from telegram_monitor import TelegramMonitor
 from bot_searcher import BotSearcher
 from channel_discoverer import ChannelDiscoverer
-from scan_tasks import scan_queue
-
-import web_interface
-import uvicorn
+from alert_outbox import AlertSender
+from diagnostics import register_loop
+from channel_poller import AdaptivePoller
+from job_scheduler import JobScheduler
+from link_crawler import LinkCrawler
+from scan_tasks import scan_wakeup
+from chat_marks import ChatMarks
+from seen_set import SeenSet
+from shard_map import ShardMap
+from rate_limit import TokenBucket
+
+# FastAPI / uvicorn / jinja2 импортируются только при запуске веба
+_IMPORTS_SECONDS = time.perf_counter() - _IMPORTS_STARTED
+
+# Как часто процесс отмечает свои живые аккаунты в account_presence
+# (и сверяет с БД общую ShardMap) и через сколько секунд без отметки
+# аккаунт считается выбывшим
+PRESENCE_INTERVAL = 30
+PRESENCE_TTL = 90
 
 
 class AccountRunner:
@@ -22,7 +78,16 @@ class AccountRunner:
     Один телеграм-аккаунт (своя сессия + свой API_ID/API_HASH) и все воркеры вокруг него.
     """
 
-    def __init__(self, cfg: dict, db: DatabaseManager, keywords: KeywordManager):
+    def __init__(
+        self,
+        cfg: dict,
+        db: DatabaseManager,
+        keywords: KeywordManager,
+        seen: SeenSet | None = None,
+        shards: ShardMap | None = None,
+        poll_budget: TokenBucket | None = None,
+        marks: ChatMarks | None = None,
+    ):
         self.session_name: str = cfg["SESSION"]
         self.phone: str = cfg["PHONE"]
         self.api_id: int = int(cfg["API_ID"])
@@ -30,25 +95,53 @@ class AccountRunner:
 
         self.db = db
         self.keywords = keywords
+        self.seen = seen
+        self.shards = shards
+        self.poll_budget = poll_budget
+        self.marks = marks
+
+        # глубокие сканы: entity по job_id и задачи, чей канал аккаунт не видит
+        self._scan_entities: dict[int, object] = {}
+        self._unreachable_scan_jobs: set[int] = set()
 
         self.client: TelegramClient | None = None
+        # нужен интерактивный логин (код из SMS) – делаем его уже не параллельно
+        self.needs_login = False
+        # секунды по этапам старта: connect / auth / get_me / modules / initial_scan
+        self.timings: dict[str, float] = {}
+
         self.telegram_monitor: TelegramMonitor | None = None
         self.bot_searcher: BotSearcher | None = None
         self.channel_discoverer: ChannelDiscoverer | None = None
+        self.poller: AdaptivePoller | None = None
 
-    async def initialize(self) -> bool:
+    async def initialize(self, interactive: bool = True) -> bool:
         """
         Логин для конкретного аккаунта и создание модулей.
+        interactive=False – только уже авторизованные сессии: если нужен код
+        из SMS, выставляем needs_login и выходим, логин будет потом по очереди.
         """
         try:
-            self.client = TelegramClient(
-                self.session_name,
-                self.api_id,
-                self.api_hash,
-            )
-            await self.client.start(phone=self.phone)
+            step = time.perf_counter()
+            if self.client is None:
+                self.client = TelegramClient(
+                    self.session_name,
+                    self.api_id,
+                    self.api_hash,
+                )
+            await self.client.connect()
+            step = self._mark_timing("connect", step)
+
+            if not await self.client.is_user_authorized():
+                if not interactive:
+                    self.needs_login = True
+                    return False
+                await self.client.start(phone=self.phone)
+            self.needs_login = False
+            step = self._mark_timing("auth", step)
 
             me = await self.client.get_me()
+            step = self._mark_timing("get_me", step)
             logging.info(
                 f"✅ [{self.session_name}] logged in as: "
                 f"{me.first_name} ({me.phone})"
@@ -60,6 +153,11 @@ class AccountRunner:
                 keyword_manager=self.keywords,
                 dialogs_limit=200,
                 history_limit=200,
+                backfill_limit=HISTORY_BACKFILL_LIMIT,
+                name=self.session_name,
+                seen=self.seen,
+                shards=self.shards,
+                marks=self.marks,
             )
 
             self.bot_searcher = BotSearcher(
@@ -67,6 +165,9 @@ class AccountRunner:
                 self.db,
                 self.keywords,
                 self.telegram_monitor,
+                reply_timeout=BOT_REPLY_TIMEOUT,
+                concurrency=BOT_CONCURRENCY,
+                max_pages=BOT_MAX_PAGES,
             )
 
             self.channel_discoverer = ChannelDiscoverer(
@@ -75,6 +176,17 @@ class AccountRunner:
                 self.keywords,
                 self.telegram_monitor,
             )
+            self.poller = AdaptivePoller(
+                self.telegram_monitor,
+                budget=self.poll_budget
+                or TokenBucket(POLL_BUDGET_PER_MINUTE / 60, max(5, POLL_MAX_FETCH / 100)),
+                min_interval=POLL_MIN_INTERVAL,
+                max_interval=POLL_MAX_INTERVAL,
+                default_interval=POLL_DEFAULT_INTERVAL,
+                target_messages=POLL_TARGET_MESSAGES,
+                max_fetch=POLL_MAX_FETCH,
+            )
+            self._mark_timing("modules", step)
 
             return True
 
@@ -82,127 +194,460 @@ class AccountRunner:
             logging.error(f"❌ [{self.session_name}] init error: {e}")
             return False
 
+    def _mark_timing(self, name: str, started: float) -> float:
+        now = time.perf_counter()
+        self.timings[name] = now - started
+        return now
+
+    def timings_summary(self) -> str:
+        return ", ".join(f"{k} {v:.1f}s" for k, v in self.timings.items())
+
+    async def disconnect(self):
+        if self.client is not None:
+            try:
+                await self.client.disconnect()
+            except Exception:
+                pass
+
     async def manual_scan_worker(self):
         """
-        Воркер для очереди ручных сканов.
-        Очередь общая, несколько аккаунтов могут разбирать её параллельно.
+        Воркер задач ручного сканирования (таблицы scan_jobs / scan_ranges).
+        Очередь общая, несколько аккаунтов разбирают её параллельно;
+        новые задачи будят воркер сразу через scan_wakeup.
         """
         if not self.telegram_monitor:
             return
 
+        wakeup = scan_wakeup.register()
+
         while True:
-            try:
-                channel_identifier = scan_queue.get_nowait()
-            except thread_queue.Empty:
-                await asyncio.sleep(1)
+            wakeup.clear()
+
+            # BEGIN IMMEDIATE под нагрузкой writer'а ждёт блокировку –
+            # очередь сканов трогаем только из потока, не из event loop
+            job = await asyncio.to_thread(self.db.claim_scan_job, self.session_name)
+            if job is not None:
+                if job.get("mode") == "deep":
+                    await self._plan_deep_scan(job)
+                else:
+                    await self._run_recent_scan(job)
+                continue
+
+            scan_range = await asyncio.to_thread(
+                self.db.claim_scan_range,
+                self.session_name,
+                exclude_job_ids=set(self._unreachable_scan_jobs),
+            )
+            if scan_range is not None:
+                await self._run_scan_range(scan_range)
                 continue
 
             try:
-                logging.info(
-                    f"🧾 [{self.session_name}] manual scan: {channel_identifier}"
-                )
-                result = await self.telegram_monitor.manual_scan_chat(
-                    channel_identifier,
-                    limit=500,
+                await asyncio.wait_for(wakeup.wait(), timeout=SCAN_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_recent_scan(self, job: dict):
+        """Обычный ручной скан: последние message_limit сообщений одним аккаунтом."""
+        job_id = job["id"]
+        channel_identifier = job["identifier"]
+
+        try:
+            logging.info(
+                f"🧾 [{self.session_name}] manual scan #{job_id}: {channel_identifier}"
+            )
+            result = await self.telegram_monitor.manual_scan_chat(
+                channel_identifier,
+                limit=job["message_limit"] or 500,
+                progress=lambda scanned, suspicious: asyncio.to_thread(
+                    self.db.update_scan_job_progress, job_id, scanned, suspicious
+                ),
+            )
+            logging.info(
+                f"✅ [{self.session_name}] manual scan [{result.get('title')}]: "
+                f"scanned={result.get('scanned')}, "
+                f"suspicious={result.get('suspicious')}"
+            )
+        except Exception as e:
+            logging.error(
+                f"❌ [{self.session_name}] manual scan error "
+                f"for {channel_identifier}: {e}"
+            )
+            result = {"ok": False, "error": str(e)}
+
+        await asyncio.to_thread(self.db.finish_scan_job, job_id, result)
+
+    async def _plan_deep_scan(self, job: dict):
+        """
+        Глубокий скан: режем историю канала на диапазоны id,
+        которые потом разбирают все аккаунты, видящие канал.
+        """
+        job_id = job["id"]
+
+        try:
+            channel = await self.telegram_monitor.resolve_scan_target(job["identifier"])
+            top_id = await self.telegram_monitor.get_top_message_id(channel)
+        except Exception as e:
+            logging.error(
+                f"❌ [{self.session_name}] deep scan #{job_id} "
+                f"for {job['identifier']}: {e}"
+            )
+            await asyncio.to_thread(
+                self.db.finish_scan_job, job_id, {"ok": False, "error": str(e)}
+            )
+            return
+
+        title = getattr(channel, "title", job["identifier"])
+        if top_id <= 0:
+            await asyncio.to_thread(
+                self.db.finish_scan_job, job_id, {"ok": True, "title": title}
+            )
+            return
+
+        self._scan_entities[job_id] = channel
+        count = await asyncio.to_thread(
+            self.db.plan_scan_ranges, job_id, top_id, DEEP_SCAN_RANGE_SIZE
+        )
+        await asyncio.to_thread(self.db.set_scan_job_title, job_id, title)
+        logging.info(
+            f"🧾 [{self.session_name}] deep scan #{job_id} [{title!r}]: "
+            f"{top_id} ids split into {count} ranges"
+        )
+        # пусть остальные аккаунты тоже подключаются
+        scan_wakeup.notify()
+
+    async def _run_scan_range(self, scan_range: dict):
+        job_id = scan_range["job_id"]
+        range_id = scan_range["id"]
+
+        channel = self._scan_entities.get(job_id)
+        if channel is None:
+            try:
+                channel = await self.telegram_monitor.resolve_scan_target(
+                    scan_range["identifier"]
                 )
+                self._scan_entities[job_id] = channel
+            except Exception as e:
+                # Этот аккаунт канал не видит – отдаём диапазон другим
                 logging.info(
-                    f"✅ [{self.session_name}] manual scan [{result.get('title')}]: "
-                    f"scanned={result.get('scanned')}, "
-                    f"suspicious={result.get('suspicious')}"
+                    f"🧾 [{self.session_name}] cannot access deep scan #{job_id}: {e}"
                 )
-            except Exception as e:
-                logging.error(
-                    f"❌ [{self.session_name}] manual scan error "
-                    f"for {channel_identifier}: {e}"
+                self._unreachable_scan_jobs.add(job_id)
+                await asyncio.to_thread(self.db.release_scan_range, range_id)
+                # канал не видит никто из живых аккаунтов – задача failed
+                if await asyncio.to_thread(
+                    self.db.report_scan_unreachable, job_id, self.session_name, PRESENCE_TTL
+                ):
+                    logging.warning(
+                        f"⚠️ Deep scan #{job_id}: no account can access the channel"
+                    )
+                return
+
+        try:
+            result = await self.telegram_monitor.scan_message_range(
+                channel,
+                lo=scan_range["lo"],
+                cursor=scan_range["cursor"],
+                scanned=scan_range["scanned"],
+                suspicious=scan_range["suspicious"],
+                checkpoint=lambda cursor, scanned, suspicious: asyncio.to_thread(
+                    self.db.checkpoint_scan_range, range_id, cursor, scanned, suspicious
+                ),
+            )
+        except Exception as e:
+            logging.error(
+                f"❌ [{self.session_name}] deep scan #{job_id} range "
+                f"{scan_range['lo']}..{scan_range['hi']}: {e}"
+            )
+            if await asyncio.to_thread(
+                self.db.fail_scan_range, range_id, str(e), DEEP_SCAN_MAX_ATTEMPTS
+            ):
+                logging.warning(
+                    f"⚠️ Deep scan #{job_id} range {scan_range['lo']}..{scan_range['hi']} "
+                    f"failed after {DEEP_SCAN_MAX_ATTEMPTS} attempts"
                 )
+            # не хватаем тот же диапазон сразу же снова
+            await asyncio.sleep(5)
+            return
+
+        await asyncio.to_thread(
+            self.db.finish_scan_range,
+            range_id,
+            "cancelled" if result["stopped"] else "done",
+        )
 
     async def start_all_tasks(self):
         """
         Запускаем для аккаунта:
         - мониторинг чатов/каналов
-        - работу ботов
-        - автопоиск каналов
         - воркер ручных сканов
+        Боты и автопоиск каналов – периодические задачи (MultiKZMonitor.jobs).
         """
         if not self.telegram_monitor:
             logging.error(f"❌ [{self.session_name}] telegram_monitor is None")
             return
 
         # старт мониторинга (initial_scan + обработчик новых сообщений)
+        started = time.perf_counter()
         await self.telegram_monitor.start_monitoring()
+        self._mark_timing("initial_scan", started)
+        logging.info(f"⏱️ [{self.session_name}] start: {self.timings_summary()}")
 
-        # периодический поиск через ботов
-        if self.bot_searcher:
-            asyncio.create_task(self.bot_searcher.periodic_bot_search())
-
-        # автопоиск каналов
-        if self.channel_discoverer:
-            asyncio.create_task(self.channel_discoverer.periodic_discovery())
-            asyncio.create_task(self.channel_discoverer.discover_channels())
+        # дочитка своих чатов с адаптивной частотой
+        if self.poller:
+            asyncio.create_task(self.poller.run())
 
         # воркер ручных сканов
         asyncio.create_task(self.manual_scan_worker())
 
+        # аккаунт отвалился насовсем – его чаты забирают остальные
+        asyncio.create_task(self._watch_disconnect())
+
         logging.info(f"✅ [{self.session_name}] monitoring started")
 
+    async def _watch_disconnect(self):
+        try:
+            await self.client.disconnected
+        except Exception as e:
+            logging.error(f"❌ [{self.session_name}] client disconnected: {e}")
+        self.telegram_monitor.shards.leave(self.session_name)
+
 
 class MultiKZMonitor:
     """
     Главный контроллер: много аккаунтов, одна БД, один веб-интерфейс.
     """
 
-    def __init__(self):
-        self.db = DatabaseManager()
+    def __init__(
+        self,
+        accounts_cfg: list[dict] | None = None,
+        db: DatabaseManager | None = None,
+        run_alert_sender: bool = True,
+        requeue_scan_jobs: bool = True,
+    ):
+        """
+        accounts_cfg – подмножество config.ACCOUNTS (в режиме supervisor
+        каждый дочерний процесс получает свою группу аккаунтов).
+        """
+        self.accounts_cfg = accounts_cfg if accounts_cfg is not None else ACCOUNTS
+        self.db = db or DatabaseManager(DATABASE_NAME)
         self.keywords = KeywordManager()
+        # общий на все аккаунты процесса: одно сообщение из общего чата обрабатываем
+        # один раз; между процессами дубли отсекает ключ (chat_id, message_id) в БД
+        self.seen = SeenSet()
+        # кто из аккаунтов (всех процессов) ведёт историю/discovery по каждому общему чату
+        self.shards = ShardMap(self.db, PRESENCE_INTERVAL, PRESENCE_TTL)
+        # отметки чатов: общие, чтобы сообщение в работе у одного аккаунта
+        # не давало другому сдвинуть отметку общего чата
+        self.marks = ChatMarks(self.db)
+        # общий бюджет запросов адаптивного опроса на все аккаунты процесса
+        self.poll_budget = TokenBucket(
+            POLL_BUDGET_PER_MINUTE / 60, max(5, POLL_MAX_FETCH / 100)
+        )
         self.accounts: list[AccountRunner] = []
+        self.run_alert_sender = run_alert_sender
+        # боты и discovery: один запуск на весь парк (аренда в periodic_jobs)
+        self.jobs = JobScheduler(
+            self.db, jitter=JOB_JITTER, lease_seconds=JOB_LEASE_SECONDS
+        )
+        # обход ссылок из подозрительных сообщений – тоже задача на весь парк
+        self.crawler = LinkCrawler(
+            self.db,
+            self.keywords,
+            monitors=lambda: [
+                runner.telegram_monitor
+                for runner in self.accounts
+                if runner.client.is_connected()
+            ],
+            max_depth=CRAWL_MAX_DEPTH,
+            budget=CRAWL_BUDGET,
+            concurrency=CRAWL_CONCURRENCY,
+            fetch_limit=CRAWL_FETCH_LIMIT,
+        )
+
+        # Задачи, которые выполнялись при прошлом падении/остановке – заново в очередь.
+        # В режиме supervisor это делает только родитель, иначе перезапуск
+        # одного ребёнка отнимет задачи у остальных.
+        if requeue_scan_jobs:
+            requeued = self.db.requeue_running_scan_jobs()
+            if requeued:
+                logging.info(f"🧾 Requeued {requeued} interrupted scan jobs")
+        self.alert_client: TelegramClient | None = None
 
         logging.info("✅ Multi KZ Drug Monitor initialized")
 
     async def initialize_all(self) -> bool:
         """
-        Инициализируем все аккаунты из config.ACCOUNTS.
+        Инициализируем все аккаунты из accounts_cfg (по умолчанию config.ACCOUNTS).
+
+        Уже авторизованные сессии логинятся параллельно, у каждой свой таймаут,
+        так что зависший аккаунт не задерживает остальные. Сессии, которым нужен
+        код из SMS, логинятся после этого по одной (ввод кода – интерактивный).
         """
-        for cfg in ACCOUNTS:
+        started = time.perf_counter()
+        runners = []
+        for cfg in self.accounts_cfg:
             # базовые проверки
             required = ("SESSION", "PHONE", "API_ID", "API_HASH")
             if not all(k in cfg and cfg[k] for k in required):
                 logging.error(f"❌ Bad account config (missing fields): {cfg}")
                 continue
 
-            runner = AccountRunner(cfg, db=self.db, keywords=self.keywords)
-            ok = await runner.initialize()
+            runners.append(
+                AccountRunner(
+                    cfg,
+                    db=self.db,
+                    keywords=self.keywords,
+                    seen=self.seen,
+                    shards=self.shards,
+                    poll_budget=self.poll_budget,
+                    marks=self.marks,
+                )
+            )
+
+        results = await asyncio.gather(
+            *(self._initialize_with_timeout(runner) for runner in runners)
+        )
+
+        for runner, ok in zip(runners, results):
+            if not ok and runner.needs_login:
+                logging.info(f"🔑 [{runner.session_name}] interactive login required")
+                ok = await runner.initialize(interactive=True)
             if ok:
                 self.accounts.append(runner)
+                logging.info(f"⏱️ [{runner.session_name}] init: {runner.timings_summary()}")
 
         if not self.accounts:
             logging.error("❌ No accounts were initialized. Check ACCOUNTS in config.py")
             return False
 
-        logging.info(f"✅ Initialized {len(self.accounts)} accounts")
+        logging.info(
+            f"✅ Initialized {len(self.accounts)}/{len(runners)} accounts "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
         return True
 
+    async def _initialize_with_timeout(self, runner: AccountRunner) -> bool:
+        try:
+            return await asyncio.wait_for(
+                runner.initialize(interactive=False), timeout=ACCOUNT_INIT_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logging.error(
+                f"❌ [{runner.session_name}] init timed out after {ACCOUNT_INIT_TIMEOUT}s"
+            )
+            await runner.disconnect()
+            return False
+
+    async def start_alert_sender(self):
+        """
+        Один отправщик алертов на весь процесс.
+        Через бота, если задан ALERT_BOT_TOKEN, иначе через первый аккаунт.
+        """
+        if not ALERT_CHAT or not self.accounts:
+            return
+
+        client = self.accounts[0].client
+        rpc = self.accounts[0].telegram_monitor.rpc
+        if ALERT_BOT_TOKEN:
+            try:
+                first = self.accounts[0]
+                self.alert_client = TelegramClient(
+                    "alert_bot", first.api_id, first.api_hash
+                )
+                await self.alert_client.start(bot_token=ALERT_BOT_TOKEN)
+                client = self.alert_client
+                rpc = None
+                logging.info("✅ Alerts will be sent via bot")
+            except Exception as e:
+                logging.error(f"❌ Alert bot login failed, using account: {e}")
+
+        sender = AlertSender(
+            client,
+            self.db,
+            ALERT_CHAT,
+            rate=ALERT_RATE_PER_MINUTE / 60,
+            burst=ALERT_BURST,
+            coalesce_window=ALERT_COALESCE_WINDOW,
+            rpc=rpc,
+        )
+        asyncio.create_task(sender.run())
+
     async def start_all(self):
         """
         Запускаем мониторинг по всем аккаунтам.
         """
-        for runner in self.accounts:
-            await runner.start_all_tasks()
+        await self.start_tasks()
 
-        logging.info("✅ All accounts monitoring started")
         # держим event loop живым
         await asyncio.Future()
 
+    async def start_tasks(self):
+        if self.run_alert_sender:
+            await self.start_alert_sender()
+
+        self.shards.start()
+
+        started = time.perf_counter()
+        # initial_scan каждого аккаунта ждёт, пока отметятся все остальные
+        self.shards.expect(runner.session_name for runner in self.accounts)
+        results = await asyncio.gather(
+            *(runner.start_all_tasks() for runner in self.accounts),
+            return_exceptions=True,
+        )
+        for runner, result in zip(self.accounts, results):
+            if isinstance(result, Exception):
+                logging.error(f"❌ [{runner.session_name}] start error: {result}")
+                self.shards.leave(runner.session_name)
+
+        logging.info(
+            f"✅ All accounts monitoring started in {time.perf_counter() - started:.1f}s"
+        )
+
+        self.schedule_periodic_jobs()
+        self.jobs.start()
+
+    def schedule_periodic_jobs(self):
+        """
+        bot_search – один на весь парк: отвечают одни и те же боты,
+        так что достаточно одного аккаунта.
+        discovery:<session> – по задаче на аккаунт (у каждого свои диалоги,
+        общие чаты делит ShardMap), но не больше одного запуска на аккаунт.
+        crawler – проход по фронтиру ссылок, один на весь парк.
+        """
+        self.jobs.add("bot_search", self._run_bot_search, BOT_SEARCH_INTERVAL)
+        self.jobs.add("crawler", self.crawler.crawl, CRAWL_INTERVAL)
+
+        for runner in self.accounts:
+            if runner.channel_discoverer:
+                self.jobs.add(
+                    f"discovery:{runner.session_name}",
+                    runner.channel_discoverer.discover_channels,
+                    DISCOVERY_INTERVAL,
+                )
+
+    async def _run_bot_search(self):
+        for runner in self.accounts:
+            if runner.bot_searcher and runner.client.is_connected():
+                await runner.bot_searcher.search_all_bots()
+                return
+        logging.warning("🤖 Bot search skipped: no connected accounts")
+
 
 # ----------------- Веб-интерфейс (FastAPI + Uvicorn) -----------------
 def run_web_interface():
     """
-    Запуск веб-интерфейса в отдельном потоке.
+    Запуск веб-интерфейса в отдельном потоке (WEB_MODE=thread).
     """
     try:
+        import uvicorn
+
+        import web_interface
+
         uvicorn.run(
             web_interface.app,
-            host="0.0.0.0",
-            port=8000,
+            host=WEB_HOST,
+            port=WEB_PORT,
             log_level="info",
             access_log=False,
         )
@@ -210,17 +655,70 @@ def run_web_interface():
         logging.error(f"❌ Web interface error: {e}")
 
 
+def web_process_command() -> list[str]:
+    """Команда запуска uvicorn отдельным процессом."""
+    return [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "web_interface:app",
+        "--host",
+        WEB_HOST,
+        "--port",
+        str(WEB_PORT),
+        "--workers",
+        str(WEB_WORKERS),
+        "--no-access-log",
+    ]
+
+
+async def run_web_process():
+    """
+    WEB_MODE=process: uvicorn отдельным процессом (можно с несколькими воркерами).
+    Дашборд и монитор не делят GIL, общий у них только файл БД.
+    Если процесс веба упал – перезапускаем.
+    """
+    cmd = web_process_command()
+
+    while True:
+        proc = await asyncio.create_subprocess_exec(*cmd)
+        logging.info(
+            f"🌐 Web interface process started (pid={proc.pid}, workers={WEB_WORKERS})"
+        )
+        try:
+            code = await proc.wait()
+        except asyncio.CancelledError:
+            proc.terminate()
+            raise
+        logging.error(f"❌ Web interface process exited with code {code}, restarting in 5s")
+        await asyncio.sleep(5)
+
+
 # ----------------- MAIN -----------------
 async def main():
     logging.info("🚀 Starting Multi-Account KZ Drug Shop Monitor...")
+    started = time.perf_counter()
+    # задачи этого loop'а видны в /api/admin/tasks
+    register_loop("monitor")
+    logging.info(f"⏱️ Startup: imports {_IMPORTS_SECONDS:.1f}s")
 
     monitor = MultiKZMonitor()
+    logging.info(f"⏱️ Startup: database/keywords {time.perf_counter() - started:.1f}s")
 
     if await monitor.initialize_all():
         # Веб поднимаем один раз
-        web_thread = threading.Thread(target=run_web_interface, daemon=True)
-        web_thread.start()
-        logging.info("🌐 Web interface available at: http://localhost:8000")
+        if WEB_MODE == "thread":
+            web_thread = threading.Thread(target=run_web_interface, daemon=True)
+            web_thread.start()
+        elif WEB_MODE == "process":
+            asyncio.create_task(run_web_process())
+            # scan_wakeup.notify() из процесса веба сюда не дойдёт
+            asyncio.create_task(
+                scan_wakeup.watch_database(monitor.db, interval=SCAN_WATCH_INTERVAL)
+            )
+
+        if WEB_MODE != "off":
+            logging.info(f"🌐 Web interface available at: http://localhost:{WEB_PORT}")
 
         await monitor.start_all()
     else:
@@ -229,7 +727,12 @@ async def main():
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if RUN_MODE == "supervisor":
+            from supervisor import run_supervisor
+
+            run_supervisor()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("⏹️ System stopped by user")
     except Exception as e:
@@ -0,0 +1,206 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы бакетов гистограмм латентности (сек): от 0.5 мс до 30 с
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+# Все метрики процесса – для /metrics и heartbeat'ов детей супервизора
+REGISTRY: dict[str, "_Metric"] = {}
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def collect(self) -> list[tuple[tuple, object]]:
+        with self._lock:
+            return [(labels, self._copy(value)) for labels, value in self._values.items()]
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, value: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+
+class Gauge(_Metric):
+    """
+    Значение на момент снятия. collect_fn (если задан) вызывается при каждом
+    /metrics и возвращает [(labels, value)] – так глубина очередей не требует
+    правок в горячем коде.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), collect_fn=None):
+        super().__init__(name, help, labelnames)
+        self.collect_fn = collect_fn
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def collect(self) -> list[tuple[tuple, object]]:
+        if self.collect_fn is not None:
+            return [(tuple(labels), value) for labels, value in self.collect_fn()]
+        return super().collect()
+
+
+class Histogram(_Metric):
+    """Накопительная гистограмма: [счётчики бакетов..., +Inf], сумма."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        # bisect + пара сложений под локом – можно держать включённым всегда
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1]]
+
+
+# ======================================================
+#   СНИМОК И ФОРМАТ PROMETHEUS
+# ======================================================
+
+
+def snapshot() -> dict:
+    """Все метрики процесса в JSON-совместимом виде (для heartbeat'а ребёнка)."""
+    result = {}
+    for name, metric in list(REGISTRY.items()):
+        result[name] = {
+            "kind": metric.kind,
+            "help": metric.help,
+            "labelnames": list(metric.labelnames),
+            "buckets": list(getattr(metric, "buckets", ())),
+            "values": [[list(labels), value] for labels, value in metric.collect()],
+        }
+    return result
+
+
+def _merge(snapshots: list[dict]) -> dict:
+    """Складывает одинаковые ряды из нескольких процессов."""
+    merged: dict[str, dict] = {}
+    for snap in snapshots:
+        for name, metric in snap.items():
+            target = merged.setdefault(name, dict(metric, values={}))
+            for labels, value in metric["values"]:
+                key = tuple(labels)
+                current = target["values"].get(key)
+                if current is None:
+                    target["values"][key] = value
+                elif metric["kind"] == "histogram":
+                    counts = [a + b for a, b in zip(current[0], value[0])]
+                    target["values"][key] = [counts, current[1] + value[1]]
+                else:
+                    target["values"][key] = current + value
+    return merged
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render(extra_snapshots: list[dict] | None = None) -> str:
+    """Текстовый формат Prometheus: метрики процесса + снимки других процессов."""
+    merged = _merge([snapshot()] + list(extra_snapshots or []))
+    lines = []
+
+    for name in sorted(merged):
+        metric = merged[name]
+        names = metric["labelnames"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+
+        for labels, value in sorted(metric["values"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(names, labels)} {value}")
+                continue
+
+            counts, total = value
+            cumulative = 0
+            bounds = [str(b) for b in metric["buckets"]] + ["+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_labels(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {total}")
+            lines.append(f"{name}_count{_labels(names, labels)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
+
+
+# ======================================================
+#   МЕТРИКИ МОНИТОРА
+# ======================================================
+
+ANALYZE_SECONDS = Histogram(
+    "kz_analyze_text_seconds", "KeywordManager.analyze_text latency"
+)
+RPC_SECONDS = Histogram(
+    "kz_rpc_seconds", "Telethon RPC latency by method", ("account", "method")
+)
+DB_WRITE_SECONDS = Histogram(
+    "kz_db_write_seconds", "Direct DatabaseManager write latency by operation", ("op",)
+)
+DB_FLUSH_SECONDS = Histogram(
+    "kz_db_flush_seconds", "Batched write (apply_writes) transaction latency"
+)
+DB_FLUSH_OPS = Counter("kz_db_flushed_ops_total", "Operations applied by batched writes")
+ALERT_SEND_SECONDS = Histogram(
+    "kz_alert_send_seconds", "Alert digest send latency", ("status",)
+)
+
+MESSAGES_SEEN = Counter(
+    "kz_messages_seen_total", "Messages analyzed", ("account", "source")
+)
+MESSAGES_FLAGGED = Counter(
+    "kz_messages_flagged_total", "Suspicious messages persisted", ("account", "source")
+)
+MESSAGES_ALERTED = Counter(
+    "kz_messages_alerted_total", "Alerts queued to the outbox", ("account", "source")
+)
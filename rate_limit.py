@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Классический token bucket: rate токенов в секунду, не больше capacity.
+    acquire() ждёт, пока накопится нужное число токенов.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("rate должен быть > 0")
+
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def delay_for(self, tokens: float = 1.0) -> float:
+        """Сколько секунд ждать до появления tokens токенов."""
+        self._refill()
+        missing = tokens - self._tokens
+        return max(0.0, missing / self.rate)
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """Ждём токены; возвращает, сколько секунд пришлось ждать."""
+        waited = 0.0
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                delay = self.delay_for(tokens)
+                waited += delay
+                await asyncio.sleep(delay)
+        return waited
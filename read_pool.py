@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from database_manager import DatabaseManager
+
+
+class _PooledConnection(sqlite3.Connection):
+    """Соединение потока пула: close() из методов DatabaseManager его не закрывает."""
+
+    def close(self):
+        self.row_factory = None
+
+    def really_close(self):
+        super().close()
+
+
+class ReadOnlyDatabase(DatabaseManager):
+    """
+    Те же get_* методы DatabaseManager, но на read-only соединениях:
+    у каждого потока пула своё долгоживущее соединение.
+
+    Таймаут запроса – через progress handler: SQLite сам прерывает запрос,
+    когда истёк дедлайн, поток не остаётся занятым «брошенным» запросом.
+    """
+
+    def __init__(self, db_name: str, busy_timeout: float = 30.0):
+        # setup_database не вызываем: схему создаёт основной DatabaseManager
+        self.db_name = db_name
+        self.busy_timeout = busy_timeout
+        self.write_queue = None
+
+        self._uri = Path(db_name).resolve().as_uri() + "?mode=ro"
+        self._local = threading.local()
+        self._connections: list[_PooledConnection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self._uri,
+                uri=True,
+                timeout=self.busy_timeout,
+                factory=_PooledConnection,
+                check_same_thread=False,
+            )
+            conn.set_progress_handler(self._past_deadline, 1000)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+
+        conn.row_factory = None
+        return conn
+
+    def _past_deadline(self) -> int:
+        deadline = getattr(self._local, "deadline", None)
+        return 1 if deadline is not None and time.monotonic() > deadline else 0
+
+    def run(self, deadline: float, func, args: tuple, kwargs: dict):
+        self._local.deadline = deadline
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e):
+                raise asyncio.TimeoutError from e
+            raise
+        finally:
+            self._local.deadline = None
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.really_close()
+            self._connections.clear()
+
+
+class ReadPool:
+    """
+    Чтение БД для веб-обработчиков вне event loop'а uvicorn.
+
+    Две полосы со своими потоками и лимитами:
+    - fast – короткие запросы (статистика, списки каналов, задачи)
+    - slow – тяжёлые аналитические (сообщения, фронтир, выгрузки)
+    Медленный запрос занимает поток только своей полосы, дешёвые идут мимо.
+    Таймаут считается от входа в очередь: ожидание свободного потока тоже
+    входит в него. По таймауту – asyncio.TimeoutError.
+    """
+
+    def __init__(
+        self,
+        db_name: str,
+        workers: int = 4,
+        slow_workers: int = 2,
+        timeout: float = 5,
+        slow_timeout: float = 30,
+    ):
+        self.db = ReadOnlyDatabase(db_name)
+        self._lanes = {
+            "fast": self._lane("db-read", workers, timeout),
+            "slow": self._lane("db-read-slow", slow_workers, slow_timeout),
+        }
+
+    @staticmethod
+    def _lane(prefix: str, workers: int, timeout: float) -> dict:
+        return {
+            "executor": ThreadPoolExecutor(max_workers=workers, thread_name_prefix=prefix),
+            "workers": workers,
+            "timeout": timeout,
+            "semaphore": None,
+            "waiting": 0,
+            "running": 0,
+            "timeouts": 0,
+        }
+
+    async def call(self, func, *args, lane: str = "fast", timeout: float | None = None, **kwargs):
+        """func – метод self.db (или функция, читающая через self.db)."""
+        state = self._lanes[lane]
+        if state["semaphore"] is None:
+            # семафор создаём уже внутри loop'а uvicorn
+            state["semaphore"] = asyncio.Semaphore(state["workers"])
+
+        timeout = state["timeout"] if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        state["waiting"] += 1
+        try:
+            await asyncio.wait_for(state["semaphore"].acquire(), timeout)
+        except asyncio.TimeoutError:
+            state["timeouts"] += 1
+            raise
+        finally:
+            state["waiting"] -= 1
+
+        state["running"] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                state["executor"], self.db.run, deadline, func, args, kwargs
+            )
+        except asyncio.TimeoutError:
+            state["timeouts"] += 1
+            logging.warning(f"⏱️ DB read timed out ({lane}): {getattr(func, '__name__', func)}")
+            raise
+        finally:
+            state["running"] -= 1
+            state["semaphore"].release()
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "workers": state["workers"],
+                "timeout": state["timeout"],
+                "running": state["running"],
+                "waiting": state["waiting"],
+                "timeouts": state["timeouts"],
+            }
+            for name, state in self._lanes.items()
+        }
@@ -0,0 +1,604 @@
+"""
+Запись и воспроизведение потока NewMessage для офлайн-бенчмарка TelegramMonitor.
+
+    # синтетический поток (воспроизводимый: --seed)
+    python replay_bench.py synth events.kzr.gz --events 20000 --chats 200 --suspicious 0.05
+
+    # живой поток первого аккаунта из .env (сессия должна быть уже авторизована)
+    python replay_bench.py record events.kzr.gz --seconds 600
+
+    # прогон через монитор с фейковым клиентом Telethon, отчёт в JSON
+    python replay_bench.py replay events.kzr.gz --mode pipeline --speed 0 --report report.json
+
+Формат записи – gzip NDJSON: заголовок, затем строки чатов ({"chat": {...}},
+один раз на чат) и событий ({"t", "c", "id", "text", "s"}), где t – секунды
+от начала записи, c – id чата, s – автор.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+FORMAT = "kz-replay"
+VERSION = 1
+
+
+# ======================================================
+#   ФАЙЛ ЗАПИСИ
+# ======================================================
+
+
+class RecordingWriter:
+    """Пишет события в компактный файл: метаданные чата – один раз на чат."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._chats: set[int] = set()
+        self._started = time.monotonic()
+        self.events = 0
+        self._write({"format": FORMAT, "version": VERSION, "created": datetime.now().isoformat()})
+
+    def _write(self, obj: dict):
+        self._file.write(json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def write_event(self, chat: dict, message_id: int, text: str, sender: dict | None = None, t=None):
+        """chat: id, title, username, broadcast, participants_count; sender: id, username, имя."""
+        if chat["id"] not in self._chats:
+            self._chats.add(chat["id"])
+            self._write({"chat": chat})
+
+        event = {
+            "t": round(time.monotonic() - self._started if t is None else t, 3),
+            "c": chat["id"],
+            "id": message_id,
+            "text": text,
+        }
+        if sender:
+            event["s"] = sender
+        self._write(event)
+        self.events += 1
+
+    def close(self):
+        self._file.close()
+
+
+def read_recording(path: str):
+    """Генератор (chat, event) по файлу записи, без загрузки целиком в память."""
+    chats: dict[int, dict] = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != FORMAT:
+            raise ValueError(f"{path}: не файл записи {FORMAT}")
+
+        for line in f:
+            row = json.loads(line)
+            if "chat" in row:
+                chats[row["chat"]["id"]] = row["chat"]
+                continue
+            yield chats[row["c"]], row
+
+
+# ======================================================
+#   ЗАПИСЬ: ЖИВОЙ ПОТОК И СИНТЕТИКА
+# ======================================================
+
+
+async def record_live(path: str, seconds: float, limit: int | None, account: int = 0):
+    """Пишет входящие сообщения аккаунта из .env, пока не истечёт время или лимит."""
+    from telethon import TelegramClient, events
+
+    from config import ACCOUNTS
+
+    acc = ACCOUNTS[account]
+    client = TelegramClient(acc["SESSION"], acc["API_ID"], acc["API_HASH"])
+    await client.connect()
+    if not await client.is_user_authorized():
+        raise SystemExit(f"Сессия {acc['SESSION']} не авторизована – сначала запустите монитор")
+
+    writer = RecordingWriter(path)
+    done = asyncio.Event()
+
+    @client.on(events.NewMessage(incoming=True))
+    async def handler(event):
+        if not event.message or not event.message.text:
+            return
+        chat = await event.get_chat()
+        sender = await event.get_sender()
+        writer.write_event(
+            {
+                "id": event.chat_id,
+                "title": getattr(chat, "title", None) or getattr(chat, "first_name", ""),
+                "username": getattr(chat, "username", None),
+                "broadcast": bool(getattr(chat, "broadcast", False)),
+                "participants_count": getattr(chat, "participants_count", 0) or 0,
+            },
+            event.message.id,
+            event.message.text,
+            {
+                "id": getattr(sender, "id", None),
+                "username": getattr(sender, "username", None),
+                "first_name": getattr(sender, "first_name", None),
+                "last_name": getattr(sender, "last_name", None),
+            }
+            if sender
+            else None,
+        )
+        if limit and writer.events >= limit:
+            done.set()
+
+    logging.info(f"⏺️ Recording to {path} ({seconds:.0f}s, limit {limit or '—'})")
+    try:
+        await asyncio.wait_for(done.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        writer.close()
+        await client.disconnect()
+    logging.info(f"⏺️ Recorded {writer.events} events")
+
+
+_FILLER = [
+    "Всем привет, кто сегодня идёт на встречу?",
+    "Скидки на технику до конца недели",
+    "Продам велосипед, почти новый",
+    "Погода в Алматы сегодня отличная",
+    "Ищу попутчика до Астаны на выходные",
+    "Новый выпуск подкаста уже вышел",
+    "Кто знает хороший сервис по ремонту телефонов?",
+    "Вакансия: требуется курьер, график свободный",
+]
+
+
+def synthesize(
+    path: str,
+    events: int,
+    chats: int,
+    suspicious: float,
+    rate: float,
+    seed: int = 1,
+):
+    """
+    Синтетический поток: темп по Пуассону (rate событий/сек), чаты по Ципфу
+    (несколько шумных, много тихих), доля suspicious – с нарко-словами,
+    казахстанским гео и ссылками t.me, как в реальных находках.
+    """
+    from keyword_manager import KeywordManager
+
+    rnd = random.Random(seed)
+    km = KeywordManager()
+    strong = [w for w in km.drug_keywords if w not in km.ambiguous_drug_keywords]
+    # список городов в KeywordManager может быть пустым
+    cities = list(km.kz_cities) or ["Алматы", "Астана", "Шымкент", "Караганда", "Актобе"]
+
+    chat_list = [
+        {
+            "id": -1000000000000 - i,
+            "title": f"Synthetic chat {i}",
+            "username": f"synth_chat_{i:05d}",
+            "broadcast": i % 3 == 0,
+            "participants_count": rnd.randint(10, 50000),
+        }
+        for i in range(chats)
+    ]
+    weights = [1 / (i + 1) for i in range(chats)]
+    next_id: dict[int, int] = defaultdict(lambda: rnd.randint(1000, 100000))
+
+    writer = RecordingWriter(path)
+    t = 0.0
+    for _ in range(events):
+        t += rnd.expovariate(rate)
+        chat = rnd.choices(chat_list, weights)[0]
+        next_id[chat["id"]] += 1
+
+        text = rnd.choice(_FILLER)
+        if rnd.random() < suspicious:
+            text = (
+                f"{rnd.choice(strong)} {rnd.choice(cities)}, пишите "
+                f"t.me/synth_shop_{rnd.randint(0, 99):02d} или @synth_op_{rnd.randint(0, 99):02d}"
+            )
+
+        writer.write_event(
+            chat,
+            next_id[chat["id"]],
+            text,
+            {"id": rnd.randint(1, 10**9), "username": f"user{rnd.randint(0, 9999)}"},
+            t=t,
+        )
+    writer.close()
+    logging.info(f"🧪 Synthesized {events} events in {chats} chats -> {path}")
+
+
+# ======================================================
+#   ФЕЙКОВЫЙ КЛИЕНТ TELETHON
+# ======================================================
+
+
+class FakeEntity:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeMessage:
+    def __init__(self, client, chat, event: dict, message_id: int):
+        self._client = client
+        self.id = message_id
+        self.chat_id = chat.id
+        self.text = self.message = event["text"]
+        self.date = datetime.now(timezone.utc)
+        self.fwd_from = None
+        self.forward = None
+        self.buttons = None
+        sender = event.get("s")
+        self.sender = FakeEntity(**sender) if sender else None
+
+    async def get_sender(self):
+        await self._client._rpc_delay()
+        return self.sender
+
+
+class FakeEvent:
+    def __init__(self, chat, message: FakeMessage):
+        self.chat = chat
+        self.input_chat = chat
+        self.chat_id = chat.id
+        self.message = message
+
+
+class FakeClient:
+    """
+    Минимум TelegramClient для пути анализа: get_entity / get_messages /
+    get_participants / send_message. История чата – последние сообщения,
+    уже «пришедшие» в воспроизведении. latency – имитация сети на каждый вызов.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.flood_sleep_threshold = 60
+        self.calls: dict[str, int] = defaultdict(int)
+
+        self._chats: dict[int, FakeEntity] = {}
+        self._by_username: dict[str, FakeEntity] = {}
+        self._history: dict[int, deque] = defaultdict(lambda: deque(maxlen=100))
+
+    async def _rpc_delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def chat(self, meta: dict) -> FakeEntity:
+        entity = self._chats.get(meta["id"])
+        if entity is None:
+            entity = FakeEntity(
+                id=meta["id"],
+                title=meta.get("title"),
+                username=meta.get("username"),
+                broadcast=meta.get("broadcast", False),
+                participants_count=meta.get("participants_count", 0),
+                about="",
+            )
+            self._chats[meta["id"]] = entity
+            if entity.username:
+                self._by_username[entity.username.lower()] = entity
+        return entity
+
+    def deliver(self, chat: FakeEntity, message: FakeMessage):
+        self._history[chat.id].appendleft(message)
+
+    async def get_entity(self, entity):
+        self.calls["get_entity"] += 1
+        await self._rpc_delay()
+        if isinstance(entity, FakeEntity):
+            return entity
+        if isinstance(entity, int) and entity in self._chats:
+            return self._chats[entity]
+        if isinstance(entity, str) and entity.lstrip("@").lower() in self._by_username:
+            return self._by_username[entity.lstrip("@").lower()]
+        raise ValueError(f"Cannot find any entity corresponding to {entity!r}")
+
+    async def get_messages(self, entity, limit=20, **kwargs):
+        self.calls["get_messages"] += 1
+        await self._rpc_delay()
+        return list(self._history[entity.id])[:limit]
+
+    async def get_participants(self, entity, limit=None, **kwargs):
+        self.calls["get_participants"] += 1
+        await self._rpc_delay()
+        return []
+
+    async def send_message(self, entity, text, **kwargs):
+        self.calls["send_message"] += 1
+        await self._rpc_delay()
+
+
+# ======================================================
+#   ВОСПРОИЗВЕДЕНИЕ
+# ======================================================
+
+
+class StageTimer:
+    """Оборачивает async-методы экземпляра и копит их латентность."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    def wrap(self, obj, name: str, label: str | None = None):
+        method = getattr(obj, name)
+        samples = self.samples[label or name]
+        is_async = asyncio.iscoroutinefunction(method)
+
+        if is_async:
+
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    samples.append(time.perf_counter() - started)
+
+        else:
+
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    samples.append(time.perf_counter() - started)
+
+        setattr(obj, name, timed)
+
+    def report(self) -> dict:
+        result = {}
+        for label, samples in self.samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            result[label] = {
+                "count": len(samples),
+                "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+                "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+                "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+                "p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+            }
+        return result
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _db_footprint(db) -> dict:
+    size = sum(
+        os.path.getsize(db.db_name + suffix)
+        for suffix in ("", "-wal")
+        if os.path.exists(db.db_name + suffix)
+    )
+    conn = db._connect()
+    try:
+        rows = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("channel_messages", "suspicious_channels", "alert_outbox", "activity_rollup")
+        }
+    finally:
+        conn.close()
+    return {"bytes": size, "rows": rows}
+
+
+async def _wait_pipeline_idle(pipeline):
+    """Пайплайн пуст, когда всё принятое обработано или выброшено – два раза подряд."""
+    idle_checks = 0
+    while idle_checks < 2:
+        idle = all(s.accepted == s.processed + s.dropped for s in pipeline.stages)
+        idle_checks = idle_checks + 1 if idle else 0
+        await asyncio.sleep(0.01)
+
+
+async def replay(
+    path: str,
+    mode: str = "pipeline",
+    speed: float = 0.0,
+    loops: int = 1,
+    db_path: str | None = None,
+    rpc_latency: float = 0.0,
+    real_rpc_limits: bool = False,
+) -> dict:
+    """
+    Прогоняет запись через TelegramMonitor:
+    - live     – analyze_message (стадии подряд, как без очередей)
+    - pipeline – pipeline.submit, как живой NewMessage-обработчик
+    - process  – _process_text_for_entity (путь history/bots/manual)
+    speed 0 – максимально быстро, иначе во столько раз быстрее записи.
+    """
+    from database_manager import DatabaseManager
+    from keyword_manager import KeywordManager
+    from rpc_scheduler import DEFAULT_FAMILY_LIMITS, RpcScheduler
+    from seen_set import SeenSet
+    from telegram_monitor import TelegramMonitor
+
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="kz-replay-"), "replay.db")
+    db = DatabaseManager(db_path)
+    before = _db_footprint(db)
+
+    client = FakeClient(latency=rpc_latency)
+    # по умолчанию лимиты RPC не мешают мерить сам конвейер
+    limits = None if real_rpc_limits else {f: (1e9, 10**9) for f in DEFAULT_FAMILY_LIMITS}
+    rpc = RpcScheduler(client, name="replay", family_limits=limits)
+    tm = TelegramMonitor(client, db, KeywordManager(), name="replay", rpc=rpc, seen=SeenSet())
+
+    timer = StageTimer()
+    if mode == "live":
+        timer.wrap(tm, "_ingest_event", "ingest")
+        timer.wrap(tm, "_analyze_stage", "analysis")
+        timer.wrap(tm, "_persist_stage", "persist")
+        timer.wrap(tm, "_alert_stage", "alert")
+        timer.wrap(tm, "analyze_message", "end_to_end")
+    elif mode == "process":
+        timer.wrap(tm, "analyze_text", "analysis")
+        timer.wrap(tm, "_persist_suspicious", "persist")
+        timer.wrap(tm, "_send_alert", "alert")
+        timer.wrap(tm, "_process_text_for_entity", "end_to_end")
+    elif mode == "pipeline":
+        tm.pipeline.start()
+    else:
+        raise ValueError(f"Неизвестный режим: {mode}")
+
+    fed = 0
+    started = time.perf_counter()
+
+    for loop_no in range(loops):
+        loop_started = time.perf_counter()
+        # новые id на каждом круге, чтобы SeenSet не отсёк повтор
+        id_offset = loop_no * 1_000_000_000
+
+        for meta, event in read_recording(path):
+            if speed > 0:
+                delay = loop_started + event["t"] / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            chat = client.chat(meta)
+            message = FakeMessage(client, chat, event, event["id"] + id_offset)
+            client.deliver(chat, message)
+
+            if mode == "process":
+                if tm.seen.check_and_add(chat.id, message.id):
+                    await tm._process_text_for_entity(
+                        entity=chat,
+                        text=message.text,
+                        source="history",
+                        message_id=message.id,
+                        message=message,
+                    )
+            elif mode == "live":
+                await tm.analyze_message(FakeEvent(chat, message))
+            else:
+                if tm.seen.check_and_add(chat.id, message.id):
+                    await tm.pipeline.submit(FakeEvent(chat, message))
+            fed += 1
+
+    if mode == "pipeline":
+        await _wait_pipeline_idle(tm.pipeline)
+    elapsed = time.perf_counter() - started
+
+    stages = timer.report()
+    if mode == "pipeline":
+        stages = tm.pipeline.stats()
+        await tm.pipeline.stop()
+
+    after = _db_footprint(db)
+    return {
+        "recording": path,
+        "mode": mode,
+        "speed": speed,
+        "loops": loops,
+        "rpc_latency_ms": rpc_latency * 1000,
+        "real_rpc_limits": real_rpc_limits,
+        "events": fed,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(fed / elapsed, 1) if elapsed else None,
+        "stages": stages,
+        "rpc_calls": dict(client.calls),
+        "db": {
+            "path": db_path,
+            "before": before,
+            "after": after,
+            "growth_bytes": after["bytes"] - before["bytes"],
+            "bytes_per_event": round((after["bytes"] - before["bytes"]) / fed, 1) if fed else None,
+            "new_rows": {t: after["rows"][t] - before["rows"][t] for t in after["rows"]},
+        },
+    }
+
+
+# ======================================================
+#   CLI
+# ======================================================
+
+
+def _prepare_env():
+    # config требует хотя бы один аккаунт; для synth/replay сеть не нужна
+    if not any(key.startswith("ACCOUNT_") for key in os.environ):
+        os.environ.update(
+            {
+                "ACCOUNT_1_SESSION": "replay",
+                "ACCOUNT_1_PHONE": "+70000000000",
+                "ACCOUNT_1_API_ID": "1",
+                "ACCOUNT_1_API_HASH": "replay",
+            }
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запись и воспроизведение NewMessage для бенчмарка")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("record", help="записать живой поток аккаунта")
+    p.add_argument("path")
+    p.add_argument("--seconds", type=float, default=600)
+    p.add_argument("--limit", type=int)
+    p.add_argument("--account", type=int, default=0, help="индекс аккаунта из .env")
+
+    p = sub.add_parser("synth", help="сгенерировать синтетический поток")
+    p.add_argument("path")
+    p.add_argument("--events", type=int, default=10000)
+    p.add_argument("--chats", type=int, default=100)
+    p.add_argument("--suspicious", type=float, default=0.05, help="доля подозрительных")
+    p.add_argument("--rate", type=float, default=50, help="событий в секунду (для --speed)")
+    p.add_argument("--seed", type=int, default=1)
+
+    p = sub.add_parser("replay", help="прогнать запись через монитор")
+    p.add_argument("path")
+    p.add_argument("--mode", choices=("live", "pipeline", "process"), default="pipeline")
+    p.add_argument("--speed", type=float, default=0, help="0 – максимально быстро")
+    p.add_argument("--loops", type=int, default=1)
+    p.add_argument("--db", help="файл БД (по умолчанию – новый во временной папке)")
+    p.add_argument("--rpc-latency-ms", type=float, default=0)
+    p.add_argument("--real-rpc-limits", action="store_true", help="лимиты RpcScheduler как в проде")
+    p.add_argument("--report", help="куда записать JSON-отчёт")
+    p.add_argument("--verbose", action="store_true", help="не глушить INFO-логи монитора")
+
+    args = parser.parse_args()
+    _prepare_env()
+    import config  # noqa: F401 – настраивает логирование
+
+    if args.command == "record":
+        asyncio.run(record_live(args.path, args.seconds, args.limit, args.account))
+        return
+    if args.command == "synth":
+        synthesize(args.path, args.events, args.chats, args.suspicious, args.rate, args.seed)
+        return
+
+    if not args.verbose:
+        # лог каждого подозрительного сообщения сам по себе заметно тормозит прогон
+        logging.getLogger().setLevel(logging.WARNING)
+
+    report = asyncio.run(
+        replay(
+            args.path,
+            mode=args.mode,
+            speed=args.speed,
+            loops=args.loops,
+            db_path=args.db,
+            rpc_latency=args.rpc_latency_ms / 1000,
+            real_rpc_limits=args.real_rpc_limits,
+        )
+    )
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text, file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
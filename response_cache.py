@@ -0,0 +1,91 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+
+from read_pool import ReadPool
+
+
+class ResponseCache:
+    """
+    Кеш JSON-ответов веб-API с ETag.
+
+    Ключ – эндпоинт и параметры, значение – готовое тело ответа и поколение
+    данных (data_generation), при котором оно посчитано. Поколение повышает
+    DatabaseManager при каждой записи каналов/сообщений – в том числе из
+    другого процесса, поэтому сброс работает при любом WEB_MODE/RUN_MODE.
+
+    Само поколение читаем из БД не чаще раза в check_interval секунд, так что
+    почти все запросы дашборда обходятся без SQL. ETag = поколение + ключ:
+    если у браузера та же версия, отвечаем 304 без тела. Все чтения БД идут
+    через ReadPool, вне event loop'а.
+    """
+
+    def __init__(self, reads: ReadPool, check_interval: float = 1.0, max_entries: int = 256):
+        self.reads = reads
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+
+        self._entries: OrderedDict[str, tuple[int, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._checked_at = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    async def generation(self) -> int:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._generation = await self.reads.call(self.reads.db.get_data_generation)
+            self._checked_at = now
+        return self._generation
+
+    @staticmethod
+    def _etag(generation: int, key: str) -> str:
+        digest = hashlib.blake2b(key.encode(), digest_size=6).hexdigest()
+        return f'"{generation}-{digest}"'
+
+    async def respond(self, request: Request, key: str, compute) -> Response:
+        """compute – корутинная функция без аргументов, возвращает данные для JSON."""
+        generation = await self.generation()
+        etag = self._etag(generation, key)
+        # no-cache: браузер хранит ответ, но каждый раз переспрашивает по ETag
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+        if etag in request.headers.get("if-none-match", ""):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return Response(entry[1], media_type="application/json", headers=headers)
+
+        self.misses += 1
+        # поколение прочитано до запроса: если запись пришла между ними,
+        # ответ свежее метки и просто пересчитается на следующем поколении
+        body = json.dumps(await compute(), ensure_ascii=False, default=str).encode()
+
+        with self._lock:
+            self._entries[key] = (generation, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return Response(body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        return {
+            "generation": self._generation,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
@@ -0,0 +1,285 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telethon.errors import FloodWaitError
+
+from metrics import RPC_SECONDS, Gauge
+from rate_limit import TokenBucket
+
+
+# Классы приоритета: меньше – важнее
+PRIORITIES = {
+    "live": 0,
+    "manual": 1,
+    "discovery": 2,
+    "bots": 3,
+}
+
+# Семейство по имени метода Telethon – у каждого свой token bucket
+METHOD_FAMILIES = {
+    "get_messages": "messages",
+    "iter_messages": "messages",
+    "get_dialogs": "dialogs",
+    "iter_dialogs": "dialogs",
+    "get_entity": "entity",
+    "get_input_entity": "entity",
+    "get_sender": "entity",
+    "get_participants": "participants",
+    "iter_participants": "participants",
+    "send_message": "send",
+    "click": "send",
+}
+
+# (запросов в секунду, burst) по семействам
+DEFAULT_FAMILY_LIMITS = {
+    "messages": (3.0, 10),
+    "dialogs": (1.0, 3),
+    "entity": (2.0, 5),
+    "participants": (0.5, 2),
+    "send": (0.5, 2),
+    "default": (2.0, 5),
+}
+
+# Все планировщики процесса (по имени аккаунта) – для /api/rpc
+SCHEDULERS: dict[str, "RpcScheduler"] = {}
+
+
+RPC_WAITING = Gauge(
+    "kz_rpc_waiting",
+    "RPC calls waiting for a token",
+    ("account", "family"),
+    collect_fn=lambda: [
+        ((name, family), len(queue))
+        for name, scheduler in list(SCHEDULERS.items())
+        for family, queue in scheduler._queues.items()
+    ],
+)
+
+
+def priority_for_source(source: str) -> str:
+    """Класс приоритета по source из TelegramMonitor (live / manual_scan / bot_x / ...)."""
+    if source == "live":
+        return "live"
+    if source.startswith("manual"):
+        return "manual"
+    if source.startswith("bot"):
+        return "bots"
+    return "discovery"
+
+
+class RpcScheduler:
+    """
+    Планировщик RPC одного аккаунта.
+
+    Все вызовы Telethon идут через call()/iterate():
+    - токены выдаются по приоритету (live > manual > discovery > bots)
+    - у каждого семейства методов свой token bucket
+    - FloodWait на любом вызове ставит на паузу весь аккаунт
+    """
+
+    def __init__(
+        self,
+        client,
+        name: str = "account",
+        family_limits: dict | None = None,
+        max_flood_retry: int = 300,
+    ):
+        self.client = client
+        self.name = name
+        self.max_flood_retry = max_flood_retry
+
+        # FloodWait обрабатываем сами (глобальная пауза), а не сном внутри Telethon
+        if client is not None:
+            client.flood_sleep_threshold = 0
+
+        limits = dict(DEFAULT_FAMILY_LIMITS)
+        limits.update(family_limits or {})
+        self.buckets = {
+            family: TokenBucket(rate, burst) for family, (rate, burst) in limits.items()
+        }
+
+        self._queues: dict[str, list] = {family: [] for family in self.buckets}
+        self._dispatchers: dict[str, asyncio.Task] = {}
+        self._seq = itertools.count()
+
+        self.paused_until = 0.0
+        self.metrics = {
+            cls: {
+                "calls": 0,
+                "errors": 0,
+                "flood_waits": 0,
+                "queue_wait_s": 0.0,
+                "rpc_time_s": 0.0,
+            }
+            for cls in PRIORITIES
+        }
+
+        SCHEDULERS[name] = self
+
+    # ======================================================
+    #   ВЫДАЧА ТОКЕНОВ
+    # ======================================================
+
+    async def _wait_pause(self):
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def _acquire(self, family: str, priority: str) -> float:
+        if family not in self.buckets:
+            family = "default"
+
+        started = time.monotonic()
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._queues[family], (PRIORITIES[priority], next(self._seq), fut)
+        )
+
+        if family not in self._dispatchers:
+            self._dispatchers[family] = asyncio.create_task(self._dispatch(family))
+
+        await fut
+        return time.monotonic() - started
+
+    async def _dispatch(self, family: str):
+        """Раздаёт токены семейства ожидающим в порядке приоритета."""
+        heap = self._queues[family]
+        bucket = self.buckets[family]
+
+        try:
+            while heap:
+                await self._wait_pause()
+                await bucket.acquire()
+                # пауза могла начаться, пока ждали токен
+                await self._wait_pause()
+
+                while heap:
+                    _, _, fut = heapq.heappop(heap)
+                    if not fut.done():
+                        fut.set_result(None)
+                        break
+        finally:
+            self._dispatchers.pop(family, None)
+
+    def _on_flood_wait(self, seconds: int, priority: str):
+        self.metrics[priority]["flood_waits"] += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        logging.warning(
+            f"⏳ [{self.name}] FloodWait {seconds}s – all requests paused"
+        )
+
+    # ======================================================
+    #   ВЫЗОВЫ
+    # ======================================================
+
+    async def call(
+        self,
+        method,
+        *args,
+        priority: str = "discovery",
+        family: str | None = None,
+        **kwargs,
+    ):
+        """
+        await method(*args, **kwargs) под лимитами аккаунта.
+        После FloodWait (если он не длиннее max_flood_retry) пробуем ещё раз.
+        """
+        family = family or METHOD_FAMILIES.get(method.__name__, "default")
+        stats = self.metrics[priority]
+
+        for attempt in range(2):
+            stats["queue_wait_s"] += await self._acquire(family, priority)
+            stats["calls"] += 1
+            started = time.monotonic()
+
+            try:
+                return await method(*args, **kwargs)
+            except FloodWaitError as e:
+                self._on_flood_wait(e.seconds, priority)
+                if attempt == 0 and e.seconds <= self.max_flood_retry:
+                    continue
+                stats["errors"] += 1
+                raise
+            except Exception:
+                stats["errors"] += 1
+                raise
+            finally:
+                elapsed = time.monotonic() - started
+                stats["rpc_time_s"] += elapsed
+                RPC_SECONDS.observe(elapsed, self.name, method.__name__)
+
+    async def iterate(
+        self,
+        method,
+        *args,
+        priority: str = "discovery",
+        family: str | None = None,
+        chunk: int = 100,
+        **kwargs,
+    ):
+        """
+        Обёртка над iter_* методами: Telethon сам делает запросы пачками
+        по ~100 элементов, поэтому берём токен перед каждой пачкой.
+        iter_messages после FloodWait продолжаем с последнего сообщения.
+        """
+        family = family or METHOD_FAMILIES.get(method.__name__, "default")
+        stats = self.metrics[priority]
+        resumable = method.__name__ == "iter_messages"
+        limit = kwargs.get("limit")
+        yielded = 0
+
+        while True:
+            count = 0
+            last = None
+            stats["queue_wait_s"] += await self._acquire(family, priority)
+            stats["calls"] += 1
+
+            try:
+                async for item in method(*args, **kwargs):
+                    count += 1
+                    yielded += 1
+                    last = item
+                    yield item
+
+                    if count % chunk == 0:
+                        stats["queue_wait_s"] += await self._acquire(family, priority)
+                        stats["calls"] += 1
+                return
+            except FloodWaitError as e:
+                self._on_flood_wait(e.seconds, priority)
+                if not resumable or e.seconds > self.max_flood_retry:
+                    stats["errors"] += 1
+                    raise
+
+                if last is not None:
+                    kwargs["offset_id"] = last.id
+                if limit is not None:
+                    kwargs["limit"] = limit - yielded
+                    if kwargs["limit"] <= 0:
+                        return
+            except Exception:
+                stats["errors"] += 1
+                raise
+
+    # ======================================================
+    #   СТАТИСТИКА
+    # ======================================================
+
+    def stats(self) -> dict:
+        return {
+            "paused_for_s": round(max(0.0, self.paused_until - time.monotonic()), 1),
+            "waiting": {family: len(q) for family, q in self._queues.items() if q},
+            "classes": {
+                cls: {k: round(v, 3) if isinstance(v, float) else v for k, v in m.items()}
+                for cls, m in self.metrics.items()
+            },
+        }
+
+
+def all_scheduler_stats() -> dict:
+    return {name: s.stats() for name, s in list(SCHEDULERS.items())}
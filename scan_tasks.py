@@ -1,6 +1,68 @@
 # scan_tasks.py
-import queue
+import asyncio
+import logging
+import threading
 
-# Очередь задач на ручное сканирование.
-# В неё будет класть задачи веб-интерфейс, а основной монитор забирать.
-scan_queue: queue.Queue[str] = queue.Queue()
+# Задачи ручного сканирования живут в таблице scan_jobs (DatabaseManager).
+# Здесь – только пробуждение воркеров: веб-интерфейс работает в своём потоке
+# со своим event loop, поэтому будим воркеры через call_soon_threadsafe,
+# а не заставляем их опрашивать очередь раз в секунду.
+# Если веб запущен отдельным процессом, таблица scan_jobs и есть канал
+# между ними, а будит воркеры watch_database().
+
+
+def normalize_identifier(identifier: str) -> str:
+    """@username / t.me/username / https://t.me/username -> username."""
+    ident = (identifier or "").strip()
+    if ident.startswith("http") or ident.startswith("t.me/"):
+        ident = ident.rstrip("/").split("/")[-1]
+    if ident.startswith("@"):
+        ident = ident[1:]
+    return ident
+
+
+class ScanWakeup:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def register(self) -> asyncio.Event:
+        """Вызывается воркером внутри своего event loop."""
+        event = asyncio.Event()
+        with self._lock:
+            self._waiters.append((asyncio.get_running_loop(), event))
+        return event
+
+    def notify(self):
+        """Можно вызывать из любого потока."""
+        with self._lock:
+            waiters = list(self._waiters)
+
+        for loop, event in waiters:
+            if loop.is_closed():
+                continue
+            loop.call_soon_threadsafe(event.set)
+
+    async def watch_database(self, db, interval: float = 1.0):
+        """
+        Для веб-интерфейса в отдельном процессе (WEB_MODE=process):
+        notify() из другого процесса сюда не дойдёт, поэтому один таск
+        на процесс монитора смотрит в scan_jobs и будит воркеры сам.
+
+        Запрос идёт в потоке (не держим event loop), а будим только когда
+        отпечаток очереди изменился: работу, которую воркеры уже видели и
+        не взяли (например, канал им недоступен), повторно не объявляем.
+        """
+        last = None
+        while True:
+            try:
+                watermark = await asyncio.to_thread(db.scan_work_watermark)
+                if watermark is not None and watermark != last:
+                    self.notify()
+                last = watermark
+            except Exception as e:
+                logging.error(f"❌ Scan queue watch error: {e}")
+            await asyncio.sleep(interval)
+
+
+scan_wakeup = ScanWakeup()
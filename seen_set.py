@@ -0,0 +1,102 @@
+from collections import OrderedDict
+
+
+class SeenSet:
+    """
+    Компактное множество уже обработанных сообщений (chat_id, message_id).
+
+    На каждый чат – скользящий битсет: бит на message_id в окне
+    [base, base + window_bits). id в Telegram растут внутри чата,
+    поэтому окно двигается вперёд вместе с новыми сообщениями.
+    Сообщения старше окна считаются невиденными (лучше повторно
+    проанализировать, чем потерять).
+
+    Число чатов ограничено max_chats – давно не активные вытесняются (LRU).
+    Один экземпляр общий для всех AccountRunner'ов процесса.
+    """
+
+    def __init__(self, window_bits: int = 1 << 15, max_chats: int = 50_000):
+        # окно кратно 8, чтобы сдвигать целыми байтами
+        self.window_bits = max(8, window_bits - window_bits % 8)
+        self.max_chats = max_chats
+
+        # chat_id -> [base, bytearray]
+        self._chats: OrderedDict[int, list] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def check_and_add(self, chat_id, message_id) -> bool:
+        """
+        True – сообщение новое (и теперь помечено), False – уже было.
+        """
+        if chat_id is None or message_id is None:
+            return True
+
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            # немного места ниже первого id – под историю, которая идёт вниз
+            base = max(0, message_id - 256)
+            base -= base % 8
+            entry = [base, bytearray()]
+            self._chats[chat_id] = entry
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+
+        base, bits = entry
+        offset = message_id - base
+
+        if offset < 0:
+            # расширяем окно вниз, если влезаем в лимит
+            grow = (-offset + 7) // 8
+            if (len(bits) + grow) * 8 > self.window_bits:
+                self.misses += 1
+                return True
+            bits[0:0] = bytes(grow)
+            base -= grow * 8
+            entry[0] = base
+            offset = message_id - base
+
+        if offset >= self.window_bits:
+            # сдвигаем окно вперёд, выкидывая самые старые байты
+            shift = (offset - self.window_bits) // 8 + 1
+            del bits[:shift]
+            base += shift * 8
+            entry[0] = base
+            offset = message_id - base
+
+        byte_index, bit = divmod(offset, 8)
+        if byte_index >= len(bits):
+            bits.extend(bytes(byte_index - len(bits) + 1))
+
+        mask = 1 << bit
+        if bits[byte_index] & mask:
+            self.hits += 1
+            return False
+
+        bits[byte_index] |= mask
+        self.misses += 1
+        return True
+
+    def discard(self, chat_id, message_id):
+        """
+        Снимает отметку: сообщение так и не обработали (выкинуто очередью,
+        упало с ошибкой) – пусть его подберёт другой аккаунт или дочитка.
+        """
+        entry = self._chats.get(chat_id)
+        if entry is None or message_id is None:
+            return
+        base, bits = entry
+        byte_index, bit = divmod(message_id - base, 8)
+        if 0 <= byte_index < len(bits):
+            bits[byte_index] &= ~(1 << bit) & 0xFF
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._chats),
+            "bytes": sum(len(bits) for _, bits in self._chats.values()),
+            "duplicates_skipped": self.hits,
+            "unique_seen": self.misses,
+        }
@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import logging
+
+
+class ShardMap:
+    """
+    Кто из аккаунтов процесса «владеет» чатом.
+
+    Историю, дочитку и discovery по чату делает только владелец,
+    остальные аккаунты в этом чате – живой резерв (NewMessage + SeenSet).
+    Так объём RPC не растёт от того, что аккаунты сидят в одних и тех же чатах.
+
+    Владелец выбирается rendezvous-хешированием (HRW) по (аккаунт, chat_id)
+    среди живых аккаунтов, которые в этом чате состоят. Когда аккаунт
+    уходит или приходит, переезжают только его чаты – остальные остаются
+    на месте.
+
+    С db карта общая для всех процессов (режим supervisor): свои аккаунты
+    и их чаты публикуются в БД (account_presence / shard_members), чужие
+    живые аккаунты раз в sync_interval подтягиваются оттуда и участвуют
+    в выборе владельца наравне со своими. Аккаунт чужого процесса, не
+    отмечавшийся дольше ttl, считается выбывшим.
+    """
+
+    def __init__(self, db=None, sync_interval: float = 30, ttl: float = 90):
+        # аккаунт -> chat_id диалогов, которые он видит
+        self._members: dict[str, set[int]] = {}
+        self._alive: set[str] = set()
+        self._expected: set[str] = set()
+        self._ready = asyncio.Event()
+
+        self.db = db
+        self.sync_interval = sync_interval
+        self.ttl = ttl
+        # живые аккаунты других процессов -> их чаты (из БД)
+        self._remote: dict[str, set[int]] = {}
+        # свои аккаунты, чей список чатов ещё не опубликован
+        self._dirty: set[str] = set()
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def _weight(account: str, chat_id: int) -> int:
+        digest = hashlib.blake2b(f"{account}:{chat_id}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    # ======================================================
+    #   СОСТАВ
+    # ======================================================
+
+    def expect(self, accounts):
+        """Какие аккаунты ждать перед первым распределением."""
+        self._expected = set(accounts)
+        self._check_ready()
+
+    def join(self, account: str, chat_ids):
+        """Аккаунт пришёл (или перечитал диалоги) со своим списком чатов."""
+        before = self._owned_by(account) if account in self._alive else set()
+
+        self._members.setdefault(account, set()).update(chat_ids)
+        self._alive.add(account)
+        self._dirty.add(account)
+        self._check_ready()
+
+        gained = self._owned_by(account) - before
+        if gained:
+            logging.info(
+                f"🔀 [{account}] owns {len(self._owned_by(account))} chats "
+                f"(+{len(gained)}) of {len(self._members[account])}"
+            )
+
+    def add_chat(self, account: str, chat_id: int):
+        members = self._members.setdefault(account, set())
+        if chat_id not in members:
+            members.add(chat_id)
+            self._dirty.add(account)
+
+    def leave(self, account: str):
+        """Аккаунт отвалился: его чаты переезжают к следующим по весу."""
+        self._expected.discard(account)
+        self._check_ready()
+        if account not in self._alive:
+            return
+        owned = self._owned_by(account)
+        self._alive.discard(account)
+
+        orphaned = sum(1 for chat_id in owned if self.owner(chat_id) is None)
+        logging.warning(
+            f"🔀 [{account}] left shard map: {len(owned) - orphaned} chats moved, "
+            f"{orphaned} without owner"
+        )
+
+    def _check_ready(self):
+        if self._expected <= self._alive:
+            self._ready.set()
+
+    async def wait_ready(self, timeout: float = 60):
+        """Ждём, пока все ожидаемые аккаунты отметятся (но не дольше timeout)."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            missing = sorted(self._expected - self._alive)
+            logging.warning(f"🔀 Shard map not complete after {timeout}s, missing: {missing}")
+        # первое распределение – уже с учётом аккаунтов других процессов
+        await self.sync()
+
+    # ======================================================
+    #   ОБЩАЯ КАРТА (БД)
+    # ======================================================
+
+    async def sync(self):
+        """Публикуем свои аккаунты/чаты и подтягиваем чужие живые."""
+        if self.db is None:
+            return
+
+        alive = sorted(self._alive)
+        dirty = {a: set(self._members[a]) for a in self._dirty if a in self._alive}
+        self._dirty.clear()
+        local = set(self._members) | self._expected
+
+        def exchange():
+            self.db.touch_account_presence(alive)
+            self.db.save_shard_members(dirty)
+            return self.db.get_shard_members(self.ttl, exclude=local)
+
+        try:
+            remote = await asyncio.to_thread(exchange)
+        except Exception as e:
+            self._dirty.update(dirty)
+            logging.error(f"❌ Shard map sync error: {e}")
+            return
+
+        if set(remote) != set(self._remote):
+            logging.info(f"🔀 Accounts in other processes: {sorted(remote)}")
+        self._remote = remote
+
+    def start(self):
+        """Фоновая синхронизация с БД; без db и при повторном вызове ничего не делает."""
+        if self.db is None:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="shard-sync")
+
+    async def _run(self):
+        while True:
+            await self.sync()
+            await asyncio.sleep(self.sync_interval)
+
+    # ======================================================
+    #   ВЛАДЕЛЕЦ
+    # ======================================================
+
+    def owner(self, chat_id: int) -> str | None:
+        candidates = [a for a in self._alive if chat_id in self._members.get(a, ())]
+        candidates += [a for a, chats in self._remote.items() if chat_id in chats]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda a: self._weight(a, chat_id))
+
+    def owns(self, account: str, chat_id: int) -> bool:
+        """
+        True – чат должен обрабатывать этот аккаунт.
+        Чат, о котором никто из живых не знает, берёт тот, кто спросил.
+        """
+        owner = self.owner(chat_id)
+        return owner is None or owner == account
+
+    def _owned_by(self, account: str) -> set[int]:
+        return {
+            chat_id
+            for chat_id in self._members.get(account, ())
+            if self.owner(chat_id) == account
+        }
+
+    def stats(self) -> dict:
+        chats = set().union(*self._members.values()) if self._members else set()
+        return {
+            "accounts": sorted(self._alive),
+            "remote_accounts": sorted(self._remote),
+            "chats": len(chats),
+            "owned": {a: len(self._owned_by(a)) for a in sorted(self._alive)},
+            "shared_chats": sum(
+                1 for c in chats if sum(c in m for m in self._members.values()) > 1
+            ),
+        }
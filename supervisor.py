@@ -0,0 +1,431 @@
+import asyncio
+import logging
+import multiprocessing as mp
+import queue
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+from config import (
+    ACCOUNTS,
+    ACCOUNTS_PER_PROCESS,
+    CHILD_HEARTBEAT_TIMEOUT,
+    DATABASE_NAME,
+    SCAN_WATCH_INTERVAL,
+    WEB_MODE,
+    WEB_PORT,
+)
+from database_manager import DatabaseManager
+from metrics import Gauge, snapshot
+
+HEARTBEAT_INTERVAL = 10
+# Ребёнок, проживший дольше этого, считается стабильным – backoff сбрасывается
+STABLE_RUN_SECONDS = 600
+MAX_BACKOFF = 300
+
+
+# ======================================================
+#   ОБЩИЙ WRITER
+# ======================================================
+
+
+class DatabaseWriter(threading.Thread):
+    """
+    Единственный писатель горячих данных в режиме supervisor.
+    Дети кладут операции (save_message, save_channel, ...) каждый в свою
+    очередь, ChildWrites перекладывает их в общую очередь этого потока,
+    здесь они применяются пачками в одной транзакции – дети не ждут
+    блокировку SQLite и не мешают друг другу.
+    """
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        write_queue,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+    ):
+        super().__init__(name="db-writer", daemon=True)
+        self.db = db
+        self.write_queue = write_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.written = 0
+        self.batches = 0
+        self._stopping = threading.Event()
+
+        Gauge(
+            "kz_db_write_queue_depth",
+            "Operations waiting for the shared DB writer",
+            collect_fn=lambda: [((), self.write_queue.qsize())],
+        )
+
+    def run(self):
+        while not (self._stopping.is_set() and self.write_queue.empty()):
+            try:
+                first = self.write_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.write_queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                self.written += self.db.apply_writes(batch)
+                self.batches += 1
+            except Exception as e:
+                logging.error(f"❌ DB writer error ({len(batch)} ops lost): {e}")
+
+    def stop(self):
+        self._stopping.set()
+
+
+class ChildWrites(threading.Thread):
+    """
+    Перекладывает операции записи одного ребёнка из его mp.Queue в общую
+    очередь DatabaseWriter. У каждого ребёнка свои очереди: убитый на
+    середине put() процесс может сломать mp.Queue (недописанная запись,
+    занятый lock) – тогда страдает только его очередь, и её выбрасывают
+    вместе с ним, а не все дети и writer.
+    """
+
+    def __init__(self, group_id: int, source, target: queue.Queue):
+        super().__init__(name=f"child-writes-{group_id}", daemon=True)
+        self.group_id = group_id
+        self.source = source
+        self.target = target
+        self._stopping = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                self.target.put(self.source.get(timeout=0.5))
+            except queue.Empty:
+                # после stop() дочитываем то, что ребёнок успел отправить
+                if self._stopping.is_set():
+                    return
+            except Exception as e:
+                logging.error(f"❌ Child #{self.group_id} write queue broken: {e}")
+                return
+
+    def stop(self):
+        self._stopping.set()
+
+
+# ======================================================
+#   ДОЧЕРНИЙ ПРОЦЕСС
+# ======================================================
+
+
+def child_main(group_id: int, account_indices: list[int], write_queue, health_queue):
+    """Точка входа дочернего процесса: свой event loop, своя группа аккаунтов."""
+    try:
+        asyncio.run(_child_run(group_id, account_indices, write_queue, health_queue))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _child_run(group_id: int, account_indices: list[int], write_queue, health_queue):
+    # main тянет Telethon и всё остальное – импортируем уже в ребёнке
+    from ingest_pipeline import all_pipeline_stats
+    from main import MultiKZMonitor
+    from rpc_scheduler import all_scheduler_stats
+    from scan_tasks import scan_wakeup
+
+    accounts_cfg = [ACCOUNTS[i] for i in account_indices]
+    db = DatabaseManager(DATABASE_NAME, write_queue=write_queue)
+
+    monitor = MultiKZMonitor(
+        accounts_cfg=accounts_cfg,
+        db=db,
+        # алерты шлёт только первая группа, чтобы не было дублей
+        run_alert_sender=group_id == 0,
+        requeue_scan_jobs=False,
+    )
+
+    # heartbeat'ы идут с первых секунд: логин и initial_scan бывают долгими,
+    # а ребёнок, зависший на них, супервизор тоже должен уметь убить
+    started = False
+
+    async def heartbeat():
+        while True:
+            health_queue.put(
+                {
+                    "group_id": group_id,
+                    "accounts": [runner.session_name for runner in monitor.accounts],
+                    "ts": time.time(),
+                    "status": "running" if started else "starting",
+                    "payload": payload() if started else {},
+                }
+            )
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    def payload() -> dict:
+        return {
+            "pipelines": all_pipeline_stats(),
+            "rpc": all_scheduler_stats(),
+            "seen": monitor.seen.stats(),
+            # метрики ребёнка – /metrics сложит их с остальными процессами
+            "metrics": snapshot(),
+            "shards": monitor.shards.stats(),
+            "polling": {
+                runner.session_name: runner.poller.stats()
+                for runner in monitor.accounts
+                if runner.poller
+            },
+        }
+
+    beats = asyncio.create_task(heartbeat())
+
+    if not await monitor.initialize_all():
+        raise SystemExit(1)
+
+    await monitor.start_tasks()
+    # веб в другом процессе – воркеры ручных сканов будим по таблице
+    asyncio.create_task(scan_wakeup.watch_database(db, interval=SCAN_WATCH_INTERVAL))
+
+    started = True
+    await beats
+
+
+# ======================================================
+#   СУПЕРВИЗОР
+# ======================================================
+
+
+class Supervisor:
+    """
+    Запускает по дочернему процессу на группу аккаунтов,
+    перезапускает упавшие/зависшие с экспоненциальным backoff
+    и собирает их heartbeat'ы в таблицу process_health.
+    """
+
+    def __init__(self, accounts_per_process: int = ACCOUNTS_PER_PROCESS):
+        self.ctx = mp.get_context("spawn")
+        self.db = DatabaseManager(DATABASE_NAME)
+
+        # общая очередь writer'а – внутри процесса; у детей свои mp.Queue (_start_child)
+        self.write_queue: queue.Queue = queue.Queue()
+        self.writer = DatabaseWriter(self.db, self.write_queue)
+
+        indices = list(range(len(ACCOUNTS)))
+        size = max(1, accounts_per_process)
+        self.children: dict[int, dict] = {}
+        for group_id, start in enumerate(range(0, len(indices), size)):
+            self.children[group_id] = {
+                "account_indices": indices[start : start + size],
+                "accounts": [ACCOUNTS[i]["SESSION"] for i in indices[start : start + size]],
+                "process": None,
+                "health_queue": None,
+                "writes": None,
+                "restarts": 0,
+                "backoff": 1,
+                "next_start": 0.0,
+                "started_at": None,
+                "last_heartbeat": None,
+                "payload": {},
+                "status": "pending",
+            }
+
+        self.web_process: subprocess.Popen | None = None
+
+        logging.info(
+            f"✅ Supervisor initialized: {len(ACCOUNTS)} accounts "
+            f"in {len(self.children)} processes"
+        )
+
+    # ---------- дети ----------
+
+    def _start_child(self, group_id: int):
+        child = self.children[group_id]
+        # свежие очереди на каждый запуск: старые могли сломаться при kill
+        write_queue = self.ctx.Queue()
+        health_queue = self.ctx.Queue()
+        proc = self.ctx.Process(
+            target=child_main,
+            args=(group_id, child["account_indices"], write_queue, health_queue),
+            name=f"kz-monitor-{group_id}",
+            daemon=False,
+        )
+        proc.start()
+
+        writes = ChildWrites(group_id, write_queue, self.write_queue)
+        writes.start()
+
+        child["process"] = proc
+        child["health_queue"] = health_queue
+        child["writes"] = writes
+        child["started_at"] = time.time()
+        # время запуска – первый heartbeat: не приславший ни одного тоже зависший
+        child["last_heartbeat"] = child["started_at"]
+        child["status"] = "starting"
+        logging.info(
+            f"🚀 Child #{group_id} started (pid={proc.pid}, accounts={child['accounts']})"
+        )
+
+    def _check_children(self):
+        now = time.time()
+
+        for group_id, child in self.children.items():
+            proc = child["process"]
+
+            if proc is not None and not proc.is_alive():
+                ran = now - (child["started_at"] or now)
+                if ran > STABLE_RUN_SECONDS:
+                    child["backoff"] = 1
+
+                logging.error(
+                    f"❌ Child #{group_id} exited with code {proc.exitcode} "
+                    f"after {ran:.0f}s, restart in {child['backoff']}s"
+                )
+                child["process"] = None
+                self._drop_queues(child)
+                child["status"] = "crashed"
+                child["restarts"] += 1
+                child["next_start"] = now + child["backoff"]
+                child["backoff"] = min(child["backoff"] * 2, MAX_BACKOFF)
+                continue
+
+            if proc is not None:
+                if now - child["last_heartbeat"] > CHILD_HEARTBEAT_TIMEOUT:
+                    logging.error(f"❌ Child #{group_id} stopped sending heartbeats, killing")
+                    proc.terminate()
+                    child["status"] = "hung"
+                continue
+
+            if proc is None and now >= child["next_start"]:
+                self._start_child(group_id)
+
+    @staticmethod
+    def _drop_queues(child: dict):
+        """Очереди умершего ребёнка: дочитываем, что успел отправить, и выбрасываем."""
+        if child["writes"] is not None:
+            child["writes"].stop()
+        child["writes"] = None
+        child["health_queue"] = None
+
+    def _drain_health(self):
+        for group_id, child in self.children.items():
+            health_queue = child["health_queue"]
+            while health_queue is not None:
+                try:
+                    beat = health_queue.get_nowait()
+                except queue.Empty:
+                    break
+                except Exception as e:
+                    logging.error(f"❌ Child #{group_id} health queue broken: {e}")
+                    child["health_queue"] = None
+                    break
+                self._apply_beat(child, beat)
+
+    @staticmethod
+    def _apply_beat(child: dict, beat: dict):
+        child["last_heartbeat"] = beat["ts"]
+        child["payload"] = beat["payload"]
+        child["accounts"] = beat["accounts"] or child["accounts"]
+        child["status"] = beat.get("status", "running")
+
+    def _save_health(self):
+        def ts(value):
+            return datetime.fromtimestamp(value) if value else None
+
+        rows = []
+        for group_id, child in self.children.items():
+            proc = child["process"]
+            rows.append(
+                {
+                    "group_id": group_id,
+                    "pid": proc.pid if proc is not None else None,
+                    "accounts": child["accounts"],
+                    "status": child["status"],
+                    "restarts": child["restarts"],
+                    "started_at": ts(child["started_at"]),
+                    "last_heartbeat": ts(child["last_heartbeat"]),
+                    "payload": dict(
+                        child["payload"],
+                        writer={
+                            "written": self.writer.written,
+                            "batches": self.writer.batches,
+                        },
+                    ),
+                }
+            )
+        self.db.save_process_health(rows)
+
+    # ---------- веб ----------
+
+    def _start_web(self):
+        from main import run_web_interface, web_process_command
+
+        if WEB_MODE == "thread":
+            threading.Thread(target=run_web_interface, daemon=True).start()
+        elif WEB_MODE == "process":
+            self.web_process = subprocess.Popen(web_process_command())
+        else:
+            return
+        logging.info(f"🌐 Web interface available at: http://localhost:{WEB_PORT}")
+
+    # ---------- цикл ----------
+
+    def run(self):
+        requeued = self.db.requeue_running_scan_jobs()
+        if requeued:
+            logging.info(f"🧾 Requeued {requeued} interrupted scan jobs")
+
+        self.writer.start()
+        self._start_web()
+
+        last_saved = 0.0
+        try:
+            while True:
+                self._drain_health()
+                self._check_children()
+
+                if time.time() - last_saved >= 5:
+                    self._save_health()
+                    last_saved = time.time()
+
+                if self.web_process is not None and self.web_process.poll() is not None:
+                    logging.error("❌ Web interface process exited, restarting")
+                    self._start_web()
+
+                time.sleep(1)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        for child in self.children.values():
+            proc = child["process"]
+            if proc is not None and proc.is_alive():
+                proc.terminate()
+        for child in self.children.values():
+            proc = child["process"]
+            if proc is not None:
+                proc.join(timeout=10)
+
+        if self.web_process is not None:
+            self.web_process.terminate()
+
+        # дописываем то, что дети успели отправить
+        for child in self.children.values():
+            writes = child["writes"]
+            self._drop_queues(child)
+            if writes is not None:
+                writes.join(timeout=5)
+        self.writer.stop()
+        self.writer.join(timeout=30)
+
+
+def run_supervisor():
+    logging.info("🚀 Starting KZ Drug Shop Monitor in supervisor mode...")
+    Supervisor().run()
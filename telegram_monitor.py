@@ -1,13 +1,22 @@
 import logging
 from datetime import datetime
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 
 from telethon import events
 from telethon.tl.types import User
+from telethon.utils import get_peer_id
 
-from config import ALERT_CHAT
+from chat_marks import ChatMarks
+from config import ALERT_CHAT, PIPELINE_STAGES
 from database_manager import DatabaseManager
+from ingest_pipeline import IngestPipeline, PipelineStage
 from keyword_manager import KeywordManager
+from link_crawler import harvest_targets
+from metrics import MESSAGES_ALERTED, MESSAGES_FLAGGED, MESSAGES_SEEN
+from rpc_scheduler import RpcScheduler, priority_for_source
+from scan_tasks import normalize_identifier
+from seen_set import SeenSet
+from shard_map import ShardMap
 
 
 class TelegramMonitor:
@@ -18,14 +27,35 @@ class TelegramMonitor:
         keyword_manager: KeywordManager,
         dialogs_limit: int = 200,
         history_limit: int = 200,
+        backfill_limit: Optional[int] = None,
+        name: str = "monitor",
+        pipeline_stages: Optional[dict] = None,
+        rpc: Optional[RpcScheduler] = None,
+        seen: Optional[SeenSet] = None,
+        shards: Optional[ShardMap] = None,
+        marks: Optional[ChatMarks] = None,
     ):
         self.client = client
+        self.name = name
+        # Все запросы к Telegram от этого аккаунта идут через общий планировщик
+        self.rpc = rpc or RpcScheduler(client, name=name)
+        # Общий для всех аккаунтов набор уже обработанных (chat_id, message_id):
+        # если несколько аккаунтов сидят в одном чате, сообщение анализируется один раз
+        self.seen = seen if seen is not None else SeenSet()
+        # Историю/discovery по общему чату делает один аккаунт-владелец
+        self.shards = shards if shards is not None else ShardMap()
+        # chat_id -> entity диалогов аккаунта (для AdaptivePoller)
+        self.dialogs: dict[int, object] = {}
         self.db = db_manager
         self.keywords = keyword_manager
+        # Отметки чатов с учётом сообщений в работе (общие на процесс, как и seen)
+        self.marks = marks if marks is not None else ChatMarks(db_manager)
 
         # Лимиты на начальное сканирование
         self.dialogs_limit = dialogs_limit
         self.history_limit = history_limit
+        # Лимит на дочитывание пропущенного после простоя (None — всё)
+        self.backfill_limit = backfill_limit
 
         # Куда шлём алерты
         self.alert_chat: str | None = ALERT_CHAT
@@ -43,6 +73,9 @@ class TelegramMonitor:
             "astana_info",
         ]
 
+        # Очереди ingest -> analysis -> persist -> alert для живых сообщений
+        self.pipeline = self._build_pipeline(pipeline_stages)
+
         logging.info("✅ Telegram Monitor initialized")
 
     # ====================================================
@@ -57,6 +90,29 @@ class TelegramMonitor:
             return False
         return username.lstrip("@").lower() == self._alert_username_norm
 
+    async def _get_sender_info(self, msg, priority: str):
+        """
+        (username, имя) автора сообщения; (None, None), если не удалось.
+        Звать только для уже подозрительных сообщений: автор обычно уже есть
+        в msg.sender (сущности из апдейта / ответа), и только если его нет –
+        запрос к Telegram через лимит «entity» планировщика.
+        """
+        sender = getattr(msg, "sender", None)
+        if sender is None:
+            try:
+                sender = await self.rpc.call(msg.get_sender, priority=priority)
+            except Exception:
+                return None, None
+
+        if not sender:
+            return None, None
+
+        sender_username = getattr(sender, "username", None)
+        first = getattr(sender, "first_name", "") or ""
+        last = getattr(sender, "last_name", "") or ""
+        sender_name = (first + " " + last).strip() or sender_username
+        return sender_username, sender_name
+
     # ====================================================
     #  ЗАПУСК МОНИТОРИНГА
     # ====================================================
@@ -64,15 +120,24 @@ class TelegramMonitor:
     async def start_monitoring(self):
         """
         1) Один раз прошиваем историю диалогов (history scan)
-        2) Подписываемся на новые сообщения
+        2) Запускаем воркеры пайплайна и подписываемся на новые сообщения
         """
         logging.info("🚀 Starting Telegram monitoring...")
 
+        self.marks.start()
         await self.initial_scan()
 
+        self.pipeline.start()
+
         @self.client.on(events.NewMessage(incoming=True))
         async def message_handler(event):
-            await self.analyze_message(event)
+            # Дубликаты от других аккаунтов отсекаем до очереди
+            if not self.seen.check_and_add(event.chat_id, event.message.id):
+                return
+            # отметка чата не поднимется выше, пока сообщение не пройдёт пайплайн
+            self.marks.begin(event.chat_id, event.message.id)
+            # Только ставим в очередь: вся тяжёлая работа – в воркерах стадий
+            await self.pipeline.submit(event)
 
         logging.info("✅ Telegram monitoring started")
 
@@ -82,105 +147,273 @@ class TelegramMonitor:
 
     async def initial_scan(self):
         """
-        Пройтись по диалогам и проанализировать последние N сообщений
-        в каждом канале/чате, где сидит аккаунт.
+        Пройтись по диалогам и проанализировать сообщения в каждом
+        канале/чате, где сидит аккаунт.
+
+        Для чатов с сохранённым high-water mark читаем только то, что
+        появилось после него (min_id) — это и дешёвый рестарт, и дочитка
+        пропущенного за время простоя. Новые чаты сканируем на history_limit.
+
+        Сначала собираем диалоги и отмечаемся в ShardMap, потом сканируем
+        только те чаты, владельцем которых стал этот аккаунт.
         """
         logging.info("📂 Initial history scan started...")
 
-        async for dialog in self.client.iter_dialogs(limit=self.dialogs_limit):
-            entity = dialog.entity
+        dialogs = []
+        try:
+            async for dialog in self.rpc.iterate(
+                self.client.iter_dialogs, limit=self.dialogs_limit
+            ):
+                # Личку с пользователями пропускаем – интересуют чаты/каналы
+                if dialog.is_user and isinstance(dialog.entity, User):
+                    continue
 
-            # Личку с пользователями пропускаем – интересуют чаты/каналы
-            if dialog.is_user and isinstance(entity, User):
-                continue
+                # Не сканируем свой же алерт-чат
+                if self._is_alert_entity(dialog.entity):
+                    continue
+
+                dialogs.append(dialog)
+                self.dialogs[dialog.id] = dialog.entity
+        except Exception:
+            # остальные аккаунты ждут нас в wait_ready – не заставляем их ждать таймаут
+            self.shards.leave(self.name)
+            raise
+
+        self.shards.join(self.name, [dialog.id for dialog in dialogs])
+        await self.shards.wait_ready()
 
-            # Не сканируем свой же алерт-чат
-            if self._is_alert_entity(entity):
+        skipped = 0
+        for dialog in dialogs:
+            entity = dialog.entity
+            chat_id = dialog.id
+
+            # Чат ведёт другой аккаунт – здесь только живой резерв
+            if not self.shards.owns(self.name, chat_id):
+                skipped += 1
                 continue
 
             title = getattr(entity, "title", getattr(entity, "username", "Unknown"))
-            logging.info(f"   🔍 Scanning history for: {title!r}")
+            last_id = self.marks.get(chat_id)
+
+            if last_id is None:
+                iter_kwargs = {"limit": self.history_limit}
+                logging.info(f"   🔍 Scanning history for: {title!r}")
+            else:
+                # Верхнее сообщение диалога уже есть в iter_dialogs —
+                # если оно не новее отметки, лишний запрос не делаем
+                top_id = dialog.message.id if dialog.message else 0
+                if top_id <= last_id:
+                    # догонять нечего – дальше отметку двигают живые сообщения
+                    self.marks.advance(chat_id, last_id, last_id)
+                    continue
+                # reverse=True: идём от старых к новым, чтобы отметка
+                # росла монотонно и обрыв посередине не терял хвост
+                iter_kwargs = {
+                    "min_id": last_id,
+                    "limit": self.backfill_limit,
+                    "reverse": True,
+                }
+                logging.info(
+                    f"   🔍 Backfilling {title!r}: messages {last_id + 1}..{top_id}"
+                )
+
+            max_seen = last_id or 0
+            # помечено в seen, но ещё не обработано
+            pending = None
 
             try:
-                async for message in self.client.iter_messages(
-                    entity, limit=self.history_limit
+                async for message in self.rpc.iterate(
+                    self.client.iter_messages, entity, **iter_kwargs
                 ):
-                    if not message or not message.message:
+                    if not message:
                         continue
 
-                    # Информация об авторе
-                    sender_username = None
-                    sender_name = None
-                    try:
-                        sender = await message.get_sender()
-                        if sender:
-                            sender_username = getattr(sender, "username", None)
-                            first = getattr(sender, "first_name", "") or ""
-                            last = getattr(sender, "last_name", "") or ""
-                            sender_name = (first + " " + last).strip() or sender_username
-                    except Exception:
-                        pass
-
-                    await self._process_text_for_entity(
-                        entity=entity,
-                        text=message.message,
-                        source="history",
-                        message_id=message.id,
-                        sender_username=sender_username,
-                        sender_name=sender_name,
-                    )
+                    # Уже обработано другим аккаунтом / живым обработчиком
+                    if not message.message or not self.seen.check_and_add(
+                        chat_id, message.id
+                    ):
+                        max_seen = max(max_seen, message.id)
+                        continue
+                    pending = message.id
+
+                    analysis = self.analyze_text(message.message, "history")
+                    if analysis.get("is_suspicious"):
+                        # автор – только для находок, чтобы не тратить лимит RPC
+                        sender_username, sender_name = await self._get_sender_info(
+                            message, "discovery"
+                        )
+                        await self._process_text_for_entity(
+                            entity=entity,
+                            text=message.message,
+                            source="history",
+                            analysis=analysis,
+                            message_id=message.id,
+                            message=message,
+                            sender_username=sender_username,
+                            sender_name=sender_name,
+                        )
+                    # отметка – только после обработки: упавшее сообщение дочитаем
+                    max_seen = max(max_seen, message.id)
+                    pending = None
             except Exception as e:
                 logging.error(f"Dialog scan error: {e}")
+                if pending is not None:
+                    self.seen.discard(chat_id, pending)
 
-        logging.info("✅ Initial history scan finished")
+            # Отметку сдвигаем и при частичном проходе: при дочитке всё
+            # до max_seen уже обработано, а первый скан — это и так срез
+            # последних history_limit сообщений
+            self.marks.advance(chat_id, max_seen, last_id or 0)
+
+        logging.info(
+            f"✅ Initial history scan finished ({skipped} chats owned by other accounts)"
+        )
 
     # ====================================================
-    #  ЖИВЫЕ СООБЩЕНИЯ
+    #  ЖИВЫЕ СООБЩЕНИЯ (стадии пайплайна)
     # ====================================================
 
+    def _build_pipeline(self, stages_cfg: Optional[dict]) -> IngestPipeline:
+        cfg = stages_cfg or PIPELINE_STAGES
+        handlers = [
+            ("ingest", self._ingest_event),
+            ("analysis", self._analyze_stage),
+            ("persist", self._persist_stage),
+            ("alert", self._alert_stage),
+        ]
+        return IngestPipeline(
+            self.name,
+            [
+                PipelineStage(name, handler, on_drop=self._on_pipeline_drop, **cfg.get(name, {}))
+                for name, handler in handlers
+            ],
+        )
+
+    @staticmethod
+    def _pipeline_key(item) -> tuple:
+        """(chat_id, message_id) элемента пайплайна: событие (ingest) или ctx."""
+        if isinstance(item, dict):
+            return item.get("chat_id"), item.get("message_id")
+        message = getattr(item, "message", None)
+        return getattr(item, "chat_id", None), getattr(message, "id", None)
+
+    def _on_pipeline_drop(self, item):
+        # Сообщение не обработано: отметка чата не пройдёт выше него,
+        # а отметка «видели» снимается – его подберёт другой аккаунт,
+        # опрос чата или дочитка после рестарта
+        chat_id, message_id = self._pipeline_key(item)
+        self.marks.lost(chat_id, message_id)
+        self.seen.discard(chat_id, message_id)
+
     async def analyze_message(self, event):
-        """Анализ входящих сообщений (в реальном времени)."""
-        try:
-            if not event or not event.message or not event.message.text:
+        """
+        Анализ входящего сообщения целиком, без очередей:
+        те же стадии, что и в пайплайне, но подряд.
+        """
+        if event and event.message:
+            if not self.seen.check_and_add(event.chat_id, event.message.id):
                 return
+            self.marks.begin(event.chat_id, event.message.id)
 
-            chat = event.chat or event.input_chat
-            if chat is not None and self._is_alert_entity(chat):
-                # Не анализируем свой алерт-чат, чтобы не было рекурсии
-                return
+        try:
+            ctx = await self._ingest_event(event)
+            if ctx is not None:
+                ctx = await self._analyze_stage(ctx)
+            if ctx is not None:
+                ctx = await self._persist_stage(ctx)
+            if ctx is not None:
+                await self._alert_stage(ctx)
+        except Exception as e:
+            logging.error(f"Error analyzing message: {e}")
+            self._on_pipeline_drop(event)
 
-            msg = event.message
-            text = msg.text
+    async def _ingest_event(self, event) -> Optional[dict]:
+        """Стадия ingest: фильтры. Автора ищем позже – только для подозрительных."""
+        if not event or not event.message:
+            return None
 
-            # Информация об авторе
-            sender_username = None
-            sender_name = None
-            try:
-                sender = await msg.get_sender()
-                if sender:
-                    sender_username = getattr(sender, "username", None)
-                    first = getattr(sender, "first_name", "") or ""
-                    last = getattr(sender, "last_name", "") or ""
-                    sender_name = (first + " " + last).strip() or sender_username
-            except Exception:
-                pass
+        chat = event.chat or event.input_chat
+        # Не анализируем пустые сообщения и свой алерт-чат (чтобы не было рекурсии)
+        if not event.message.text or (chat is not None and self._is_alert_entity(chat)):
+            self.marks.finish(event.chat_id, event.message.id)
+            return None
 
-            await self._process_text_for_entity(
-                entity=chat,
-                text=text,
-                source="live",
-                message_id=msg.id,
-                sender_username=sender_username,
-                sender_name=sender_name,
-            )
+        msg = event.message
+        return {
+            "entity": chat,
+            "chat_id": event.chat_id,
+            "text": msg.text,
+            "source": "live",
+            "message_id": msg.id,
+            "message": msg,
+            "sender_username": None,
+            "sender_name": None,
+        }
 
-        except Exception as e:
-            logging.error(f"Error analyzing message: {e}")
+    async def _analyze_stage(self, ctx: dict) -> Optional[dict]:
+        """Стадия analysis: KeywordManager. Дальше идут только подозрительные."""
+        analysis = self.analyze_text(ctx["text"], ctx["source"])
+        if not analysis or not analysis.get("is_suspicious"):
+            self._mark_processed(ctx)
+            return None
+
+        ctx["analysis"] = analysis
+        return ctx
+
+    async def _persist_stage(self, ctx: dict) -> dict:
+        """Стадия persist: автор, сообщение + профиль канала в БД."""
+        ctx["sender_username"], ctx["sender_name"] = await self._get_sender_info(
+            ctx["message"], "live"
+        )
+        self._log_suspicious(ctx["entity"], ctx["text"], ctx["source"])
+        await self._persist_suspicious(
+            ctx["entity"],
+            ctx["text"],
+            ctx["analysis"],
+            ctx["source"],
+            message=ctx.get("message"),
+        )
+        return ctx
+
+    async def _alert_stage(self, ctx: dict):
+        """
+        Стадия alert: алерт в outbox. Если запись не удалась, исключение
+        уходит в стадию пайплайна – on_drop помечает сообщение потерянным,
+        и отметка чата его не пройдёт.
+        """
+        await self._send_alert(
+            entity=ctx["entity"],
+            text=ctx["text"],
+            analysis=ctx["analysis"],
+            source=ctx["source"],
+            message_id=ctx["message_id"],
+            sender_username=ctx["sender_username"],
+            sender_name=ctx["sender_name"],
+            message_key=self._message_key(ctx.get("message")),
+        )
+        self._mark_processed(ctx)
+
+    def _mark_processed(self, ctx: dict):
+        # Живое сообщение обработано целиком (сохранено и алерт в outbox) –
+        # отметка чата может пройти его, после рестарта повторно не читаем
+        self.marks.finish(ctx.get("chat_id"), ctx.get("message_id"))
 
     # ====================================================
     #  ОБЩАЯ ЛОГИКА АНАЛИЗА ТЕКСТА
     # ====================================================
 
+    @staticmethod
+    def _metric_source(source: str) -> str:
+        """source -> метка метрик: history / live / manual / bots / discovery."""
+        if source == "history":
+            return "history"
+        return priority_for_source(source)
+
+    def analyze_text(self, text: str, source: str) -> dict:
+        """KeywordManager.analyze_text + счётчик просмотренных сообщений."""
+        MESSAGES_SEEN.inc(self.name, self._metric_source(source))
+        return self.keywords.analyze_text(text)
+
     async def _process_text_for_entity(
         self,
         entity,
@@ -190,21 +423,61 @@ class TelegramMonitor:
         message_id: Optional[int] = None,
         sender_username: Optional[str] = None,
         sender_name: Optional[str] = None,
+        message=None,
+        crawl_depth: Optional[int] = 0,
     ):
         """
         Общий обработчик текста:
         - прогон через KeywordManager
-        - если подозрительно — сохраняем сообщение и канал, шлём алерт
+        - если подозрительно — сохраняем сообщение и канал, шлём алерт,
+          ссылки/пересылки/упоминания – во фронтир краулера на уровень crawl_depth
+          (None – не добавлять)
+        Возвращает True, если сообщение подозрительное.
         """
         if not text:
-            return
+            return False
 
         if analysis is None:
-            analysis = self.keywords.analyze_text(text)
+            analysis = self.analyze_text(text, source)
 
         if not analysis or not analysis.get("is_suspicious"):
-            return
+            return False
+
+        self._log_suspicious(entity, text, source)
+
+        # 1-2) Сообщение и канал
+        await self._persist_suspicious(
+            entity, text, analysis, source, message=message, crawl_depth=crawl_depth
+        )
+
+        # 3) Шлём алерт в Telegram. Ошибку outbox не глушим: вызывающий
+        # не сдвинет отметку и сообщение перечитается
+        await self._send_alert(
+            entity=entity,
+            text=text,
+            analysis=analysis,
+            source=source,
+            message_id=message_id,
+            sender_username=sender_username,
+            sender_name=sender_name,
+            message_key=self._message_key(message),
+        )
+
+        return True
+
+    @staticmethod
+    def _message_key(message) -> Optional[str]:
+        """
+        "chat_id:message_id" – по нему БД пишет сообщение и алерт один раз,
+        даже если его прочитали аккаунты разных процессов.
+        """
+        chat_id = getattr(message, "chat_id", None)
+        message_id = getattr(message, "id", None)
+        if chat_id is None or message_id is None:
+            return None
+        return f"{chat_id}:{message_id}"
 
+    def _log_suspicious(self, entity, text: str, source: str):
         title = getattr(entity, "title", "Unknown")
         username = getattr(entity, "username", None)
 
@@ -213,6 +486,18 @@ class TelegramMonitor:
             f"from {source}: {text[:120].replace(chr(10), ' ')}..."
         )
 
+    async def _persist_suspicious(
+        self,
+        entity,
+        text: str,
+        analysis: dict,
+        source: str,
+        message=None,
+        crawl_depth: Optional[int] = 0,
+    ):
+        username = getattr(entity, "username", None)
+        MESSAGES_FLAGGED.inc(self.name, self._metric_source(source))
+
         # 1) Сохраняем сообщение
         try:
             self.db.save_message(
@@ -222,6 +507,11 @@ class TelegramMonitor:
                     "contains_drugs": analysis.get("has_drugs", False),
                     "contains_geo": analysis.get("has_geo", False),
                     "timestamp": datetime.utcnow(),
+                    "chat_id": getattr(message, "chat_id", None),
+                    "message_id": getattr(message, "id", None),
+                    # не хранятся в channel_messages – только для агрегатов активности
+                    "triggers": analysis.get("triggers", []),
+                    "found_via": source,
                 }
             )
         except Exception as e:
@@ -233,41 +523,48 @@ class TelegramMonitor:
         except Exception as e:
             logging.error(f"Error analyzing/saving channel: {e}")
 
-        # 3) Шлём алерт в Telegram
-        try:
-            await self._send_alert(
-                entity=entity,
-                text=text,
-                analysis=analysis,
-                source=source,
-                message_id=message_id,
-                sender_username=sender_username,
-                sender_name=sender_name,
-            )
-        except Exception as e:
-            logging.error(f"Error sending alert: {e}")
+        # 3) Ссылки, пересылки и упоминания – во фронтир краулера
+        if crawl_depth is not None:
+            try:
+                self._add_crawl_targets(entity, text, message, crawl_depth)
+            except Exception as e:
+                logging.error(f"Error adding crawl targets: {e}")
+
+    def _add_crawl_targets(self, entity, text: str, message, depth: int):
+        found_from = getattr(entity, "username", None) or str(getattr(entity, "id", ""))
+        own = {(found_from or "").lower(), self._alert_username_norm}
+        rows = [
+            row
+            for row in harvest_targets(self.keywords, text, message, depth, found_from)
+            if row[0] not in own
+        ]
+        self.db.add_crawl_targets(rows)
 
     # ====================================================
     #  РУЧНОЙ СКАН ОТДЕЛЬНОГО ЧАТА / КАНАЛА
     # ====================================================
 
-    async def manual_scan_chat(self, identifier: str, limit: int = 1500) -> dict:
+    async def manual_scan_chat(
+        self,
+        identifier: str,
+        limit: int = 1500,
+        progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+    ) -> dict:
         """
         Ручной запуск сканирования конкретного чата/канала.
         identifier: @username, ссылка t.me/... или просто username.
+        await progress(scanned, suspicious) – каждые 50 сообщений.
         """
         ident_raw = (identifier or "").strip()
         if not ident_raw:
             raise ValueError("Пустое имя канала/чата")
 
-        ident = ident_raw
-        if ident.startswith("http://") or ident.startswith("https://"):
-            ident = ident.split("/")[-1]
-        if ident.startswith("@"):
-            ident = ident[1:]
+        ident = normalize_identifier(ident_raw)
 
         try:
-            channel = await self.client.get_entity(ident)
+            channel = await self.rpc.call(
+                self.client.get_entity, ident, priority="manual"
+            )
         except Exception as e:
             logging.error(f"Manual scan: cannot resolve {ident_raw!r}: {e}")
             return {
@@ -297,51 +594,137 @@ class TelegramMonitor:
 
         scanned = 0
         suspicious = 0
+        chat_id = get_peer_id(channel)
 
-        async for msg in self.client.iter_messages(channel, limit=limit):
+        async for msg in self.rpc.iterate(
+            self.client.iter_messages, channel, limit=limit, priority="manual"
+        ):
             if not msg or not msg.message:
                 continue
 
             scanned += 1
+            if progress and scanned % 50 == 0:
+                await progress(scanned, suspicious)
 
-            # инфа об авторе
-            sender_username = None
-            sender_name = None
-            try:
-                sender = await msg.get_sender()
-                if sender:
-                    sender_username = getattr(sender, "username", None)
-                    first = getattr(sender, "first_name", "") or ""
-                    last = getattr(sender, "last_name", "") or ""
-                    sender_name = (first + " " + last).strip() or sender_username
-            except Exception:
-                pass
-
-            analysis = self.keywords.analyze_text(msg.message)
-            if analysis.get("is_suspicious"):
+            if await self._scan_manual_message(channel, chat_id, msg):
                 suspicious += 1
 
+        logging.info(
+            f"✅ Manual scan finished for [{title!r}]: "
+            f"scanned={scanned}, suspicious={suspicious}"
+        )
+
+        return {
+            "ok": True,
+            "identifier": ident_raw,
+            "title": title,
+            "scanned": scanned,
+            "suspicious": suspicious,
+        }
+
+    async def _scan_manual_message(self, channel, chat_id: int, msg) -> bool:
+        """Одно сообщение ручного скана. True – подозрительное."""
+        is_new = self.seen.check_and_add(chat_id, msg.id)
+
+        # анализируем и уже виденные: в итогах скана должны быть все находки
+        analysis = self.analyze_text(msg.message, "manual_scan")
+        if not analysis.get("is_suspicious"):
+            return False
+        # Уже прошло через live/history/другой скан – второй раз не сохраняем
+        if not is_new:
+            return True
+
+        try:
+            # инфа об авторе – только для находок
+            sender_username, sender_name = await self._get_sender_info(msg, "manual")
+
             await self._process_text_for_entity(
                 entity=channel,
                 text=msg.message,
                 source="manual_scan",
                 analysis=analysis,
                 message_id=msg.id,
+                message=msg,
                 sender_username=sender_username,
                 sender_name=sender_name,
             )
+        except Exception:
+            self.seen.discard(chat_id, msg.id)
+            raise
+        return True
 
-        logging.info(
-            f"✅ Manual scan finished for [{title!r}]: "
-            f"scanned={scanned}, suspicious={suspicious}"
+    # ====================================================
+    #  ГЛУБОКИЙ СКАН ПО ДИАПАЗОНАМ MESSAGE_ID
+    # ====================================================
+
+    async def resolve_scan_target(self, identifier: str):
+        """Entity для ручного/глубокого скана (алерт-канал сканировать нельзя)."""
+        channel = await self.rpc.call(
+            self.client.get_entity, normalize_identifier(identifier), priority="manual"
         )
+        if self._is_alert_entity(channel):
+            raise ValueError("Нельзя сканировать алерт-канал")
+        return channel
+
+    async def get_top_message_id(self, channel) -> int:
+        messages = await self.rpc.call(
+            self.client.get_messages, channel, limit=1, priority="manual"
+        )
+        return messages[0].id if messages else 0
+
+    async def scan_message_range(
+        self,
+        channel,
+        lo: int,
+        cursor: int,
+        scanned: int = 0,
+        suspicious: int = 0,
+        checkpoint: Optional[Callable[[int, int, int], Awaitable[bool]]] = None,
+        checkpoint_every: int = 100,
+    ) -> dict:
+        """
+        Сканирует сообщения с lo <= id < cursor, от новых к старым.
+        await checkpoint(cursor, scanned, suspicious) сохраняет прогресс и
+        возвращает False, если скан отменили.
+        """
+        chat_id = get_peer_id(channel)
+        processed = 0
+
+        async for msg in self.rpc.iterate(
+            self.client.iter_messages,
+            channel,
+            min_id=lo - 1,
+            max_id=cursor,
+            priority="manual",
+        ):
+            if not msg:
+                continue
+
+            cursor = msg.id
+            processed += 1
+
+            if msg.message:
+                scanned += 1
+                if await self._scan_manual_message(channel, chat_id, msg):
+                    suspicious += 1
+
+            if checkpoint and processed % checkpoint_every == 0:
+                if not await checkpoint(cursor, scanned, suspicious):
+                    return {
+                        "scanned": scanned,
+                        "suspicious": suspicious,
+                        "cursor": cursor,
+                        "stopped": True,
+                    }
+
+        if checkpoint:
+            await checkpoint(lo, scanned, suspicious)
 
         return {
-            "ok": True,
-            "identifier": ident_raw,
-            "title": title,
             "scanned": scanned,
             "suspicious": suspicious,
+            "cursor": lo,
+            "stopped": False,
         }
 
     # ====================================================
@@ -357,8 +740,9 @@ class TelegramMonitor:
         message_id: Optional[int] = None,
         sender_username: Optional[str] = None,
         sender_name: Optional[str] = None,
+        message_key: Optional[str] = None,
     ):
-        """Отправка алерта в Telegram-чат/канал."""
+        """Постановка алерта в outbox для отправки в Telegram-чат/канал."""
         if not self.alert_chat:
             return
 
@@ -366,55 +750,63 @@ class TelegramMonitor:
             # Не шлём алерты в сам алерт-канал как источник
             return
 
-        try:
-            title = getattr(entity, "title", getattr(entity, "username", "Unknown"))
-            username = getattr(entity, "username", None)
-
-            # красивые триггеры
-            triggers = []
-            if analysis.get("has_drugs"):
-                triggers.append("drugs")
-            if analysis.get("has_geo"):
-                triggers.append("kz_geo")
-            trig_str = ", ".join(triggers) if triggers else "—"
-
-            risk = analysis.get("risk_score", 0.0) * 100
-            risk_str = f"{risk:.0f}%"
-
-            link_part = f"@{username}" if username else "(без username)"
-
-            # Автор
-            if sender_username:
-                author_str = f"@{sender_username}"
-            elif sender_name:
-                author_str = sender_name
-            else:
-                author_str = "неизвестен"
-
-            # Ссылка на сообщение (если есть публичный username)
-            message_link = None
-            if username and message_id:
-                message_link = f"https://t.me/{username}/{message_id}"
-
-            msg = (
-                "🚨 *Подозрительное сообщение обнаружено*\n\n"
-                f"*Канал/чат:* {title} {link_part}\n"
-                f"*Источник:* `{source}`\n"
-                f"*Автор:* {author_str}\n"
-                f"*Ссылка:* {message_link or 'недоступна'}\n"
-                f"*Риск:* {risk_str}\n"
-                f"*Триггеры:* `{trig_str}`\n\n"
-                f"```{text[:350]}```"
-            )
+        title = getattr(entity, "title", getattr(entity, "username", "Unknown"))
+        username = getattr(entity, "username", None)
 
-            await self.client.send_message(
-                self.alert_chat,
-                msg,
-                parse_mode="markdown",
-            )
+        # красивые триггеры
+        triggers = []
+        if analysis.get("has_drugs"):
+            triggers.append("drugs")
+        if analysis.get("has_geo"):
+            triggers.append("kz_geo")
+        trig_str = ", ".join(triggers) if triggers else "—"
+
+        risk = analysis.get("risk_score", 0.0) * 100
+        risk_str = f"{risk:.0f}%"
+
+        link_part = f"@{username}" if username else "(без username)"
+
+        # Автор
+        if sender_username:
+            author_str = f"@{sender_username}"
+        elif sender_name:
+            author_str = sender_name
+        else:
+            author_str = "неизвестен"
+
+        # Ссылка на сообщение (если есть публичный username)
+        message_link = None
+        if username and message_id:
+            message_link = f"https://t.me/{username}/{message_id}"
+
+        msg = (
+            "🚨 *Подозрительное сообщение обнаружено*\n\n"
+            f"*Канал/чат:* {title} {link_part}\n"
+            f"*Источник:* `{source}`\n"
+            f"*Автор:* {author_str}\n"
+            f"*Ссылка:* {message_link or 'недоступна'}\n"
+            f"*Риск:* {risk_str}\n"
+            f"*Триггеры:* `{trig_str}`\n\n"
+            f"```{text[:350]}```"
+        )
 
-        except Exception as e:
-            logging.error(f"Error sending alert: {e}")
+        # Короткая строка для дайджеста, если по каналу накопится несколько алертов
+        snippet = text[:150].replace("`", "'").replace("\n", " ")
+        preview = (
+            f"{message_link or 'без ссылки'} · `{source}` · {risk_str}: `{snippet}`"
+        )
+
+        # Не отправляем напрямую: AlertSender разберёт outbox с учётом
+        # лимитов, FloodWait и склейки алертов по каналу
+        channel_key = username or f"id_{getattr(entity, 'id', '')}"
+        self.db.enqueue_alert(
+            channel_key=channel_key,
+            channel_title=title,
+            body=msg,
+            preview=preview,
+            message_key=message_key,
+        )
+        MESSAGES_ALERTED.inc(self.name, self._metric_source(source))
 
     # ====================================================
     #  АНАЛИЗ КАНАЛА / ЧАТА
@@ -428,7 +820,10 @@ class TelegramMonitor:
         всегда отображали то, что реально сканировалось.
         """
         try:
-            channel = await self.client.get_entity(channel_entity)
+            priority = priority_for_source(found_via)
+            channel = await self.rpc.call(
+                self.client.get_entity, channel_entity, priority=priority
+            )
 
             channel_type = (
                 "channel"
@@ -446,11 +841,11 @@ class TelegramMonitor:
             }
 
             # анализ географии
-            kz_ratio = await self.analyze_geography(channel)
+            kz_ratio = await self.analyze_geography(channel, priority=priority)
             channel_info["kz_phone_ratio"] = kz_ratio
 
             # анализ контента
-            risk_score = await self.analyze_content(channel)
+            risk_score = await self.analyze_content(channel, priority=priority)
             channel_info["risk_score"] = risk_score
 
             # 🔥 Сохраняем ВСЕГДА, даже если risk_score очень маленький
@@ -464,10 +859,12 @@ class TelegramMonitor:
         except Exception as e:
             logging.error(f"Error analyzing channel: {e}")
 
-    async def analyze_geography(self, channel):
+    async def analyze_geography(self, channel, priority: str = "discovery"):
         """Анализ географии подписчиков (без падения при ошибках прав)."""
         try:
-            participants = await self.client.get_participants(channel, limit=10)
+            participants = await self.rpc.call(
+                self.client.get_participants, channel, limit=10, priority=priority
+            )
             kz_count = 0
             total = 0
 
@@ -485,10 +882,12 @@ class TelegramMonitor:
         except Exception:
             return 0.0
 
-    async def analyze_content(self, channel):
+    async def analyze_content(self, channel, priority: str = "discovery"):
         """Анализ контента канала по последним сообщениям."""
         try:
-            messages = await self.client.get_messages(channel, limit=15)
+            messages = await self.rpc.call(
+                self.client.get_messages, channel, limit=15, priority=priority
+            )
             suspicious_count = 0
             total_messages = 0
 
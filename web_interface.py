@@ -1,18 +1,57 @@
-from fastapi import FastAPI, Request
+import asyncio
+import hmac
+import json
+from datetime import datetime, timedelta
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi import Body
 
+from config import (
+    ADMIN_TOKEN,
+    DATABASE_NAME,
+    WEB_CACHE_ENTRIES,
+    WEB_DB_READERS,
+    WEB_DB_SLOW_READERS,
+    WEB_QUERY_TIMEOUT,
+    WEB_SLOW_QUERY_TIMEOUT,
+)
 from database_manager import DatabaseManager
-from scan_tasks import scan_queue
+from diagnostics import memory_snapshots, sample_stacks, task_counts
+from export_stream import EXPORT_FORMATS, parse_export_time, stream_export
+from ingest_pipeline import all_pipeline_stats
+from live_events import LiveEvents
+from metrics import render as render_metrics
+from read_pool import ReadPool
+from response_cache import ResponseCache
+from rpc_scheduler import all_scheduler_stats
+from scan_tasks import normalize_identifier, scan_wakeup
 
 app = FastAPI(title="KZ Monitor", version="2.0")
 
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-db = DatabaseManager()
+# Записи (задачи сканирования) – через обычный DatabaseManager в потоке,
+# чтения – через read-only пул: обработчики не блокируют event loop
+db = DatabaseManager(DATABASE_NAME)
+reads = ReadPool(
+    db.db_name,
+    workers=WEB_DB_READERS,
+    slow_workers=WEB_DB_SLOW_READERS,
+    timeout=WEB_QUERY_TIMEOUT,
+    slow_timeout=WEB_SLOW_QUERY_TIMEOUT,
+)
+live_events = LiveEvents(db)
+# ответы stats/channels/messages – из кеша, пока монитор ничего не записал
+response_cache = ResponseCache(reads, max_entries=WEB_CACHE_ENTRIES)
+
+
+@app.exception_handler(asyncio.TimeoutError)
+async def query_timeout_handler(request: Request, exc: asyncio.TimeoutError):
+    return JSONResponse(status_code=504, content={"detail": "Запрос к БД не уложился в таймаут"})
 
 
 # =========== Одна страница ===========
@@ -23,29 +62,323 @@ async def main_page(request: Request):
 
 # =========== API ===========
 @app.get("/api/stats")
-async def api_stats():
-    return db.get_channel_stats()
+async def api_stats(request: Request):
+    return await response_cache.respond(
+        request, "stats", lambda: reads.call(reads.db.get_channel_stats)
+    )
 
 
 @app.get("/api/channels")
-async def api_channels(type: str | None = None, limit: int | None = None):
+async def api_channels(request: Request, type: str | None = None, limit: int | None = None):
     if limit:
-        return db.get_suspicious_channels(limit=limit)
-    return db.get_channels_by_type(type)
+        return await response_cache.respond(
+            request,
+            f"channels:top:{limit}",
+            lambda: reads.call(reads.db.get_suspicious_channels, limit=limit),
+        )
+    return await response_cache.respond(
+        request,
+        f"channels:type:{type or ''}",
+        lambda: reads.call(reads.db.get_channels_by_type, type),
+    )
 
 
 @app.get("/api/messages")
-async def api_messages(channel: str | None = None):
-    return db.get_suspicious_messages(channel_username=channel)
+async def api_messages(request: Request, channel: str | None = None):
+    return await response_cache.respond(
+        request,
+        f"messages:{channel or ''}",
+        lambda: reads.call(
+            reads.db.get_suspicious_messages, channel_username=channel, lane="slow"
+        ),
+    )
+
+
+@app.get("/api/timeseries")
+async def api_timeseries(
+    request: Request,
+    period: str = "day",
+    dimension: str = "total",
+    days: int | None = None,
+    key: list[str] | None = Query(None),
+    top: int = 10,
+):
+    """
+    Активность из готовых агрегатов: period hour/day, dimension total/channel/trigger/found_via.
+    days – глубина (по умолчанию 7 для hour, 180 для day); key – нужные ряды, иначе top.
+    """
+    if period not in DatabaseManager.ROLLUP_PERIODS:
+        raise HTTPException(status_code=400, detail="period: hour или day")
+    if dimension not in DatabaseManager.ROLLUP_DIMENSIONS:
+        raise HTTPException(status_code=400, detail="Неизвестный разрез")
+
+    days = days or (7 if period == "hour" else 180)
+    width, suffix = DatabaseManager.ROLLUP_PERIODS[period]
+    # граница в формате бакета; сообщения пишутся с временем UTC
+    since = str(datetime.utcnow() - timedelta(days=days))[:width] + suffix
+    keys = key or None
+
+    return await response_cache.respond(
+        request,
+        f"timeseries:{period}:{dimension}:{since}:{','.join(keys or [])}:{top}",
+        lambda: reads.call(
+            reads.db.get_timeseries, period, dimension, since=since, keys=keys, top=top
+        ),
+    )
+
+
+@app.get("/api/cache")
+async def api_cache():
+    # поколение данных и попадания кеша ответов
+    return response_cache.stats()
+
+
+@app.get("/api/db")
+async def api_db():
+    # полосы пула чтения: занятые потоки, очередь, таймауты
+    return reads.stats()
+
+
+@app.get("/api/export/{kind}")
+async def api_export(
+    kind: str,
+    format: str = "ndjson",
+    gzip: bool = False,
+    since: str | None = None,
+    until: str | None = None,
+    channel: list[str] | None = Query(None),
+):
+    """
+    Полная выгрузка channels/messages потоком: NDJSON или CSV, по желанию gzip.
+    since/until – ISO-даты (until не включительно), channel – можно несколько раз.
+    """
+    if kind not in DatabaseManager.EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail="Неизвестная выгрузка")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Формат: ndjson или csv")
+    try:
+        since_ts = parse_export_time(since)
+        until_ts = parse_export_time(until)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Даты – в формате ISO (2024-05-01T12:00)")
+
+    channels = [normalize_identifier(ch) for ch in channel or [] if ch]
+    media_type, ext = EXPORT_FORMATS[format]
+    filename = f"{kind}.{ext}"
+    if gzip:
+        media_type, filename = "application/gzip", filename + ".gz"
+
+    return StreamingResponse(
+        stream_export(reads, kind, format, gzip, since_ts, until_ts, channels or None),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/api/events")
+async def api_events(request: Request):
+    """
+    Server-Sent Events для дашборда: message / channel / stats / resync.
+    Страница грузит данные один раз, дальше только применяет события.
+    """
+    queue = live_events.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # keep-alive, чтобы прокси не рвали соединение
+                    yield ": ping\n\n"
+                    continue
+                data = json.dumps(event["data"], ensure_ascii=False, default=str)
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+        finally:
+            live_events.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/pipeline")
+async def api_pipeline():
+    # глубина очередей и латентность стадий по каждому аккаунту
+    # (при WEB_MODE=process монитор в другом процессе – здесь будет пусто)
+    return all_pipeline_stats()
+
+
+@app.get("/api/rpc")
+async def api_rpc():
+    # очереди, паузы FloodWait и метрики по классам приоритета
+    return all_scheduler_stats()
+
+
+@app.get("/api/jobs")
+async def api_jobs():
+    # периодические задачи: кто держит аренду, последний запуск и длительность
+    return await reads.call(reads.db.get_periodic_jobs)
+
+
+@app.get("/api/crawler")
+async def api_crawler():
+    # фронтир краулера ссылок: счётчики по статусам и самые весомые цели
+    return await reads.call(reads.db.get_crawl_stats, lane="slow")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus: метрики этого процесса + снимки из heartbeat'ов детей
+    супервизора (RUN_MODE=supervisor), одинаковые ряды складываются.
+    """
+    children = []
+    fresh_after = datetime.now() - timedelta(minutes=2)
+    for row in await reads.call(reads.db.get_process_health):
+        snap = row["payload"].get("metrics")
+        beat = row["last_heartbeat"]
+        # строки от прошлого запуска супервизора не считаем
+        if not snap or row["status"] != "running" or not beat:
+            continue
+        if datetime.fromisoformat(beat) > fresh_after:
+            children.append(snap)
+
+    return PlainTextResponse(
+        render_metrics(children), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/api/health")
+async def api_health():
+    # дочерние процессы в режиме RUN_MODE=supervisor: статус, рестарты, метрики
+    return await reads.call(reads.db.get_process_health)
+
+
+# =========== Диагностика работающего процесса ===========
+def require_admin(x_admin_token: str | None = Header(None)):
+    # без ADMIN_TOKEN отладочных эндпоинтов как будто нет
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(
+        (x_admin_token or "").encode(), ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Нужен X-Admin-Token")
+
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def admin_profile(seconds: float = 10, interval_ms: float = 5):
+    """
+    Сэмплирующий профайлер по всем потокам (loop монитора, uvicorn, writer...).
+    Ответ – collapsed stacks для flamegraph.pl / speedscope.
+    """
+    seconds = min(max(seconds, 0.1), 120)
+    try:
+        stacks = await asyncio.to_thread(sample_stacks, seconds, max(interval_ms, 1) / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(stacks)
+
+
+@app.post("/api/admin/tracemalloc/start", dependencies=[Depends(require_admin)])
+async def admin_tracemalloc_start(frames: int = 10):
+    return memory_snapshots.start(frames)
+
+
+@app.post("/api/admin/tracemalloc/stop", dependencies=[Depends(require_admin)])
+async def admin_tracemalloc_stop():
+    return memory_snapshots.stop()
+
+
+@app.post("/api/admin/tracemalloc/snapshot", dependencies=[Depends(require_admin)])
+async def admin_tracemalloc_snapshot():
+    try:
+        return await asyncio.to_thread(memory_snapshots.take)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/api/admin/tracemalloc/diff", dependencies=[Depends(require_admin)])
+async def admin_tracemalloc_diff(
+    base: int, current: int | None = None, top: int = 30, key: str = "lineno"
+):
+    """Рост памяти от снимка base до current (без current – до нового снимка)."""
+    if key not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="key: lineno, filename или traceback")
+    try:
+        if current is None:
+            current = (await asyncio.to_thread(memory_snapshots.take))["id"]
+        return await asyncio.to_thread(memory_snapshots.diff, base, current, top, key)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Снимок не найден")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/api/admin/tasks", dependencies=[Depends(require_admin)])
+async def admin_tasks():
+    # задачи asyncio по корутинам: loop монитора и loop этого веб-сервера
+    return task_counts({"web": asyncio.get_running_loop()})
 
 
 @app.post("/api/scan")
 async def api_scan(data: dict = Body(...)):
-    ch = data.get("channel", "").strip()
-    if ch.startswith("http"):
-        ch = ch.split("/")[-1]
-    if ch.startswith("@"):
-        ch = ch[1:]
-
-    scan_queue.put(ch)
-    return {"status": f"Сканирование @{ch} добавлено в очередь"}
+    ch = normalize_identifier(data.get("channel", ""))
+    if not ch:
+        raise HTTPException(status_code=400, detail="Пустое имя канала")
+
+    try:
+        priority = int(data.get("priority") or 0)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="priority должен быть целым числом")
+    # deep – вся история канала, параллельно всеми аккаунтами по диапазонам id
+    mode = "deep" if data.get("deep") else "recent"
+    job_id, created = await asyncio.to_thread(
+        db.create_scan_job, ch, priority=priority, mode=mode
+    )
+    scan_wakeup.notify()
+
+    if created:
+        kind = "Глубокое сканирование" if mode == "deep" else "Сканирование"
+        status = f"{kind} @{ch} добавлено в очередь (задача #{job_id})"
+    else:
+        status = f"@{ch} уже в очереди (задача #{job_id})"
+    return {"status": status, "job_id": job_id, "created": created}
+
+
+@app.get("/api/scan")
+async def api_scan_jobs(limit: int = 50):
+    return await reads.call(reads.db.get_scan_jobs, limit=limit)
+
+
+@app.get("/api/scan/{job_id}")
+async def api_scan_job(job_id: int):
+    job = await reads.call(reads.db.get_scan_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+
+@app.post("/api/scan/{job_id}/cancel")
+async def api_scan_cancel(job_id: int):
+    if not await asyncio.to_thread(db.cancel_scan_job, job_id):
+        raise HTTPException(status_code=409, detail="Задача уже завершена или не найдена")
+    return {"status": f"Задача #{job_id} отменена"}
+
+
+if __name__ == "__main__":
+    # Отдельный запуск дашборда (аналог WEB_MODE=process без монитора)
+    import os
+
+    import uvicorn
+
+    uvicorn.run(
+        "web_interface:app",
+        host=os.getenv("WEB_HOST", "0.0.0.0"),
+        port=int(os.getenv("WEB_PORT") or 8000),
+        workers=int(os.getenv("WEB_WORKERS") or 1),
+        access_log=False,
+    )